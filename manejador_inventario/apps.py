@@ -1,9 +1,41 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+# Índices de búsqueda de productos que solo existen en PostgreSQL (pg_trgm).
+# Las expresiones coinciden con las que genera el ORM: UPPER(...) para
+# icontains/istartswith y para la similitud sobre Upper('nombre').
+SEARCH_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS producto_nombre_trgm '
+    'ON manejador_inventario_producto USING gin (UPPER(nombre) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS producto_descripcion_trgm '
+    'ON manejador_inventario_producto USING gin (UPPER(descripcion) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS producto_codigo_prefijo '
+    'ON manejador_inventario_producto (UPPER(codigo) text_pattern_ops)',
+]
+
+
+def create_search_indexes(sender, using, **kwargs):
+    """
+    Crea la extensión pg_trgm y los índices de búsqueda de productos después
+    de migrar. En otros motores (SQLite en las pruebas) no hace nada: la
+    búsqueda usa los índices portables del modelo.
+    """
+    from django.db import connections
+
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for sql in SEARCH_INDEXES:
+            cursor.execute(sql)
+
 
 class ManejadorInventarioConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'manejador_inventario'
-    
+
     def ready(self):
         """Importar signals cuando la app esté lista"""
-        import manejador_inventario.models  # Esto registra los signals
\ No newline at end of file
+        import manejador_inventario.models  # Esto registra los signals
+        post_migrate.connect(create_search_indexes, sender=self)
@@ -1,5 +1,6 @@
 from django import forms
 from .models import Bodega, Estanteria, Ubicacion, Producto
+from .widgets import ProductoTypeaheadWidget
 
 class BodegaForm(forms.ModelForm):
     class Meta:
@@ -46,6 +47,9 @@ class UbicacionForm(forms.ModelForm):
             'capacidad': 'Capacidad',
             'stock': 'Stock',
         }
+        widgets = {
+            'producto': ProductoTypeaheadWidget(),
+        }
 
 class ProductoForm(forms.ModelForm):
     class Meta:
@@ -1,4 +1,5 @@
 from ..models import Bodega
+from . import cache_logic
 
 def get_bodegas():
     """
@@ -10,9 +11,12 @@ def get_bodegas():
 def get_bodega_by_codigo(codigo_bodega):
     """
     Obtiene una bodega específica por su código único.
+    Se lee de la caché de la jerarquía; solo consulta la base de datos si no está.
     """
-    bodega = Bodega.objects.get(codigo=codigo_bodega)
-    return bodega
+    return cache_logic.bodegas.get_or_load(
+        cache_logic.bodega_key(codigo_bodega),
+        lambda: Bodega.objects.get(codigo=codigo_bodega),
+    )
 
 def create_bodega(form):
     """
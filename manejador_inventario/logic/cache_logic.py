@@ -0,0 +1,68 @@
+"""
+Caché de la jerarquía de ubicación (bodegas y estanterías).
+
+Las bodegas y estanterías casi nunca cambian y se consultan al inicio de
+cada vista de inventario. Se guardan en una LRU con TTL por proceso y,
+si settings.HIERARCHY_CACHE['shared_alias'] está definido, también en la
+caché de Django indicada. Los signals de los modelos invalidan las
+entradas al guardar o eliminar.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from provesi.cache import ReadThroughCache
+
+
+def _config():
+    config = {
+        'maxsize': 1024,
+        'ttl': 300,
+        'shared_alias': None,
+    }
+    config.update(getattr(settings, 'HIERARCHY_CACHE', {}))
+    return config
+
+
+_config_actual = _config()
+
+bodegas = ReadThroughCache('bodega', **_config_actual)
+estanterias = ReadThroughCache('estanteria', **_config_actual)
+
+
+def bodega_key(codigo_bodega):
+    return str(codigo_bodega)
+
+
+def estanteria_key(codigo_bodega, zona, codigo):
+    return (str(codigo_bodega), str(zona), int(codigo))
+
+
+def _invalidar(cache, key):
+    """
+    Invalida de inmediato y de nuevo al confirmar la transacción, para que
+    una lectura concurrente no deje en caché la versión anterior.
+    """
+    cache.invalidate(key)
+    transaction.on_commit(lambda: cache.invalidate(key))
+
+
+def invalidate_bodega(codigo_bodega):
+    _invalidar(bodegas, bodega_key(codigo_bodega))
+
+
+def invalidate_estanteria(codigo_bodega, zona, codigo):
+    _invalidar(estanterias, estanteria_key(codigo_bodega, zona, codigo))
+
+
+def clear():
+    """Vacía la caché local del proceso."""
+    bodegas.clear()
+    estanterias.clear()
+
+
+def get_cache_stats():
+    """Hits, misses y tamaño de cada caché de la jerarquía."""
+    return {
+        'bodegas': bodegas.stats(),
+        'estanterias': estanterias.stats(),
+    }
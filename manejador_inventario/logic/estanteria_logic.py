@@ -1,11 +1,18 @@
 from ..models import Estanteria
+from . import cache_logic
 
 def get_estanteria_by_codigo(bodega_estanteria, zona_estanteria, codigo_estanteria):
     """
     Obtiene una estantería específica por su código dentro de una bodega.
+    Se lee de la caché de la jerarquía junto con su bodega.
     """
-    estanteria = Estanteria.objects.get(bodega=bodega_estanteria, zona=zona_estanteria, codigo=codigo_estanteria)
-    return estanteria
+    codigo_bodega = getattr(bodega_estanteria, 'pk', bodega_estanteria)
+    return cache_logic.estanterias.get_or_load(
+        cache_logic.estanteria_key(codigo_bodega, zona_estanteria, codigo_estanteria),
+        lambda: Estanteria.objects.select_related('bodega').get(
+            bodega=codigo_bodega, zona=zona_estanteria, codigo=codigo_estanteria
+        ),
+    )
 
 def create_estanteria(form, bodega):
     """
@@ -1,4 +1,24 @@
-from ..models import Producto
+from django.db import connection
+from django.db.models import Case, Count, Exists, IntegerField, OuterRef, Q, Value, When
+from django.db.models.functions import Upper
+
+from ..models import Producto, StockBodegaProducto
+
+PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+# Sugerencias que retorna el typeahead de productos
+TYPEAHEAD_LIMIT = 10
+MAX_TYPEAHEAD_LIMIT = 50
+
+# Rangos de precio (COP) para las facetas; el último no tiene tope
+RANGOS_PRECIO = [
+    (0, 10_000),
+    (10_000, 50_000),
+    (50_000, 200_000),
+    (200_000, 1_000_000),
+    (1_000_000, None),
+]
 
 def get_productos():
     """
@@ -21,4 +41,189 @@ def create_producto(form):
     producto = form.save()
     producto.save()
 
-    return producto
\ No newline at end of file
+    return producto
+
+
+# ============================================================================
+# BÚSQUEDA
+# ============================================================================
+
+def typeahead_productos(q, limite=TYPEAHEAD_LIMIT):
+    """
+    Sugerencias para los campos de producto: los primeros `limite` productos
+    cuyo código o nombre empieza por `q`, primero los de código. Las dos
+    condiciones son prefijos sobre columnas indexadas, así que la consulta
+    no depende del tamaño del catálogo.
+    """
+    q = (q or '').strip()
+    if not q:
+        return []
+    return list(
+        Producto.objects
+        .filter(Q(codigo__istartswith=q) | Q(nombre__istartswith=q))
+        .annotate(por_codigo=Case(
+            When(codigo__istartswith=q, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        ))
+        .order_by('por_codigo', 'codigo')
+        .values('codigo', 'nombre')[:limite]
+    )
+
+
+def _entero(valor, minimo=None):
+    try:
+        numero = int(valor)
+    except (TypeError, ValueError):
+        return None
+    if minimo is not None and numero < minimo:
+        return None
+    return numero
+
+
+def clean_search_params(params):
+    """
+    Normaliza los parámetros de búsqueda de un QueryDict: descarta los
+    valores vacíos o que no sean números válidos.
+    """
+    try:
+        limite = min(max(int(params.get('limite', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        limite = PAGE_SIZE
+    return {
+        'q': (params.get('q') or '').strip()[:100],
+        'precio_min': _entero(params.get('precio_min'), 0),
+        'precio_max': _entero(params.get('precio_max'), 0),
+        'bodega': (params.get('bodega') or '').strip().upper() or None,
+        'ciudad': (params.get('ciudad') or '').strip() or None,
+        'pagina': _entero(params.get('pagina'), 1) or 1,
+        'limite': limite,
+    }
+
+
+def _filtro_texto(q):
+    """
+    Coincidencias por prefijo en código y nombre, por contenido en nombre y
+    descripción y, en PostgreSQL, por similitud trigram de palabras en el
+    nombre (tolera errores de tipeo). Todas usan los índices trigram.
+    """
+    filtro = (
+        Q(codigo__istartswith=q)
+        | Q(nombre__icontains=q)
+        | Q(descripcion__icontains=q)
+    )
+    if connection.vendor == 'postgresql':
+        filtro |= Q(nombre_mayus__trigram_word_similar=q.upper())
+    return filtro
+
+
+def _filtro_ubicacion(bodega=None, ciudad=None):
+    """Productos con stock en la bodega o ciudad indicadas, usando StockBodegaProducto."""
+    if not bodega and not ciudad:
+        return Q()
+    stock = StockBodegaProducto.objects.filter(producto_id=OuterRef('pk'), stock__gt=0)
+    if bodega:
+        stock = stock.filter(bodega_id=bodega)
+    if ciudad:
+        stock = stock.filter(bodega__ciudad=ciudad)
+    return Q(Exists(stock))
+
+
+def _filtro_precio(precio_min=None, precio_max=None):
+    filtro = Q()
+    if precio_min is not None:
+        filtro &= Q(precio__gte=precio_min)
+    if precio_max is not None:
+        filtro &= Q(precio__lte=precio_max)
+    return filtro
+
+
+def _facetas(texto, precio, ubicacion):
+    """
+    Conteos por bodega, ciudad y rango de precio. Cada faceta aplica los
+    demás filtros pero no el suyo, para poder cambiar de opción.
+    """
+    base = Producto.objects.alias(nombre_mayus=Upper('nombre')).filter(texto)
+
+    sin_ubicacion = base.filter(precio).values('pk')
+    stock = StockBodegaProducto.objects.filter(stock__gt=0, producto__in=sin_ubicacion)
+    bodegas = list(
+        stock.values('bodega_id', 'bodega__ciudad')
+        .annotate(productos=Count('producto_id'))
+        .order_by('-productos', 'bodega_id')
+    )
+    ciudades = list(
+        stock.values('bodega__ciudad')
+        .annotate(productos=Count('producto_id', distinct=True))
+        .order_by('-productos', 'bodega__ciudad')
+    )
+
+    conteos = base.filter(ubicacion).aggregate(**{
+        f'rango_{i}': Count('pk', filter=Q(precio__gte=desde) & (Q(precio__lt=hasta) if hasta else Q()))
+        for i, (desde, hasta) in enumerate(RANGOS_PRECIO)
+    })
+
+    return {
+        'bodegas': [
+            {'codigo': fila['bodega_id'], 'ciudad': fila['bodega__ciudad'], 'productos': fila['productos']}
+            for fila in bodegas
+        ],
+        'ciudades': [
+            {'ciudad': fila['bodega__ciudad'], 'productos': fila['productos']}
+            for fila in ciudades
+        ],
+        'precios': [
+            {'desde': desde, 'hasta': hasta, 'productos': conteos[f'rango_{i}']}
+            for i, (desde, hasta) in enumerate(RANGOS_PRECIO)
+        ],
+    }
+
+
+def search_productos(q='', precio_min=None, precio_max=None, bodega=None, ciudad=None,
+                     pagina=1, limite=PAGE_SIZE, facetas=True):
+    """
+    Busca productos por código, nombre y descripción, con filtros por rango
+    de precio y por bodega o ciudad donde hay stock.
+
+    Ordena primero el código exacto, luego los prefijos de código o nombre y,
+    en PostgreSQL, por similitud; después por nombre. Pagina por número de
+    página trayendo una fila extra para saber si hay siguiente, sin COUNT(*).
+
+    Retorna {'productos', 'pagina', 'hay_siguiente', 'facetas'}.
+    """
+    texto = _filtro_texto(q) if q else Q()
+    precio = _filtro_precio(precio_min, precio_max)
+    ubicacion = _filtro_ubicacion(bodega, ciudad)
+
+    queryset = (
+        Producto.objects
+        .alias(nombre_mayus=Upper('nombre'))
+        .filter(texto, precio, ubicacion)
+        .select_related('totales')
+        .only('codigo', 'nombre', 'precio', 'totales__stock_total', 'totales__num_ubicaciones')
+    )
+
+    orden = ['nombre', 'codigo']
+    if q:
+        queryset = queryset.annotate(relevancia=Case(
+            When(codigo__iexact=q, then=Value(0)),
+            When(Q(codigo__istartswith=q) | Q(nombre__istartswith=q), then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField(),
+        ))
+        orden.insert(0, 'relevancia')
+        if connection.vendor == 'postgresql':
+            from django.contrib.postgres.search import TrigramWordSimilarity
+
+            queryset = queryset.annotate(similitud=TrigramWordSimilarity(Value(q.upper()), 'nombre_mayus'))
+            orden.insert(1, '-similitud')
+
+    inicio = (pagina - 1) * limite
+    productos = list(queryset.order_by(*orden)[inicio:inicio + limite + 1])
+
+    return {
+        'productos': productos[:limite],
+        'pagina': pagina,
+        'hay_siguiente': len(productos) > limite,
+        'facetas': _facetas(texto, precio, ubicacion) if facetas else None,
+    }
@@ -0,0 +1,164 @@
+"""
+Agregados de stock por producto, por bodega y por bodega+producto.
+
+Las tablas StockProducto, StockBodega y StockBodegaProducto se actualizan
+con incrementos F() en la misma transacción que el cambio de Ubicacion:
+los signals cubren save()/delete() y las operaciones masivas (bulk_update)
+llaman a apply_stock_changes() directamente. reconcile() recalcula los
+totales desde las ubicaciones y corrige las diferencias.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from ..models import StockBodega, StockBodegaProducto, StockProducto, Ubicacion
+
+
+def _acumular(destino, key, delta_stock, delta_ubicaciones):
+    stock, ubicaciones = destino.get(key, (0, 0))
+    destino[key] = (stock + delta_stock, ubicaciones + delta_ubicaciones)
+
+
+def _aplicar(modelo, campos_clave, campo_stock, campo_ubicaciones, deltas):
+    """
+    Suma los deltas a las filas del agregado, en orden de clave para que dos
+    transacciones no se bloqueen en orden inverso. Las filas se crean solo
+    cuando se agrega una ubicación; un agregado que no existe se corrige con
+    reconcile().
+    """
+    nuevas = [key for key, (_, ubicaciones) in deltas.items() if ubicaciones > 0]
+    if nuevas:
+        modelo.objects.bulk_create(
+            [modelo(**dict(zip(campos_clave, key))) for key in nuevas],
+            ignore_conflicts=True,
+        )
+    for key in sorted(deltas):
+        delta_stock, delta_ubicaciones = deltas[key]
+        if not delta_stock and not delta_ubicaciones:
+            continue
+        modelo.objects.filter(**dict(zip(campos_clave, key))).update(**{
+            campo_stock: F(campo_stock) + delta_stock,
+            campo_ubicaciones: F(campo_ubicaciones) + delta_ubicaciones,
+        })
+
+
+def apply_stock_changes(cambios):
+    """
+    Aplica cambios de stock a los agregados.
+
+    cambios: iterable de (producto_id o None, bodega_id, delta_stock, delta_ubicaciones).
+    Debe llamarse dentro de la transacción que modifica las ubicaciones.
+    """
+    productos, bodegas, pares = {}, {}, {}
+    for producto_id, bodega_id, delta_stock, delta_ubicaciones in cambios:
+        _acumular(bodegas, (bodega_id,), delta_stock, delta_ubicaciones)
+        if producto_id:
+            _acumular(productos, (producto_id,), delta_stock, delta_ubicaciones)
+            _acumular(pares, (bodega_id, producto_id), delta_stock, delta_ubicaciones)
+
+    with transaction.atomic():
+        _aplicar(StockProducto, ('producto_id',), 'stock_total', 'num_ubicaciones', productos)
+        _aplicar(StockBodega, ('bodega_id',), 'total_stock', 'total_ubicaciones', bodegas)
+        _aplicar(StockBodegaProducto, ('bodega_id', 'producto_id'), 'stock', 'num_ubicaciones', pares)
+
+
+# ============================================================================
+# RECONCILIACIÓN
+# ============================================================================
+
+def _esperados(productos=None, bodegas=None):
+    """Totales calculados desde las ubicaciones, con las mismas claves que los agregados."""
+    ubicaciones = Ubicacion.objects.all()
+    con_producto = ubicaciones.filter(producto__isnull=False)
+
+    por_producto = con_producto
+    por_bodega = ubicaciones
+    por_par = con_producto
+    if productos is not None:
+        por_producto = por_producto.filter(producto_id__in=productos)
+    if bodegas is not None:
+        por_bodega = por_bodega.filter(estanteria__bodega_id__in=bodegas)
+    if productos is not None or bodegas is not None:
+        filtro_par = con_producto.none()
+        if productos is not None:
+            filtro_par = filtro_par | con_producto.filter(producto_id__in=productos)
+        if bodegas is not None:
+            filtro_par = filtro_par | con_producto.filter(estanteria__bodega_id__in=bodegas)
+        por_par = filtro_par
+
+    def totales(queryset, *campos):
+        return {
+            tuple(fila[campo] for campo in campos): (fila['stock'] or 0, fila['ubicaciones'])
+            for fila in queryset.values(*campos).annotate(stock=Sum('stock'), ubicaciones=Count('id')).order_by()
+        }
+
+    return {
+        'productos': totales(por_producto, 'producto_id'),
+        'bodegas': totales(por_bodega, 'estanteria__bodega_id'),
+        'pares': totales(por_par, 'estanteria__bodega_id', 'producto_id'),
+    }
+
+
+def _actuales(productos=None, bodegas=None):
+    """Totales guardados en las tablas de agregados."""
+    stock_productos = StockProducto.objects.all()
+    stock_bodegas = StockBodega.objects.all()
+    stock_pares = StockBodegaProducto.objects.all()
+    if productos is not None:
+        stock_productos = stock_productos.filter(producto_id__in=productos)
+    if bodegas is not None:
+        stock_bodegas = stock_bodegas.filter(bodega_id__in=bodegas)
+    if productos is not None or bodegas is not None:
+        filtro = StockBodegaProducto.objects.none()
+        if productos is not None:
+            filtro = filtro | StockBodegaProducto.objects.filter(producto_id__in=productos)
+        if bodegas is not None:
+            filtro = filtro | StockBodegaProducto.objects.filter(bodega_id__in=bodegas)
+        stock_pares = filtro
+
+    return {
+        'productos': {
+            (pid,): (stock, n) for pid, stock, n in stock_productos.values_list('producto_id', 'stock_total', 'num_ubicaciones')
+        },
+        'bodegas': {
+            (bid,): (stock, n) for bid, stock, n in stock_bodegas.values_list('bodega_id', 'total_stock', 'total_ubicaciones')
+        },
+        'pares': {
+            (bid, pid): (stock, n) for bid, pid, stock, n in stock_pares.values_list('bodega_id', 'producto_id', 'stock', 'num_ubicaciones')
+        },
+    }
+
+
+_TABLAS = {
+    'productos': (StockProducto, ('producto_id',), 'stock_total', 'num_ubicaciones'),
+    'bodegas': (StockBodega, ('bodega_id',), 'total_stock', 'total_ubicaciones'),
+    'pares': (StockBodegaProducto, ('bodega_id', 'producto_id'), 'stock', 'num_ubicaciones'),
+}
+
+
+def reconcile(fix=False, productos=None, bodegas=None):
+    """
+    Compara los agregados con los totales calculados desde las ubicaciones.
+
+    Con `productos` o `bodegas` se limita a esas claves. Con `fix` se
+    corrigen las diferencias. Una fila en cero equivale a una fila ausente.
+    Retorna por tabla la lista de diferencias (clave, esperado, actual).
+    """
+    with transaction.atomic():
+        esperados = _esperados(productos, bodegas)
+        actuales = _actuales(productos, bodegas)
+
+        diferencias = {}
+        for tabla, (modelo, campos_clave, campo_stock, campo_ubicaciones) in _TABLAS.items():
+            diferencias[tabla] = []
+            for key in sorted(set(esperados[tabla]) | set(actuales[tabla]), key=str):
+                esperado = esperados[tabla].get(key, (0, 0))
+                actual = actuales[tabla].get(key, (0, 0))
+                if esperado == actual:
+                    continue
+                diferencias[tabla].append((key, esperado, actual))
+                if fix:
+                    modelo.objects.update_or_create(
+                        **dict(zip(campos_clave, key)),
+                        defaults={campo_stock: esperado[0], campo_ubicaciones: esperado[1]},
+                    )
+        return diferencias
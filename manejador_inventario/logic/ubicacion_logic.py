@@ -1,3 +1,24 @@
+from collections import OrderedDict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import Ubicacion
+from .stock_logic import apply_stock_changes
+
+# Filas por sentencia UPDATE en los ajustes masivos
+AJUSTE_BATCH_SIZE = 1000
+
+
+class AjusteStockError(ValueError):
+    """Un lote de ajustes de stock no se pudo aplicar; no se modificó nada."""
+
+    def __init__(self, errores):
+        self.errores = errores
+        super().__init__(f"{len(errores)} ajustes inválidos")
+
+
 def create_ubicacion(form, estanteria):
     """
     Crea una nueva ubicación asociada a una estantería a partir de un formulario validado.
@@ -6,4 +27,92 @@ def create_ubicacion(form, estanteria):
     ubicacion.estanteria = estanteria
     ubicacion.save()
 
-    return ubicacion
\ No newline at end of file
+    return ubicacion
+
+
+def _agrupar_ajustes(ajustes):
+    """Suma los deltas de una misma ubicación. Retorna id -> delta."""
+    deltas = OrderedDict()
+    for ubicacion_id, delta in ajustes:
+        ubicacion_id = int(ubicacion_id)
+        deltas[ubicacion_id] = deltas.get(ubicacion_id, 0) + int(delta)
+    return deltas
+
+
+def adjust_stock_bulk(ajustes):
+    """
+    Aplica un lote de ajustes de stock (ubicacion_id, delta) en una sola transacción.
+
+    Las ubicaciones se bloquean en orden de id, se valida que el stock
+    resultante quede entre lo reservado y la capacidad y se actualizan con
+    F('stock') + delta mediante bulk_update; la base de datos vuelve a
+    verificar el rango con los constraints de Ubicacion.
+
+    bulk_update no dispara signals: los agregados de stock se actualizan
+    aquí y se marca una sola sincronización por producto y por bodega afectados.
+
+    Retorna un diccionario con las ubicaciones, productos y bodegas afectados.
+    Lanza AjusteStockError si algún ajuste es inválido.
+    """
+    from provesi.unit_of_work import mark_dirty, sync_scope
+
+    deltas = _agrupar_ajustes(ajustes)
+    deltas = OrderedDict((ubicacion_id, delta) for ubicacion_id, delta in deltas.items() if delta)
+    if not deltas:
+        return {'ubicaciones': 0, 'productos': [], 'bodegas': []}
+
+    with sync_scope(), transaction.atomic():
+        filas = (
+            Ubicacion.objects
+            .select_for_update(of=('self',))
+            .filter(id__in=list(deltas))
+            .order_by('id')
+            .values_list('id', 'stock', 'reservado', 'capacidad', 'producto_id', 'estanteria__bodega_id')
+        )
+
+        errores = []
+        cambios = []
+        productos = OrderedDict()
+        bodegas = OrderedDict()
+        encontradas = set()
+        for ubicacion_id, stock, reservado, capacidad, producto_id, bodega_id in filas:
+            encontradas.add(ubicacion_id)
+            nuevo = stock + deltas[ubicacion_id]
+            if not reservado <= nuevo <= capacidad:
+                errores.append({
+                    'ubicacion': ubicacion_id,
+                    'error': f"El stock quedaría en {nuevo} (reservado {reservado}, capacidad {capacidad})",
+                })
+                continue
+            cambios.append((producto_id, bodega_id, deltas[ubicacion_id], 0))
+            if producto_id:
+                productos[producto_id] = True
+            bodegas[bodega_id] = True
+
+        errores.extend(
+            {'ubicacion': ubicacion_id, 'error': 'La ubicación no existe'}
+            for ubicacion_id in deltas if ubicacion_id not in encontradas
+        )
+        if errores:
+            raise AjusteStockError(errores)
+
+        ahora = timezone.now()
+        try:
+            Ubicacion.objects.bulk_update(
+                [
+                    Ubicacion(id=ubicacion_id, stock=F('stock') + delta, fecha_actualizacion=ahora)
+                    for ubicacion_id, delta in deltas.items()
+                ],
+                ['stock', 'fecha_actualizacion'],
+                batch_size=AJUSTE_BATCH_SIZE,
+            )
+        except IntegrityError as e:
+            raise AjusteStockError([{'ubicacion': None, 'error': f"Stock fuera de rango: {e}"}])
+        apply_stock_changes(cambios)
+
+        for producto_id in productos:
+            mark_dirty('producto', producto_id)
+        for bodega_id in bodegas:
+            mark_dirty('bodega', bodega_id)
+
+    return {'ubicaciones': len(deltas), 'productos': list(productos), 'bodegas': list(bodegas)}
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from manejador_inventario.logic.stock_logic import reconcile
+
+NOMBRES = {
+    'productos': 'StockProducto',
+    'bodegas': 'StockBodega',
+    'pares': 'StockBodegaProducto',
+}
+
+
+class Command(BaseCommand):
+    help = 'Verifica los agregados de stock contra las ubicaciones y opcionalmente los corrige'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Corregir las diferencias encontradas')
+        parser.add_argument('--producto', action='append', help='Limitar a un producto (se puede repetir)')
+        parser.add_argument('--bodega', action='append', help='Limitar a una bodega (se puede repetir)')
+        parser.add_argument('--max-detalle', type=int, default=20, help='Diferencias a mostrar por tabla')
+
+    def handle(self, *args, **options):
+        diferencias = reconcile(fix=options['fix'], productos=options['producto'], bodegas=options['bodega'])
+
+        total = 0
+        for tabla, filas in diferencias.items():
+            total += len(filas)
+            if not filas:
+                self.stdout.write(self.style.SUCCESS(f'✅ {NOMBRES[tabla]}: sin diferencias'))
+                continue
+            self.stdout.write(self.style.WARNING(f'⚠️  {NOMBRES[tabla]}: {len(filas)} diferencias'))
+            for clave, esperado, actual in filas[:options['max_detalle']]:
+                self.stdout.write(
+                    f'   {"/".join(str(c) for c in clave)}: esperado stock={esperado[0]} ubicaciones={esperado[1]}, '
+                    f'actual stock={actual[0]} ubicaciones={actual[1]}'
+                )
+
+        if total and options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'✅ {total} agregados corregidos'))
+        elif total:
+            raise CommandError(f'{total} agregados no coinciden; ejecute con --fix para corregirlos')
@@ -29,8 +29,9 @@ class Bodega(models.Model):
         return f"Bodega en {self.ciudad} - {self.direccion}"
     
     def toJson(self):
+        """Una bodega; para querysets usar provesi.serializers.BODEGA."""
         return {
-            'id': self.id,
+            'codigo': self.codigo,
             'ciudad': self.ciudad,
             'direccion': self.direccion,
         }
@@ -64,13 +65,26 @@ class Estanteria(models.Model):
     class Meta:
         unique_together = ('bodega', 'zona', 'codigo')
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Guarda la clave natural leída de la base de datos, para invalidar la
+        entrada de caché anterior si la estantería cambia de código o zona.
+        """
+        instance = super().from_db(db, field_names, values)
+        cargados = dict(zip(field_names, values))
+        instance._clave_original = (cargados.get('bodega_id'), cargados.get('zona'), cargados.get('codigo'))
+        return instance
+
     def __str__(self):
-        return f"Estantería {self.zona}{self.codigo} en Bodega {self.bodega.codigo}"
+        return f"Estantería {self.zona}{self.codigo} en Bodega {self.bodega_id}"
     
     def toJson(self):
+        """Una estantería con su bodega; para querysets usar provesi.serializers.ESTANTERIA."""
         return {
             'bodega': self.bodega.toJson(),
             'zona': self.zona,
+            'codigo': self.codigo,
             'niveles': self.niveles,
         }
     
@@ -100,15 +114,25 @@ class Producto(models.Model):
         help_text="Precio del producto en la moneda local (COP)."
     )
 
+    class Meta:
+        # Índices portables para ordenar por nombre y filtrar por precio; en
+        # PostgreSQL la búsqueda de texto usa además los índices trigram que
+        # crea apps.create_search_indexes
+        indexes = [
+            models.Index(fields=['nombre'], name='producto_nombre_idx'),
+            models.Index(fields=['precio'], name='producto_precio_idx'),
+        ]
+
     def __str__(self):
         return f"Producto {self.codigo} - {self.nombre}"
     
     def toJson(self):
+        """Un producto; para querysets usar provesi.serializers.PRODUCTO."""
         return {
             'codigo': self.codigo,
-            'ubicacion': self.ubicacion.toJson(),
+            'nombre': self.nombre,
             'descripcion': self.descripcion,
-            'cantidad': self.precio,
+            'precio': self.precio,
         }
     
 class Ubicacion(models.Model):
@@ -149,6 +173,11 @@ class Ubicacion(models.Model):
         help_text="Cantidad actual de ítems almacenados en la ubicación."
     )
 
+    reservado = models.IntegerField(
+        default=0,
+        help_text="Cantidad del stock apartada para pedidos y aún no despachada."
+    )
+
     fecha_actualizacion = models.DateTimeField(
         auto_now=True,
         help_text="Fecha y hora de la última actualización del stock."
@@ -156,19 +185,140 @@ class Ubicacion(models.Model):
 
     class Meta:
         unique_together = ('estanteria', 'nivel', 'codigo')
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(stock__gte=0) & models.Q(stock__lte=models.F('capacidad')),
+                name='ubicacion_stock_en_rango',
+            ),
+            models.CheckConstraint(
+                check=models.Q(reservado__gte=0) & models.Q(reservado__lte=models.F('stock')),
+                name='ubicacion_reservado_en_rango',
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Guarda el stock, la estantería y el producto leídos de la base de datos,
+        para que los signals puedan calcular qué cambió al guardar.
+        """
+        instance = super().from_db(db, field_names, values)
+        cargados = dict(zip(field_names, values))
+        instance._stock_original = cargados.get('stock')
+        instance._estanteria_original = cargados.get('estanteria_id')
+        instance._producto_original = cargados.get('producto_id')
+        return instance
 
     def __str__(self):
         return f"Ubicación en Estantería {self.estanteria.codigo} - Nivel {self.nivel} - Posición {self.codigo}"
     
     def toJson(self):
+        """Una ubicación con su estantería; para querysets usar provesi.serializers.UBICACION."""
         return {
+            'id': self.id,
             'estanteria': self.estanteria.toJson(),
+            'producto': self.producto_id,
             'nivel': self.nivel,
             'codigo': self.codigo,
             'capacidad': self.capacidad,
             'stock': self.stock,
+            'reservado': self.reservado,
         }
 
+# ============================================
+# AGREGADOS DE STOCK
+# ============================================
+
+class StockProducto(models.Model):
+    """
+    Totales de stock de un producto en todas sus ubicaciones.
+
+    Se mantiene en la misma transacción que los cambios de Ubicacion
+    (ver logic/stock_logic.py); reconcile_stock lo verifica.
+    """
+    producto = models.OneToOneField(
+        Producto,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='totales',
+        help_text="Producto al que corresponden los totales."
+    )
+
+    stock_total = models.IntegerField(
+        default=0,
+        help_text="Stock del producto sumando todas sus ubicaciones."
+    )
+
+    num_ubicaciones = models.IntegerField(
+        default=0,
+        help_text="Número de ubicaciones que contienen el producto."
+    )
+
+    def __str__(self):
+        return f"Stock de {self.producto_id}: {self.stock_total} en {self.num_ubicaciones} ubicaciones"
+
+
+class StockBodega(models.Model):
+    """
+    Totales de stock y ubicaciones de una bodega.
+    """
+    bodega = models.OneToOneField(
+        Bodega,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='totales',
+        help_text="Bodega a la que corresponden los totales."
+    )
+
+    total_stock = models.IntegerField(
+        default=0,
+        help_text="Stock sumando todas las ubicaciones de la bodega."
+    )
+
+    total_ubicaciones = models.IntegerField(
+        default=0,
+        help_text="Número de ubicaciones de la bodega."
+    )
+
+    def __str__(self):
+        return f"Stock de bodega {self.bodega_id}: {self.total_stock} en {self.total_ubicaciones} ubicaciones"
+
+
+class StockBodegaProducto(models.Model):
+    """
+    Totales de stock de un producto dentro de una bodega.
+    """
+    bodega = models.ForeignKey(
+        Bodega,
+        on_delete=models.CASCADE,
+        related_name='stock_productos',
+        help_text="Bodega donde está el stock."
+    )
+
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='stock_bodegas',
+        help_text="Producto almacenado."
+    )
+
+    stock = models.IntegerField(
+        default=0,
+        help_text="Stock del producto en la bodega."
+    )
+
+    num_ubicaciones = models.IntegerField(
+        default=0,
+        help_text="Ubicaciones de la bodega que contienen el producto."
+    )
+
+    class Meta:
+        unique_together = ('bodega', 'producto')
+
+    def __str__(self):
+        return f"Stock de {self.producto_id} en {self.bodega_id}: {self.stock}"
+
+
 # ============================================
 # SIGNALS PARA SINCRONIZACIÓN AUTOMÁTICA
 # ============================================
@@ -178,35 +328,148 @@ from django.dispatch import receiver
 
 @receiver(post_save, sender=Producto)
 def producto_saved(sender, instance, created, **kwargs):
-    """Sincronizar producto a MongoDB cuando se crea o actualiza"""
-    from provesi.mongodb_sync import sync_producto_to_mongo
-    sync_producto_to_mongo(instance)
+    """Marcar el producto para sincronizar cuando se crea o actualiza"""
+    from provesi.unit_of_work import mark_dirty
+    mark_dirty('producto', instance.codigo)
 
 
 @receiver(post_delete, sender=Producto)
 def producto_deleted(sender, instance, **kwargs):
-    """Eliminar producto de MongoDB cuando se elimina"""
-    from provesi.mongodb_sync import delete_producto_from_mongo
-    delete_producto_from_mongo(instance.codigo)
+    """Marcar la eliminación del producto para sincronizar"""
+    from provesi.unit_of_work import mark_dirty
+    mark_dirty('producto', instance.codigo, 'delete')
 
 
 @receiver(post_save, sender=Bodega)
 def bodega_saved(sender, instance, created, **kwargs):
-    """Sincronizar bodega a MongoDB cuando se crea o actualiza"""
-    from provesi.mongodb_sync import sync_bodega_to_mongo
-    sync_bodega_to_mongo(instance)
+    """Marcar la bodega para sincronizar cuando se crea o actualiza"""
+    from provesi.unit_of_work import mark_dirty
+    mark_dirty('bodega', instance.codigo)
+
+
+@receiver(post_save, sender=Bodega)
+@receiver(post_delete, sender=Bodega)
+def bodega_cache_invalidate(sender, instance, **kwargs):
+    """Invalidar la bodega en la caché de la jerarquía"""
+    from .logic.cache_logic import invalidate_bodega
+    invalidate_bodega(instance.codigo)
+
+
+@receiver(post_save, sender=Estanteria)
+@receiver(post_delete, sender=Estanteria)
+def estanteria_changed(sender, instance, **kwargs):
+    """Un cambio de estantería altera la estructura: reconstruir la bodega"""
+    from provesi.unit_of_work import mark_dirty
+    mark_dirty('bodega', instance.bodega_id)
+
+
+# Debe registrarse antes que estanteria_cache_invalidate, que actualiza la clave original
+@receiver(post_save, sender=Estanteria)
+def estanteria_stock_moved(sender, instance, created, **kwargs):
+    """Si la estantería pasó a otra bodega, recalcular los agregados de ambas bodegas"""
+    from .logic.stock_logic import reconcile
+
+    clave_original = getattr(instance, '_clave_original', None)
+    if not created and clave_original and clave_original[0] != instance.bodega_id:
+        reconcile(fix=True, bodegas=[clave_original[0], instance.bodega_id])
+
+
+@receiver(post_save, sender=Estanteria)
+@receiver(post_delete, sender=Estanteria)
+def estanteria_cache_invalidate(sender, instance, **kwargs):
+    """Invalidar la estantería en la caché de la jerarquía, con su clave anterior y la actual"""
+    from .logic.cache_logic import invalidate_estanteria
+
+    clave_original = getattr(instance, '_clave_original', None)
+    clave_actual = (instance.bodega_id, instance.zona, instance.codigo)
+    if clave_original and clave_original != clave_actual:
+        invalidate_estanteria(*clave_original)
+    invalidate_estanteria(*clave_actual)
+    instance._clave_original = clave_actual
+
+
+# Debe registrarse antes que ubicacion_saved, que actualiza los valores originales
+@receiver(post_save, sender=Ubicacion)
+def ubicacion_stock_saved(sender, instance, created, **kwargs):
+    """Actualizar los agregados de stock con la diferencia respecto al estado anterior"""
+    from .logic.stock_logic import apply_stock_changes, reconcile
+
+    bodega_id = instance.estanteria.bodega_id
+    if created:
+        apply_stock_changes([(instance.producto_id, bodega_id, instance.stock, 1)])
+        return
+
+    stock_original = getattr(instance, '_stock_original', None)
+    estanteria_original = getattr(instance, '_estanteria_original', None)
+    producto_original = getattr(instance, '_producto_original', None)
+    if stock_original is None:
+        # Se desconoce el estado anterior: recalcular lo afectado
+        reconcile(fix=True, productos=[p for p in (instance.producto_id,) if p], bodegas=[bodega_id])
+        return
+
+    if estanteria_original == instance.estanteria_id and producto_original == instance.producto_id:
+        if instance.stock != stock_original:
+            apply_stock_changes([(instance.producto_id, bodega_id, instance.stock - stock_original, 0)])
+        return
+
+    bodega_original = bodega_id
+    if estanteria_original != instance.estanteria_id:
+        bodega_original = Estanteria.objects.values_list('bodega_id', flat=True).get(id=estanteria_original)
+    apply_stock_changes([
+        (producto_original, bodega_original, -stock_original, -1),
+        (instance.producto_id, bodega_id, instance.stock, 1),
+    ])
+
+
+@receiver(post_delete, sender=Ubicacion)
+def ubicacion_stock_deleted(sender, instance, **kwargs):
+    """Descontar la ubicación eliminada de los agregados de stock"""
+    from .logic.stock_logic import apply_stock_changes
+
+    apply_stock_changes([(instance.producto_id, instance.estanteria.bodega_id, -instance.stock, -1)])
 
 
 @receiver(post_save, sender=Ubicacion)
 def ubicacion_saved(sender, instance, created, **kwargs):
     """
-    Cuando se guarda una ubicación, re-sincronizar:
+    Cuando se guarda una ubicación, marcar para sincronizar:
     1. El producto (si tiene)
-    2. La bodega completa
+    2. El cambio en la bodega: una actualización puntual de la ubicación si
+       solo cambió su contenido, o la bodega completa si cambió la estructura
     """
-    from provesi.mongodb_sync import sync_producto_to_mongo, sync_bodega_to_mongo
+    from provesi.unit_of_work import mark_dirty
+    
+    if instance.producto_id:
+        mark_dirty('producto', instance.producto_id)
+    
+    producto_original = getattr(instance, '_producto_original', None)
+    if producto_original and producto_original != instance.producto_id:
+        mark_dirty('producto', producto_original)
+    
+    stock_original = getattr(instance, '_stock_original', None)
+    estanteria_original = getattr(instance, '_estanteria_original', None)
+    
+    if created:
+        mark_dirty('ubicacion', instance.id, payload={'delta_stock': instance.stock, 'creada': True})
+    elif stock_original is None or estanteria_original != instance.estanteria_id:
+        # Se desconoce el estado anterior o la ubicación cambió de estantería
+        if estanteria_original is not None and estanteria_original != instance.estanteria_id:
+            mark_dirty('bodega', Estanteria.objects.values_list('bodega_id', flat=True).get(id=estanteria_original))
+        mark_dirty('bodega', instance.estanteria.bodega_id)
+    else:
+        mark_dirty('ubicacion', instance.id, payload={'delta_stock': instance.stock - stock_original})
+    
+    instance._stock_original = instance.stock
+    instance._estanteria_original = instance.estanteria_id
+    instance._producto_original = instance.producto_id
+
+
+@receiver(post_delete, sender=Ubicacion)
+def ubicacion_deleted(sender, instance, **kwargs):
+    """Eliminar una ubicación altera la estructura: reconstruir producto y bodega"""
+    from provesi.unit_of_work import mark_dirty
     
-    if instance.producto:
-        sync_producto_to_mongo(instance.producto)
+    if instance.producto_id:
+        mark_dirty('producto', instance.producto_id)
     
-    sync_bodega_to_mongo(instance.estanteria.bodega)
\ No newline at end of file
+    mark_dirty('bodega', instance.estanteria.bodega_id)
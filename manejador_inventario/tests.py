@@ -1,3 +1,300 @@
+from django.db import IntegrityError, transaction
 from django.test import TestCase
 
-# Create your tests here.
+from provesi.models import SyncOutbox
+
+from provesi.document_builders import build_bodega_documents, build_producto_documents
+from .logic import cache_logic
+from .logic.bodega_logic import get_bodega_by_codigo
+from .logic.estanteria_logic import get_estanteria_by_codigo
+from .forms import UbicacionForm
+from .logic.producto_logic import search_productos, typeahead_productos
+from .logic.stock_logic import reconcile
+from .logic.ubicacion_logic import AjusteStockError, adjust_stock_bulk
+from .models import Bodega, Estanteria, Producto, StockBodega, StockBodegaProducto, StockProducto, Ubicacion
+
+
+class InventarioDocumentBuilderTests(TestCase):
+    """Los documentos de productos y bodegas se construyen con un número fijo de consultas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bodegas = [
+            Bodega.objects.create(codigo=f'BOG0{i}', ciudad='Bogotá', direccion=f'Calle {i}')
+            for i in range(2)
+        ]
+        cls.productos = [
+            Producto.objects.create(codigo=f'P{i}', nombre=f'Producto {i}', descripcion='Desc', precio=10)
+            for i in range(3)
+        ]
+        for bodega in cls.bodegas:
+            for zona in 'AB':
+                estanteria = Estanteria.objects.create(bodega=bodega, zona=zona, codigo=1, niveles=2)
+                for nivel in range(2):
+                    for i, producto in enumerate(cls.productos):
+                        Ubicacion.objects.create(
+                            estanteria=estanteria, producto=producto,
+                            nivel=nivel, codigo=i, capacidad=50, stock=5,
+                        )
+
+    def test_documento_de_bodega(self):
+        documento = build_bodega_documents(['BOG00'])['BOG00']
+
+        self.assertEqual(len(documento['estanterias']), 2)
+        self.assertEqual(documento['total_ubicaciones'], 12)
+        self.assertEqual(documento['total_stock'], 60)
+        self.assertEqual(documento['estanterias'][0]['ubicaciones'][0]['producto']['codigo'], 'P0')
+
+    def test_documento_de_producto(self):
+        documento = build_producto_documents(['P1'])['P1']
+
+        self.assertEqual(documento['num_ubicaciones'], 8)
+        self.assertEqual(documento['stock_total'], 40)
+        self.assertIn(documento['ubicaciones'][0]['bodega_codigo'], {'BOG00', 'BOG01'})
+
+    def test_consultas_constantes_para_bodegas(self):
+        with self.assertNumQueries(3):
+            build_bodega_documents(['BOG00'])
+        with self.assertNumQueries(3):
+            build_bodega_documents([bodega.codigo for bodega in self.bodegas])
+
+    def test_consultas_constantes_para_productos(self):
+        with self.assertNumQueries(2):
+            build_producto_documents(['P0'])
+        with self.assertNumQueries(2):
+            build_producto_documents([producto.codigo for producto in self.productos])
+
+
+class HierarchyCacheTests(TestCase):
+    """Las bodegas y estanterías se leen de caché y se invalidan al guardar."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bodega = Bodega.objects.create(codigo='MED01', ciudad='Medellín', direccion='Carrera 1')
+        cls.estanteria = Estanteria.objects.create(bodega=cls.bodega, zona='A', codigo=1, niveles=3)
+
+    def setUp(self):
+        cache_logic.clear()
+
+    def test_lecturas_repetidas_sin_consultas(self):
+        get_bodega_by_codigo('MED01')
+        get_estanteria_by_codigo(self.bodega, 'A', 1)
+
+        with self.assertNumQueries(0):
+            bodega = get_bodega_by_codigo('MED01')
+            estanteria = get_estanteria_by_codigo(bodega, 'A', 1)
+            str(estanteria)
+            estanteria.bodega.ciudad
+
+        self.assertEqual(estanteria.pk, self.estanteria.pk)
+        self.assertGreaterEqual(cache_logic.get_cache_stats()['bodegas']['hits'], 1)
+
+    def test_guardar_invalida_la_bodega(self):
+        get_bodega_by_codigo('MED01')
+        Bodega.objects.filter(pk='MED01').update(ciudad='Envigado')
+        bodega = Bodega.objects.get(pk='MED01')
+        bodega.save()
+
+        self.assertEqual(get_bodega_by_codigo('MED01').ciudad, 'Envigado')
+
+    def test_cambio_de_codigo_invalida_la_clave_anterior(self):
+        get_estanteria_by_codigo(self.bodega, 'A', 1)
+        estanteria = Estanteria.objects.get(pk=self.estanteria.pk)
+        estanteria.codigo = 2
+        estanteria.save()
+
+        with self.assertRaises(Estanteria.DoesNotExist):
+            get_estanteria_by_codigo(self.bodega, 'A', 1)
+        self.assertEqual(get_estanteria_by_codigo(self.bodega, 'A', 2).pk, self.estanteria.pk)
+
+    def test_las_instancias_devueltas_son_copias(self):
+        bodega = get_bodega_by_codigo('MED01')
+        bodega.ciudad = 'Modificada'
+
+        self.assertEqual(get_bodega_by_codigo('MED01').ciudad, 'Medellín')
+
+
+class AjusteStockTests(TestCase):
+    """Los ajustes masivos se aplican juntos y generan una sincronización por entidad."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bodega = Bodega.objects.create(codigo='CAL01', ciudad='Cali', direccion='Avenida 3')
+        estanteria = Estanteria.objects.create(bodega=cls.bodega, zona='A', codigo=1, niveles=1)
+        cls.producto = Producto.objects.create(codigo='P9', nombre='Producto 9', descripcion='Desc', precio=10)
+        cls.ubicaciones = [
+            Ubicacion.objects.create(
+                estanteria=estanteria, producto=cls.producto, nivel=0, codigo=i, capacidad=10, stock=5,
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        SyncOutbox.objects.all().delete()
+
+    def stocks(self):
+        return list(Ubicacion.objects.order_by('id').values_list('stock', flat=True))
+
+    def test_aplica_los_deltas_y_coalesce_la_sincronizacion(self):
+        ids = [ubicacion.id for ubicacion in self.ubicaciones]
+        resultado = adjust_stock_bulk([(ids[0], 3), (ids[1], -5), (ids[0], 2), (ids[2], 0)])
+
+        self.assertEqual(self.stocks(), [10, 0, 5])
+        self.assertEqual(resultado['ubicaciones'], 2)
+        self.assertEqual(
+            sorted(SyncOutbox.objects.values_list('entidad', 'clave')),
+            [('bodega', 'CAL01'), ('producto', 'P9')],
+        )
+
+    def test_un_ajuste_fuera_de_rango_no_aplica_ninguno(self):
+        ids = [ubicacion.id for ubicacion in self.ubicaciones]
+
+        with self.assertRaises(AjusteStockError) as contexto:
+            adjust_stock_bulk([(ids[0], 1), (ids[1], 6), (ids[2], -6), (999999, 1)])
+
+        self.assertEqual(
+            sorted(str(error['ubicacion']) for error in contexto.exception.errores),
+            sorted(str(i) for i in (ids[1], ids[2], 999999)),
+        )
+        self.assertEqual(self.stocks(), [5, 5, 5])
+        self.assertFalse(SyncOutbox.objects.exists())
+
+    def test_la_base_de_datos_exige_el_rango_de_stock(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Ubicacion.objects.filter(id=self.ubicaciones[0].id).update(stock=11)
+
+
+class StockAgregadoTests(TestCase):
+    """Los agregados de stock se mantienen con cada cambio de ubicación."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bodegas = [
+            Bodega.objects.create(codigo=f'TUN0{i}', ciudad='Tunja', direccion=f'Calle {i}') for i in range(2)
+        ]
+        cls.estanterias = [Estanteria.objects.create(bodega=b, zona='A', codigo=1, niveles=1) for b in cls.bodegas]
+        cls.productos = [
+            Producto.objects.create(codigo=f'AG{i}', nombre=f'Producto {i}', descripcion='Desc', precio=1)
+            for i in range(2)
+        ]
+
+    def crear(self, estanteria=0, producto=0, codigo=0, stock=5):
+        return Ubicacion.objects.create(
+            estanteria=self.estanterias[estanteria], producto=self.productos[producto],
+            nivel=0, codigo=codigo, capacidad=20, stock=stock,
+        )
+
+    def totales(self):
+        return (
+            dict(StockProducto.objects.values_list('producto_id', 'stock_total')),
+            dict(StockBodega.objects.values_list('bodega_id', 'total_stock')),
+            {(b, p): n for b, p, n in StockBodegaProducto.objects.values_list('bodega_id', 'producto_id', 'stock')},
+        )
+
+    def test_crear_modificar_mover_y_eliminar(self):
+        ubicacion = self.crear(stock=5)
+        self.crear(codigo=1, producto=1, stock=3)
+
+        ubicacion = Ubicacion.objects.get(pk=ubicacion.pk)
+        ubicacion.stock = 8
+        ubicacion.save()
+        self.assertEqual(StockProducto.objects.get(pk='AG0').stock_total, 8)
+
+        ubicacion.estanteria = self.estanterias[1]
+        ubicacion.producto = self.productos[1]
+        ubicacion.save()
+        productos, bodegas, pares = self.totales()
+        self.assertEqual(productos, {'AG0': 0, 'AG1': 11})
+        self.assertEqual(bodegas, {'TUN00': 3, 'TUN01': 8})
+        self.assertEqual(pares[('TUN01', 'AG1')], 8)
+
+        ubicacion.delete()
+        self.assertEqual(StockBodega.objects.get(pk='TUN01').total_ubicaciones, 0)
+        self.assertEqual(reconcile(), {'productos': [], 'bodegas': [], 'pares': []})
+
+    def test_ajuste_masivo_actualiza_agregados(self):
+        ubicaciones = [self.crear(codigo=i, stock=2) for i in range(3)]
+        adjust_stock_bulk([(u.id, 4) for u in ubicaciones])
+
+        self.assertEqual(StockProducto.objects.get(pk='AG0').stock_total, 18)
+        self.assertEqual(StockBodega.objects.get(pk='TUN00').total_stock, 18)
+
+    def test_reconcile_detecta_y_corrige(self):
+        self.crear(stock=7)
+        StockProducto.objects.filter(pk='AG0').update(stock_total=1)
+        StockBodegaProducto.objects.all().delete()
+
+        diferencias = reconcile(fix=True)
+
+        self.assertEqual(diferencias['productos'], [(('AG0',), (7, 1), (1, 1))])
+        self.assertEqual(len(diferencias['pares']), 1)
+        self.assertEqual(reconcile(), {'productos': [], 'bodegas': [], 'pares': []})
+
+
+class BusquedaProductosTests(TestCase):
+    """Búsqueda de productos con filtros, facetas y paginación."""
+
+    @classmethod
+    def setUpTestData(cls):
+        bogota = Bodega.objects.create(codigo='BOG01', ciudad='Bogotá', direccion='Calle 1')
+        cali = Bodega.objects.create(codigo='CAL01', ciudad='Cali', direccion='Calle 2')
+        estanterias = {
+            bodega.codigo: Estanteria.objects.create(bodega=bodega, zona='A', codigo=1, niveles=1)
+            for bodega in (bogota, cali)
+        }
+        datos = [
+            ('TAL-01', 'Taladro percutor', 'Herramienta eléctrica', 250_000, ['BOG01']),
+            ('TAL-02', 'Taladro inalámbrico', 'Batería de litio', 40_000, ['BOG01', 'CAL01']),
+            ('MAR-01', 'Martillo', 'Mango de madera para taladro', 5_000, ['CAL01']),
+            ('DES-01', 'Destornillador', 'Punta plana', 8_000, []),
+        ]
+        for i, (codigo, nombre, descripcion, precio, bodegas) in enumerate(datos):
+            producto = Producto.objects.create(codigo=codigo, nombre=nombre, descripcion=descripcion, precio=precio)
+            for bodega in bodegas:
+                Ubicacion.objects.create(
+                    estanteria=estanterias[bodega], producto=producto, nivel=0, codigo=i, capacidad=10, stock=3,
+                )
+
+    def codigos(self, **kwargs):
+        return [producto.codigo for producto in search_productos(**kwargs)['productos']]
+
+    def test_prefijo_de_codigo_primero_y_coincidencias_en_descripcion(self):
+        self.assertEqual(self.codigos(q='tal'), ['TAL-02', 'TAL-01', 'MAR-01'])
+        self.assertEqual(self.codigos(q='tal-01'), ['TAL-01'])
+
+    def test_filtros_de_precio_y_ubicacion(self):
+        self.assertEqual(self.codigos(precio_min=6_000, precio_max=100_000), ['DES-01', 'TAL-02'])
+        self.assertEqual(self.codigos(ciudad='Cali'), ['MAR-01', 'TAL-02'])
+        self.assertEqual(self.codigos(q='taladro', bodega='BOG01'), ['TAL-02', 'TAL-01'])
+
+    def test_facetas_excluyen_su_propio_filtro(self):
+        facetas = search_productos(q='taladro', ciudad='Cali')['facetas']
+        self.assertEqual(
+            {faceta['ciudad']: faceta['productos'] for faceta in facetas['ciudades']},
+            {'Bogotá': 2, 'Cali': 2},
+        )
+        precios = {faceta['desde']: faceta['productos'] for faceta in facetas['precios']}
+        self.assertEqual(precios[0], 1)
+        self.assertEqual(precios[10_000], 1)
+        self.assertEqual(precios[200_000], 0)
+
+    def test_typeahead_por_prefijo_primero_el_codigo(self):
+        Producto.objects.create(codigo='MAR-02', nombre='Taladro de banco', descripcion='Banco', precio=1)
+        self.assertEqual(
+            [producto['codigo'] for producto in typeahead_productos('ta')],
+            ['TAL-01', 'TAL-02', 'MAR-02'],
+        )
+        self.assertEqual(typeahead_productos('ta', limite=1), [{'codigo': 'TAL-01', 'nombre': 'Taladro percutor'}])
+        self.assertEqual(typeahead_productos('  '), [])
+
+    def test_formulario_no_carga_el_catalogo(self):
+        with self.assertNumQueries(0):
+            html = UbicacionForm().as_p()
+        self.assertIn('data-typeahead-url="/manejador_inventario/productos/typeahead/"', html)
+
+    def test_paginacion(self):
+        primera = search_productos(limite=3)
+        segunda = search_productos(pagina=2, limite=3)
+        self.assertTrue(primera['hay_siguiente'])
+        self.assertFalse(segunda['hay_siguiente'])
+        self.assertEqual(len(primera['productos']) + len(segunda['productos']), 4)
@@ -14,6 +14,16 @@ urlpatterns = [
     # Ruta para crear un nuevo producto
     path("productos/create/", views.producto_create, name="productoCreate"),
     
+    # Ruta para las sugerencias de productos de los formularios (API JSON)
+    path("productos/typeahead/", views.productos_typeahead, name="productosTypeahead"),
+
+    # Rutas para exportar productos y ubicaciones (NDJSON o CSV)
+    path("productos/export/", views.productos_export, name="productosExport"),
+    path("ubicaciones/export/", views.ubicaciones_export, name="ubicacionesExport"),
+
+    # Ruta para aplicar ajustes de stock en lote (API JSON)
+    path("ubicaciones/ajustes/", views.ajustes_stock, name="ajustesStock"),
+
     # Ruta para ver los detalles de una bodega específica
     path("bodegas/<str:codigo_bodega>/", views.bodega_detail, name="bodegaDetail"),
 
@@ -2,18 +2,27 @@
 Vistas para el módulo de gestión de inventario.
 Maneja bodegas, estanterías, ubicaciones y productos.
 """
+import json
+from urllib.parse import urlencode
+
 from django.shortcuts import render
 from django.contrib import messages
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, JsonResponse
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
 
 from provesi.decorators import admin_required
+from provesi.exports import export_response
+from provesi.serializers import json_response
 from .forms import BodegaForm, EstanteriaForm, UbicacionForm, ProductoForm
 from .logic.bodega_logic import get_bodegas, get_bodega_by_codigo, create_bodega
 from .logic.estanteria_logic import create_estanteria, get_estanteria_by_codigo
-from .logic.ubicacion_logic import create_ubicacion
-from .logic.producto_logic import get_productos, get_producto_by_codigo, create_producto
+from .logic.ubicacion_logic import AjusteStockError, adjust_stock_bulk, create_ubicacion
+from .logic.producto_logic import (
+    MAX_TYPEAHEAD_LIMIT, PAGE_SIZE, TYPEAHEAD_LIMIT, clean_search_params, create_producto,
+    get_producto_by_codigo, search_productos, typeahead_productos,
+)
 
 
 # ============================================================================
@@ -25,7 +34,7 @@ def bodegas_list(request):
     """Lista todas las bodegas del sistema."""
     bodegas = get_bodegas()
     context = {
-        'bodegas_list': bodegas.order_by('codigo')
+        'bodegas_list': bodegas.select_related('totales').order_by('codigo')
     }
     return render(request, 'bodegas_list.html', context)
 
@@ -48,28 +57,72 @@ def estanteria_detail(request, codigo_bodega, zona_estanteria, codigo_estanteria
     estanteria = get_estanteria_by_codigo(bodega, zona_estanteria, codigo_estanteria)
     context = {
         'estanteria': estanteria,
-        'ubicaciones': estanteria.ubicaciones.all().order_by('estanteria__zona', 'estanteria__codigo', 'codigo')
+        'ubicaciones': estanteria.ubicaciones.select_related('producto').order_by('estanteria__zona', 'estanteria__codigo', 'codigo')
     }
     return render(request, 'estanteria_detail.html', context)
 
 
 @login_required
 def productos_list(request):
-    """Lista todos los productos del sistema."""
-    productos = get_productos()
+    """
+    Lista los productos con búsqueda por texto, filtros por precio y por
+    bodega o ciudad con stock, facetas y paginación.
+    """
+    filtros = clean_search_params(request.GET)
+    resultado = search_productos(**filtros)
+
+    params = {key: valor for key, valor in filtros.items() if valor is not None and valor != '' and key != 'pagina'}
+    if params['limite'] == PAGE_SIZE:
+        del params['limite']
+    pagina = resultado['pagina']
+
+    # Enlaces de las facetas: reemplazan el filtro de su dimensión y vuelven a la primera página
+    facetas = resultado['facetas']
+    sin_ubicacion = {key: valor for key, valor in params.items() if key not in ('bodega', 'ciudad')}
+    sin_precio = {key: valor for key, valor in params.items() if key not in ('precio_min', 'precio_max')}
+    for faceta in facetas['bodegas']:
+        faceta['url'] = f"?{urlencode(dict(sin_ubicacion, bodega=faceta['codigo']))}"
+    for faceta in facetas['ciudades']:
+        faceta['url'] = f"?{urlencode(dict(sin_ubicacion, ciudad=faceta['ciudad']))}"
+    for faceta in facetas['precios']:
+        rango = {'precio_min': faceta['desde']}
+        if faceta['hasta']:
+            rango['precio_max'] = faceta['hasta'] - 1
+        faceta['url'] = f"?{urlencode(dict(sin_precio, **rango))}"
+
     context = {
-        'productos_list': productos
+        'productos_list': resultado['productos'],
+        'facetas': facetas,
+        'filtros': filtros,
+        'limpiar_ubicacion_url': f"?{urlencode(sin_ubicacion)}",
+        'limpiar_precio_url': f"?{urlencode(sin_precio)}",
+        'anterior_url': f"?{urlencode(dict(params, pagina=pagina - 1))}" if pagina > 1 else None,
+        'siguiente_url': f"?{urlencode(dict(params, pagina=pagina + 1))}" if resultado['hay_siguiente'] else None,
     }
     return render(request, 'productos_list.html', context)
 
 
+@login_required
+def productos_typeahead(request):
+    """
+    Sugerencias de productos para los campos con typeahead.
+
+    GET ?q=<prefijo>&limite=<n> -> {"resultados": [{"codigo", "nombre"}, ...]}
+    """
+    try:
+        limite = min(max(int(request.GET.get('limite', TYPEAHEAD_LIMIT)), 1), MAX_TYPEAHEAD_LIMIT)
+    except ValueError:
+        limite = TYPEAHEAD_LIMIT
+    return json_response({'resultados': typeahead_productos(request.GET.get('q'), limite)})
+
+
 @login_required
 def producto_detail(request, codigo_producto):
     """Muestra detalles de un producto y sus ubicaciones."""
     producto = get_producto_by_codigo(codigo_producto)
     context = {
         'producto': producto,
-        'ubicaciones': producto.ubicaciones.all()
+        'ubicaciones': producto.ubicaciones.select_related('estanteria__bodega')
     }
     return render(request, 'producto_detail.html', context)
 
@@ -85,11 +138,6 @@ def bodega_create(request):
         form = BodegaForm(request.POST)
         if form.is_valid():
             bodega = create_bodega(form)
-            
-            # SINCRONIZAR A MONGODB
-            from provesi.mongodb_sync import sync_bodega_to_mongo
-            sync_bodega_to_mongo(bodega)
-            
             messages.success(request, f"Bodega {bodega.codigo} creada exitosamente.")
             return HttpResponseRedirect(reverse('bodegasList'))
     else:
@@ -161,11 +209,6 @@ def producto_create(request):
         form = ProductoForm(request.POST)
         if form.is_valid():
             producto = create_producto(form)
-            
-            # SINCRONIZAR A MONGODB
-            from provesi.mongodb_sync import sync_producto_to_mongo
-            sync_producto_to_mongo(producto)
-            
             messages.success(request, f"Producto {producto.codigo} creado exitosamente.")
             return HttpResponseRedirect(reverse('productosList'))
     else:
@@ -178,3 +221,53 @@ def producto_create(request):
         'cancel_url': reverse('productosList')
     }
     return render(request, 'create_form.html', context)
+
+
+# ============================================================================
+# API DE AJUSTES DE STOCK (Requiere rol de administrador)
+# ============================================================================
+
+@admin_required
+@require_POST
+def ajustes_stock(request):
+    """
+    Aplica un lote de ajustes de stock en una sola transacción.
+
+    Cuerpo JSON: {"ajustes": [{"ubicacion": <id>, "delta": <entero>}, ...]}
+    Si algún ajuste es inválido no se aplica ninguno y se responde 400.
+    """
+    try:
+        cuerpo = json.loads(request.body)
+        ajustes = [(int(ajuste['ubicacion']), int(ajuste['delta'])) for ajuste in cuerpo['ajustes']]
+    except (ValueError, KeyError, TypeError) as e:
+        return JsonResponse({'errores': [{'error': f"Cuerpo inválido: {e}"}]}, status=400)
+
+    try:
+        resultado = adjust_stock_bulk(ajustes)
+    except AjusteStockError as e:
+        return JsonResponse({'errores': e.errores}, status=400)
+    return JsonResponse(resultado)
+
+
+# ============================================================================
+# EXPORTACIÓN (Requiere rol de administrador)
+# ============================================================================
+
+@admin_required
+def productos_export(request):
+    """
+    Exporta los productos en streaming.
+
+    Parámetros GET: formato (ndjson o csv), gzip=1, despues y hasta (rango de
+    códigos, para retomar una exportación) y chunk (filas por bloque).
+    """
+    return export_response(request, 'productos')
+
+
+@admin_required
+def ubicaciones_export(request):
+    """
+    Exporta las ubicaciones con su estantería y bodega en streaming.
+    Mismos parámetros que productos_export, con el rango por id.
+    """
+    return export_response(request, 'ubicaciones')
@@ -0,0 +1,31 @@
+from django import forms
+from django.urls import reverse_lazy
+
+
+class ProductoTypeaheadWidget(forms.TextInput):
+    """
+    Campo de texto para elegir un producto por código con sugerencias del
+    endpoint de typeahead. A diferencia del Select por defecto no consulta
+    el catálogo al renderizar: el formulario carga en tiempo constante.
+    """
+    template_name = 'widgets/producto_typeahead.html'
+    url = reverse_lazy('productosTypeahead')
+
+    class Media:
+        js = ('js/typeahead.js',)
+
+    def __init__(self, attrs=None):
+        attrs = {
+            'autocomplete': 'off',
+            'placeholder': 'Escriba el código o el nombre del producto',
+            **(attrs or {}),
+        }
+        super().__init__(attrs)
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        widget = context['widget']
+        lista = f"{widget['attrs'].get('id') or name}_opciones"
+        widget['attrs'].update({'list': lista, 'data-typeahead-url': str(self.url)})
+        widget['lista'] = lista
+        return context
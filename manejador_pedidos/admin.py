@@ -1,5 +1,29 @@
 from django.contrib import admin
-from .models import Pedido, Item
+from .models import Pedido, Item, Reserva, VentaDiariaProducto, PedidoDiarioEstado, RollupWatermark
 
 admin.site.register(Pedido)
-admin.site.register(Item)
\ No newline at end of file
+admin.site.register(Item)
+
+
+@admin.register(Reserva)
+class ReservaAdmin(admin.ModelAdmin):
+    """
+    Solo lectura: las reservas mueven Ubicacion.reservado, así que se crean y
+    cierran únicamente a través de la API de pedidos (reserva_logic).
+    """
+    list_display = ('id', 'item', 'ubicacion', 'cantidad', 'estado', 'fecha_actualizacion')
+    list_filter = ('estado',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(VentaDiariaProducto)
+admin.site.register(PedidoDiarioEstado)
+admin.site.register(RollupWatermark)
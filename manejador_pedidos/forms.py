@@ -1,4 +1,5 @@
 from django import forms
+from manejador_inventario.widgets import ProductoTypeaheadWidget
 from .models import Pedido, Item
 
 class PedidoForm(forms.ModelForm):
@@ -23,4 +24,7 @@ class ItemForm(forms.ModelForm):
         labels = {
             'producto': 'Producto',
             'cantidad': 'Cantidad',
+        }
+        widgets = {
+            'producto': ProductoTypeaheadWidget(),
         }
\ No newline at end of file
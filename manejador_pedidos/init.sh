@@ -4,4 +4,10 @@ python3 manage.py makemigrations
 
 python3 manage.py migrate
 
+python3 manage.py ensure_mongo_indexes || true
+
+python3 manage.py reconcile_stock --fix
+
+python3 manage.py rollup_ventas
+
 python3 manage.py runserver 0.0.0.0:8080
\ No newline at end of file
@@ -1,3 +1,8 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
 from ..models import Pedido
 
 def get_pedidos():
@@ -21,3 +26,129 @@ def create_pedido(form):
     pedido = form.save()
     pedido.save()
     return pedido
+
+# ============================================================================
+# PAGINACIÓN POR CURSOR
+# ============================================================================
+
+PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+# Columnas que muestra el listado de pedidos
+LIST_FIELDS = ('id', 'estado', 'metodo_pago', 'fecha_creacion', 'fecha_actualizacion')
+
+
+def encode_cursor(fecha_creacion, pedido_id):
+    """
+    Codifica la posición (fecha_creacion, id) del último pedido de una página.
+    """
+    valor = f"{fecha_creacion.isoformat()}|{pedido_id}"
+    return base64.urlsafe_b64encode(valor.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decodifica un cursor. Retorna (fecha_creacion, id) o None si es inválido.
+    """
+    if not cursor:
+        return None
+    try:
+        fecha, pedido_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+        return datetime.fromisoformat(fecha), int(pedido_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def clean_filters(estado=None, metodo_pago=None):
+    """
+    Descarta filtros que no correspondan a una opción válida del modelo.
+    """
+    estados = {valor for valor, _ in Pedido.ESTADOS}
+    metodos = {valor for valor, _ in Pedido.METODOS_PAGO}
+    return {
+        'estado': estado if estado in estados else None,
+        'metodo_pago': metodo_pago if metodo_pago in metodos else None,
+    }
+
+
+def _page_result(filas, limite):
+    """Recorta la fila extra y calcula el cursor de la página siguiente."""
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        ultima = filas[-1]
+        siguiente = encode_cursor(ultima['fecha_creacion'], ultima['id'])
+    return {'pedidos': filas, 'siguiente': siguiente}
+
+
+def get_pedidos_page(cursor=None, estado=None, metodo_pago=None, limite=PAGE_SIZE):
+    """
+    Obtiene una página de pedidos desde PostgreSQL, del más reciente al más
+    antiguo, paginando por (fecha_creacion, id) y trayendo solo las columnas
+    del listado.
+    """
+    queryset = Pedido.objects.order_by('-fecha_creacion', '-id')
+    if estado:
+        queryset = queryset.filter(estado=estado)
+    if metodo_pago:
+        queryset = queryset.filter(metodo_pago=metodo_pago)
+
+    posicion = decode_cursor(cursor)
+    if posicion:
+        fecha, pedido_id = posicion
+        queryset = queryset.filter(
+            Q(fecha_creacion__lt=fecha) | Q(fecha_creacion=fecha, id__lt=pedido_id)
+        )
+
+    filas = list(queryset.values(*LIST_FIELDS)[:limite + 1])
+    return _page_result(filas, limite)
+
+
+def get_pedidos_page_mongo(db, cursor=None, estado=None, metodo_pago=None, limite=PAGE_SIZE):
+    """
+    Obtiene una página de pedidos desde MongoDB con el mismo orden, filtros y
+    cursor que get_pedidos_page, proyectando solo las columnas del listado.
+
+    Las fechas se guardan en MongoDB como texto ISO 8601 en UTC, por lo que su
+    orden lexicográfico coincide con el cronológico.
+    """
+    filtro = {}
+    if estado:
+        filtro['estado'] = estado
+    if metodo_pago:
+        filtro['metodo_pago'] = metodo_pago
+
+    posicion = decode_cursor(cursor)
+    if posicion:
+        fecha, pedido_id = posicion
+        fecha = fecha.isoformat()
+        filtro['$or'] = [
+            {'fecha_creacion': {'$lt': fecha}},
+            {'fecha_creacion': fecha, 'postgres_id': {'$lt': pedido_id}},
+        ]
+
+    proyeccion = {
+        '_id': 0,
+        'postgres_id': 1,
+        'estado': 1,
+        'metodo_pago': 1,
+        'fecha_creacion': 1,
+        'fecha_actualizacion': 1,
+    }
+    documentos = (
+        db.pedidos.find(filtro, proyeccion)
+        .sort([('fecha_creacion', -1), ('postgres_id', -1)])
+        .limit(limite + 1)
+    )
+
+    filas = [
+        {
+            'id': documento['postgres_id'],
+            'estado': documento.get('estado'),
+            'metodo_pago': documento.get('metodo_pago'),
+            'fecha_creacion': datetime.fromisoformat(documento['fecha_creacion']),
+            'fecha_actualizacion': datetime.fromisoformat(documento['fecha_actualizacion']),
+        }
+        for documento in documentos
+    ]
+    return _page_result(filas, limite)
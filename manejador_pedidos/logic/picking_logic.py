@@ -0,0 +1,275 @@
+"""
+Planificación de olas de picking.
+
+Agrupa pedidos en olas por bodega y, para cada ola, ordena las paradas
+(ubicaciones) para minimizar el recorrido del operario: primero un
+recorrido en serpentina por las zonas y luego una mejora 2-opt.
+
+Modelo de la bodega: cada zona es un pasillo con acceso por el frente y
+por el fondo; las estanterías se suceden a lo largo del pasillo según su
+código y las ubicaciones según el suyo. Cambiar de pasillo obliga a salir
+por el frente o por el fondo. El depósito está en el frente de la primera
+zona.
+"""
+from collections import OrderedDict
+
+from django.db.models import F
+
+from manejador_inventario.models import Ubicacion
+from ..models import Item, Pedido, Reserva
+
+MAX_PEDIDOS_POR_OLA = 20
+MAX_LINEAS_POR_OLA = 200
+
+# Pedidos que se planifican como máximo cuando no se indican explícitamente
+MAX_PEDIDOS_PLAN = 2000
+
+# Costos relativos: cambiar de pasillo, subir o bajar un nivel
+ANCHO_PASILLO = 3
+COSTO_NIVEL = 1
+
+# Vecindario del 2-opt (posiciones) y pasadas máximas
+VENTANA_2OPT = 40
+PASADAS_2OPT = 4
+
+CAMPOS_UBICACION = {
+    'bodega': 'estanteria__bodega_id',
+    'zona': 'estanteria__zona',
+    'estanteria': 'estanteria__codigo',
+    'nivel': 'nivel',
+    'posicion': 'codigo',
+    'producto': 'producto_id',
+}
+
+
+# ============================================================================
+# LÍNEAS DE PICKING
+# ============================================================================
+
+def _renombrar(fila, prefijo=''):
+    return {key: fila[prefijo + campo] for key, campo in CAMPOS_UBICACION.items()}
+
+
+def get_pick_lines(pedido_ids):
+    """
+    Líneas a recoger de los pedidos: una por reserva activa y, para los
+    ítems sin reservas, una en la ubicación con más stock disponible de su
+    producto. Dos consultas en total, más una si hay ítems sin reservar.
+    """
+    lineas = []
+    for fila in (
+        Reserva.objects
+        .filter(item__pedido_id__in=pedido_ids, estado='activa')
+        .values('ubicacion_id', 'cantidad', 'item_id', 'item__pedido_id',
+                *(f'ubicacion__{campo}' for campo in CAMPOS_UBICACION.values()))
+    ):
+        linea = _renombrar(fila, 'ubicacion__')
+        linea.update(
+            ubicacion_id=fila['ubicacion_id'], cantidad=fila['cantidad'], item_id=fila['item_id'],
+            pedido_id=fila['item__pedido_id'], reservada=True,
+        )
+        lineas.append(linea)
+
+    sin_reserva = list(
+        Item.objects
+        .filter(pedido_id__in=pedido_ids)
+        .exclude(reservas__estado__in=('activa', 'confirmada'))
+        .values('id', 'pedido_id', 'producto_id', 'cantidad')
+    )
+    if sin_reserva:
+        mejores = {}
+        for fila in (
+            Ubicacion.objects
+            .filter(producto_id__in={item['producto_id'] for item in sin_reserva}, stock__gt=F('reservado'))
+            .annotate(disponible=F('stock') - F('reservado'))
+            .order_by('-disponible', 'id')
+            .values('id', *CAMPOS_UBICACION.values())
+        ):
+            mejores.setdefault(fila['producto_id'], fila)
+
+        for item in sin_reserva:
+            ubicacion = mejores.get(item['producto_id'])
+            if ubicacion is None:
+                continue
+            linea = _renombrar(ubicacion)
+            linea.update(
+                ubicacion_id=ubicacion['id'], cantidad=item['cantidad'], item_id=item['id'],
+                pedido_id=item['pedido_id'], reservada=False,
+            )
+            lineas.append(linea)
+
+    return lineas
+
+
+# ============================================================================
+# RECORRIDO
+# ============================================================================
+
+def _pasillo(zona):
+    return ord(zona.upper()) - ord('A')
+
+
+def _coordenadas(paradas):
+    """
+    Coordenadas (pasillo, posición en el pasillo, nivel) de cada parada y
+    largo de los pasillos, calculados a partir de las propias paradas.
+    """
+    ancho_estanteria = max(parada['posicion'] for parada in paradas) + 1
+    coordenadas = [
+        (_pasillo(parada['zona']), parada['estanteria'] * ancho_estanteria + parada['posicion'], parada['nivel'])
+        for parada in paradas
+    ]
+    largo = max(p for _, p, _ in coordenadas) + 1
+    return coordenadas, largo
+
+
+def _distancia_factory(largo):
+    """Distancia entre dos puntos (pasillo, posición, nivel, ...) de una bodega con pasillos de `largo`."""
+    def distancia(a, b):
+        if a[0] == b[0]:
+            recorrido = abs(a[1] - b[1])
+        else:
+            recorrido = min(a[1] + b[1], 2 * largo - a[1] - b[1]) + ANCHO_PASILLO * abs(a[0] - b[0])
+        return recorrido + COSTO_NIVEL * abs(a[2] - b[2])
+    return distancia
+
+
+def serpentine_order(coordenadas):
+    """
+    Orden en serpentina: los pasillos de menor a mayor, recorriendo uno
+    hacia el fondo y el siguiente hacia el frente.
+    Retorna los índices de las paradas en orden de visita.
+    """
+    pasillos = sorted({pasillo for pasillo, _, _ in coordenadas})
+    sentido = {pasillo: 1 if i % 2 == 0 else -1 for i, pasillo in enumerate(pasillos)}
+    return sorted(
+        range(len(coordenadas)),
+        key=lambda i: (coordenadas[i][0], sentido[coordenadas[i][0]] * coordenadas[i][1], coordenadas[i][2]),
+    )
+
+
+def two_opt(ruta, distancia, ventana=VENTANA_2OPT, pasadas=PASADAS_2OPT):
+    """
+    Mejora 2-opt acotada a un vecindario: invierte tramos de hasta
+    `ventana` paradas mientras acorten la ruta. La ruta incluye el depósito
+    al inicio y al final, que no se mueven.
+    """
+    ruta = list(ruta)
+    n = len(ruta)
+    for _ in range(pasadas):
+        mejoro = False
+        for i in range(1, n - 2):
+            a, b = ruta[i - 1], ruta[i]
+            d_ab = distancia(a, b)
+            for j in range(i + 1, min(n - 1, i + ventana)):
+                c, d = ruta[j], ruta[j + 1]
+                delta = distancia(a, c) + distancia(b, d) - d_ab - distancia(c, d)
+                if delta < 0:
+                    ruta[i:j + 1] = reversed(ruta[i:j + 1])
+                    b = ruta[i]
+                    d_ab = distancia(a, b)
+                    mejoro = True
+        if not mejoro:
+            break
+    return ruta
+
+
+def route_length(ruta, distancia):
+    return sum(distancia(ruta[k], ruta[k + 1]) for k in range(len(ruta) - 1))
+
+
+def optimize_route(paradas):
+    """
+    Ordena las paradas de una bodega para minimizar el recorrido.
+    Retorna (paradas ordenadas, distancia total incluyendo ida y vuelta al depósito).
+    """
+    if not paradas:
+        return [], 0
+    coordenadas, largo = _coordenadas(paradas)
+    distancia = _distancia_factory(largo)
+    deposito = (0, 0, 0, None)
+
+    # Cada punto lleva el índice de su parada como cuarto elemento
+    orden = serpentine_order(coordenadas)
+    ruta = two_opt([deposito] + [coordenadas[i] + (i,) for i in orden] + [deposito], distancia)
+    ordenadas = [paradas[punto[3]] for punto in ruta[1:-1]]
+    return ordenadas, route_length(ruta, distancia)
+
+
+# ============================================================================
+# OLAS
+# ============================================================================
+
+def _paradas(lineas):
+    """Agrupa las líneas por ubicación: una parada por ubicación con el detalle por pedido."""
+    paradas = OrderedDict()
+    for linea in lineas:
+        parada = paradas.get(linea['ubicacion_id'])
+        if parada is None:
+            parada = {key: linea[key] for key in CAMPOS_UBICACION}
+            parada.update(ubicacion_id=linea['ubicacion_id'], cantidad=0, detalle=[])
+            paradas[linea['ubicacion_id']] = parada
+        parada['cantidad'] += linea['cantidad']
+        parada['detalle'].append({
+            'pedido_id': linea['pedido_id'],
+            'item_id': linea['item_id'],
+            'cantidad': linea['cantidad'],
+            'reservada': linea['reservada'],
+        })
+    return list(paradas.values())
+
+
+def plan_waves(pedido_ids, max_pedidos=MAX_PEDIDOS_POR_OLA, max_lineas=MAX_LINEAS_POR_OLA):
+    """
+    Agrupa los pedidos en olas por bodega y ordena las paradas de cada ola.
+
+    Los pedidos se ordenan por la posición en serpentina de su primera línea,
+    de modo que los pedidos cercanos caen en la misma ola; cada ola tiene a
+    lo sumo `max_pedidos` pedidos y `max_lineas` líneas (un pedido con más
+    líneas que el máximo forma su propia ola).
+    """
+    lineas_por_bodega = OrderedDict()
+    for linea in get_pick_lines(pedido_ids):
+        lineas_por_bodega.setdefault(linea['bodega'], []).append(linea)
+
+    olas = []
+    for bodega, lineas in sorted(lineas_por_bodega.items()):
+        por_pedido = OrderedDict()
+        for linea in lineas:
+            por_pedido.setdefault(linea['pedido_id'], []).append(linea)
+
+        def clave(pedido_id):
+            return min(
+                (_pasillo(l['zona']), l['estanteria'], l['posicion'], l['nivel']) for l in por_pedido[pedido_id]
+            )
+
+        grupo, lineas_grupo = [], []
+        grupos = []
+        for pedido_id in sorted(por_pedido, key=clave):
+            lineas_pedido = por_pedido[pedido_id]
+            if grupo and (len(grupo) >= max_pedidos or len(lineas_grupo) + len(lineas_pedido) > max_lineas):
+                grupos.append((grupo, lineas_grupo))
+                grupo, lineas_grupo = [], []
+            grupo.append(pedido_id)
+            lineas_grupo.extend(lineas_pedido)
+        if grupo:
+            grupos.append((grupo, lineas_grupo))
+
+        for grupo, lineas_grupo in grupos:
+            paradas, distancia = optimize_route(_paradas(lineas_grupo))
+            olas.append({
+                'numero': len(olas) + 1,
+                'bodega': bodega,
+                'pedidos': grupo,
+                'lineas': len(lineas_grupo),
+                'distancia': distancia,
+                'paradas': paradas,
+            })
+    return olas
+
+
+def pending_pedido_ids(estado='pendiente', limite=MAX_PEDIDOS_PLAN):
+    """Los pedidos más antiguos en el estado dado, para planificar sin indicarlos uno a uno."""
+    return list(
+        Pedido.objects.filter(estado=estado).order_by('fecha_creacion', 'id').values_list('id', flat=True)[:limite]
+    )
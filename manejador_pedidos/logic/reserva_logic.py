@@ -0,0 +1,252 @@
+"""
+Motor de reservas de stock para los ítems de los pedidos.
+
+Cada ítem se reparte entre las ubicaciones de su producto. Las ubicaciones
+se bloquean con select_for_update(skip_locked=True), de modo que varios
+procesos pueden reservar a la vez sin esperar por las mismas filas. Si las
+libres no alcanzan, las bloqueadas se piden con nowait: nunca se espera por
+una ubicación teniendo otras bloqueadas (lo que podría provocar deadlocks);
+si alguna está ocupada, la transacción completa se reintenta con backoff.
+"""
+import random
+import time
+from collections import OrderedDict
+
+from django.db import OperationalError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from manejador_inventario.logic.stock_logic import apply_stock_changes
+from manejador_inventario.models import Ubicacion
+from ..models import Item, Reserva
+
+# Ubicaciones candidatas que se bloquean por consulta
+CANDIDATAS_POR_CONSULTA = 20
+
+# Reintentos de una reserva que encontró ubicaciones bloqueadas, y espera base (segundos)
+REINTENTOS_POR_BLOQUEO = 5
+ESPERA_BASE_BLOQUEO = 0.05
+
+# SQLSTATE de PostgreSQL: deadlock_detected y lock_not_available
+CODIGOS_CONFLICTO = ('40P01', '55P03')
+
+
+class StockInsuficiente(Exception):
+    """No hay stock disponible suficiente para reservar un ítem."""
+
+    def __init__(self, item, faltante):
+        self.item = item
+        self.faltante = faltante
+        super().__init__(f"Faltan {faltante} unidades de {item.producto_id} para el ítem {item.id}")
+
+
+class ReservaOcupada(Exception):
+    """Las ubicaciones necesarias siguieron bloqueadas por otras reservas tras los reintentos."""
+
+    def __init__(self, pedido_id):
+        self.pedido_id = pedido_id
+        super().__init__(f"Ubicaciones ocupadas por otras reservas; reintente la reserva del pedido {pedido_id}")
+
+
+def _es_conflicto_de_bloqueo(error):
+    return getattr(error.__cause__, 'pgcode', None) in CODIGOS_CONFLICTO
+
+
+def _con_reintentos(pedido_id, funcion, *args, **kwargs):
+    """
+    Ejecuta `funcion` reintentándola si choca con bloqueos de otra reserva.
+    `funcion` abre su propio atomic: dentro de una transacción del llamador
+    es un savepoint, y al revertirlo se sueltan los bloqueos que tomó.
+    """
+    for intento in range(1, REINTENTOS_POR_BLOQUEO + 1):
+        try:
+            return funcion(*args, **kwargs)
+        except OperationalError as e:
+            if not _es_conflicto_de_bloqueo(e):
+                raise
+            if intento == REINTENTOS_POR_BLOQUEO:
+                raise ReservaOcupada(pedido_id) from e
+            time.sleep(ESPERA_BASE_BLOQUEO * (2 ** (intento - 1)) * random.uniform(0.5, 1.0))
+
+
+def _candidatas(producto_id, excluir, skip_locked):
+    """
+    Ubicaciones con stock disponible del producto, bloqueadas.
+
+    Con skip_locked se saltan las que otro proceso tiene bloqueadas y se
+    prefieren las de mayor disponible, para partir el ítem en menos reservas.
+    Sin skip_locked se piden con nowait: si alguna está bloqueada se lanza
+    OperationalError en lugar de esperar.
+    """
+    orden = ('-disponible', 'id') if skip_locked else ('id',)
+    return list(
+        Ubicacion.objects
+        .select_for_update(skip_locked=skip_locked, nowait=not skip_locked)
+        .filter(producto_id=producto_id, stock__gt=F('reservado'))
+        .exclude(id__in=excluir)
+        .annotate(disponible=F('stock') - F('reservado'))
+        .order_by(*orden)
+        .only('id', 'stock', 'reservado')[:CANDIDATAS_POR_CONSULTA]
+    )
+
+
+def _asignar(item, cantidad):
+    """
+    Reparte `cantidad` del producto del ítem entre sus ubicaciones.
+    Retorna (asignaciones ubicacion_id -> cantidad, faltante).
+    """
+    asignaciones = OrderedDict()
+    restante = cantidad
+    # Primero las ubicaciones que nadie tiene bloqueadas; luego, sin esperar, las demás
+    for skip_locked in (True, False):
+        while restante > 0:
+            candidatas = _candidatas(item.producto_id, list(asignaciones), skip_locked)
+            if not candidatas:
+                break
+            for ubicacion in candidatas:
+                tomar = min(ubicacion.disponible, restante)
+                asignaciones[ubicacion.id] = tomar
+                restante -= tomar
+                if restante == 0:
+                    break
+        if restante == 0:
+            break
+    return asignaciones, restante
+
+
+def reservar_item(item, parcial=False):
+    """
+    Reserva el stock pendiente de un ítem.
+
+    Con `parcial` se reserva lo que haya disponible; si no, falta de stock
+    lanza StockInsuficiente y no se reserva nada. Si las ubicaciones siguen
+    ocupadas tras los reintentos lanza ReservaOcupada. Retorna las reservas creadas.
+    """
+    return _con_reintentos(item.pedido_id, _reservar_item, item, parcial)
+
+
+def _reservar_item(item, parcial):
+    with transaction.atomic():
+        # Serializa las reservas de un mismo ítem
+        list(Item.objects.select_for_update().filter(id=item.id).values_list('id', flat=True))
+        reservado = sum(
+            item.reservas.filter(estado__in=('activa', 'confirmada')).values_list('cantidad', flat=True)
+        )
+        pendiente = item.cantidad - reservado
+        if pendiente <= 0:
+            return []
+
+        asignaciones, faltante = _asignar(item, pendiente)
+        if faltante and not parcial:
+            raise StockInsuficiente(item, faltante)
+        if not asignaciones:
+            return []
+
+        Ubicacion.objects.bulk_update(
+            [Ubicacion(id=ubicacion_id, reservado=F('reservado') + cantidad) for ubicacion_id, cantidad in asignaciones.items()],
+            ['reservado'],
+        )
+        return Reserva.objects.bulk_create([
+            Reserva(item=item, ubicacion_id=ubicacion_id, cantidad=cantidad)
+            for ubicacion_id, cantidad in asignaciones.items()
+        ])
+
+
+def reservar_pedido(pedido_id, parcial=False):
+    """
+    Reserva todos los ítems de un pedido en una transacción, que se reintenta
+    completa si encuentra ubicaciones bloqueadas (ver reservar_item).
+    """
+    return _con_reintentos(pedido_id, _reservar_pedido, pedido_id, parcial)
+
+
+def _reservar_pedido(pedido_id, parcial):
+    with transaction.atomic():
+        items = Item.objects.filter(pedido_id=pedido_id).order_by('producto_id', 'id')
+        reservas = []
+        for item in items:
+            reservas.extend(_reservar_item(item, parcial))
+        return reservas
+
+
+def _cerrar_reservas(estado, **filtro):
+    """
+    Cierra las reservas activas que cumplen el filtro. Retorna las reservas
+    cerradas y el total cerrado por ubicación.
+    """
+    reservas = list(
+        Reserva.objects
+        .select_for_update(of=('self',))
+        .filter(estado='activa', **filtro)
+        .order_by('ubicacion_id', 'id')
+    )
+    por_ubicacion = OrderedDict()
+    for reserva in reservas:
+        por_ubicacion[reserva.ubicacion_id] = por_ubicacion.get(reserva.ubicacion_id, 0) + reserva.cantidad
+        reserva.estado = estado
+        reserva.fecha_actualizacion = timezone.now()
+    Reserva.objects.bulk_update(reservas, ['estado', 'fecha_actualizacion'])
+    return reservas, por_ubicacion
+
+
+def _liberar(**filtro):
+    with transaction.atomic():
+        reservas, por_ubicacion = _cerrar_reservas('liberada', **filtro)
+        Ubicacion.objects.bulk_update(
+            [Ubicacion(id=ubicacion_id, reservado=F('reservado') - cantidad) for ubicacion_id, cantidad in por_ubicacion.items()],
+            ['reservado'],
+        )
+        return reservas
+
+
+def liberar_reservas(pedido_id):
+    """Devuelve al disponible el stock reservado por un pedido. Retorna las reservas liberadas."""
+    return _liberar(item__pedido_id=pedido_id)
+
+
+def liberar_reservas_item(item_id):
+    """
+    Devuelve al disponible el stock reservado por un ítem. Se llama antes de
+    borrar el ítem (o su pedido), porque las reservas se borran en cascada.
+    """
+    return _liberar(item_id=item_id)
+
+
+def confirmar_reservas(pedido_id):
+    """
+    Descuenta del stock lo reservado por un pedido (el pedido sale de bodega).
+    Retorna las reservas confirmadas.
+    """
+    from provesi.unit_of_work import mark_dirty, sync_scope
+
+    with sync_scope(), transaction.atomic():
+        reservas, por_ubicacion = _cerrar_reservas('confirmada', item__pedido_id=pedido_id)
+        ahora = timezone.now()
+        Ubicacion.objects.bulk_update(
+            [
+                Ubicacion(
+                    id=ubicacion_id,
+                    stock=F('stock') - cantidad,
+                    reservado=F('reservado') - cantidad,
+                    fecha_actualizacion=ahora,
+                )
+                for ubicacion_id, cantidad in por_ubicacion.items()
+            ],
+            ['stock', 'reservado', 'fecha_actualizacion'],
+        )
+
+        # bulk_update no dispara signals: actualizar agregados y sincronizar el stock descontado
+        ubicaciones = list(
+            Ubicacion.objects.filter(id__in=list(por_ubicacion))
+            .values_list('id', 'producto_id', 'estanteria__bodega_id')
+        )
+        apply_stock_changes([
+            (producto_id, bodega_id, -por_ubicacion[ubicacion_id], 0)
+            for ubicacion_id, producto_id, bodega_id in ubicaciones
+        ])
+        for producto_id in {producto_id for _, producto_id, _ in ubicaciones}:
+            if producto_id:
+                mark_dirty('producto', producto_id)
+        for ubicacion_id, cantidad in por_ubicacion.items():
+            mark_dirty('ubicacion', ubicacion_id, payload={'delta_stock': -cantidad})
+        return reservas
@@ -0,0 +1,334 @@
+"""
+Rollups de ventas: unidades e ingresos por día, producto y estado
+(VentaDiariaProducto) y pedidos por día y estado (PedidoDiarioEstado).
+
+Los signals de Pedido e Item aplican incrementos F() en la misma
+transacción que el cambio. catch_up() recalcula los días de los pedidos
+cuya fecha_actualizacion avanzó desde la última marca de agua: cubre los
+save() y los cambios de ítems, pero no QuerySet.update() (salvo que asigne
+fecha_actualizacion), Item.objects.bulk_create ni los cambios de precio de
+un producto, que no tocan esa fecha. Después de esas escrituras hay que
+ejecutar backfill() sobre los días afectados (rollup_ventas --backfill).
+Los ingresos se valoran con el precio actual del producto.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from manejador_inventario.models import Producto
+from ..models import Item, Pedido, PedidoDiarioEstado, RollupWatermark, VentaDiariaProducto
+
+WATERMARK = 'ventas'
+
+# Margen hacia atrás de cada catch-up, para incluir transacciones que
+# confirmaron con una fecha_actualizacion anterior a la marca
+SOLAPE = timedelta(minutes=5)
+
+# Días recalculados por transacción en backfill()
+DIAS_POR_LOTE = 31
+
+AGRUPACIONES = ('dia', 'producto', 'estado')
+
+
+def dia(fecha_hora):
+    """Día local de una fecha de creación."""
+    return timezone.localdate(fecha_hora)
+
+
+# ============================================================================
+# INCREMENTOS
+# ============================================================================
+
+def _aplicar(modelo, campos_clave, deltas):
+    """
+    Suma los deltas a las filas del rollup en orden de clave, creando antes
+    las que falten. deltas: clave -> {campo: delta}.
+    """
+    if not deltas:
+        return
+    modelo.objects.bulk_create(
+        [modelo(**dict(zip(campos_clave, key))) for key in deltas],
+        ignore_conflicts=True,
+    )
+    for key in sorted(deltas):
+        cambios = {campo: F(campo) + delta for campo, delta in deltas[key].items() if delta}
+        if cambios:
+            modelo.objects.filter(**dict(zip(campos_clave, key))).update(**cambios)
+
+
+def _sumar(destino, key, **deltas):
+    actual = destino.setdefault(key, {})
+    for campo, delta in deltas.items():
+        actual[campo] = actual.get(campo, 0) + delta
+
+
+def apply_rollup_changes(lineas=(), pedidos=()):
+    """
+    Aplica cambios a los rollups.
+
+    lineas: iterable de (fecha, producto_id, estado, delta_unidades, delta_ingresos, delta_lineas).
+    pedidos: iterable de (fecha, estado, delta_pedidos).
+    Las líneas también suman sus unidades e ingresos a PedidoDiarioEstado.
+    """
+    ventas, por_estado = {}, {}
+    for fecha, producto_id, estado, unidades, ingresos, num_lineas in lineas:
+        _sumar(ventas, (fecha, producto_id, estado), unidades=unidades, ingresos=ingresos, lineas=num_lineas)
+        _sumar(por_estado, (fecha, estado), unidades=unidades, ingresos=ingresos)
+    for fecha, estado, num_pedidos in pedidos:
+        _sumar(por_estado, (fecha, estado), pedidos=num_pedidos)
+
+    with transaction.atomic():
+        _aplicar(VentaDiariaProducto, ('fecha', 'producto_id', 'estado'), ventas)
+        _aplicar(PedidoDiarioEstado, ('fecha', 'estado'), por_estado)
+
+
+def _lineas_de_pedido(pedido_id, fecha, estado, signo):
+    """Las líneas de un pedido agrupadas por producto, con el signo indicado."""
+    filas = (
+        Item.objects.filter(pedido_id=pedido_id)
+        .values('producto_id')
+        .annotate(unidades=Sum('cantidad'), ingresos=Sum(F('cantidad') * F('producto__precio')), lineas=Count('id'))
+        .order_by()
+    )
+    return [
+        (fecha, fila['producto_id'], estado, signo * fila['unidades'], signo * fila['ingresos'], signo * fila['lineas'])
+        for fila in filas
+    ]
+
+
+def on_pedido_saved(pedido, created):
+    if created:
+        apply_rollup_changes(pedidos=[(dia(pedido.fecha_creacion), pedido.estado, 1)])
+    else:
+        original = getattr(pedido, '_rollup_original', None)
+        if original is None or None in original:
+            # Estado anterior desconocido: recalcular el día
+            recompute_days([dia(pedido.fecha_creacion)])
+        else:
+            fecha_original, estado_original = original
+            if (dia(fecha_original), estado_original) != (dia(pedido.fecha_creacion), pedido.estado):
+                fecha = dia(pedido.fecha_creacion)
+                anterior = dia(fecha_original)
+                apply_rollup_changes(
+                    lineas=(
+                        _lineas_de_pedido(pedido.id, anterior, estado_original, -1)
+                        + _lineas_de_pedido(pedido.id, fecha, pedido.estado, 1)
+                    ),
+                    pedidos=[(anterior, estado_original, -1), (fecha, pedido.estado, 1)],
+                )
+    pedido._rollup_original = (pedido.fecha_creacion, pedido.estado)
+
+
+def on_pedido_deleted(pedido):
+    apply_rollup_changes(pedidos=[(dia(pedido.fecha_creacion), pedido.estado, -1)])
+
+
+def _linea(pedido_id, producto_id, cantidad, signo, pedidos, precios):
+    fecha_creacion, estado = pedidos[pedido_id]
+    return (
+        dia(fecha_creacion), producto_id, estado,
+        signo * cantidad, signo * cantidad * precios.get(producto_id, 0), signo,
+    )
+
+
+def on_item_saved(item, created):
+    original = None if created else getattr(item, '_rollup_original', None)
+    if not created and (original is None or None in original):
+        pedido = Pedido.objects.filter(id=item.pedido_id).values_list('fecha_creacion', flat=True).first()
+        if pedido is not None:
+            recompute_days([dia(pedido)])
+    else:
+        actual = (item.pedido_id, item.producto_id, item.cantidad)
+        if actual != original:
+            cambios = [actual + (1,)]
+            if original is not None:
+                cambios.append(original + (-1,))
+            pedidos = {
+                pk: (fecha, estado)
+                for pk, fecha, estado in Pedido.objects.filter(id__in={c[0] for c in cambios})
+                .values_list('id', 'fecha_creacion', 'estado')
+            }
+            precios = dict(Producto.objects.filter(codigo__in={c[1] for c in cambios}).values_list('codigo', 'precio'))
+            apply_rollup_changes(lineas=[
+                _linea(pedido_id, producto_id, cantidad, signo, pedidos, precios)
+                for pedido_id, producto_id, cantidad, signo in cambios
+                if pedido_id in pedidos
+            ])
+    item._rollup_original = (item.pedido_id, item.producto_id, item.cantidad)
+    # Los cambios de ítems cuentan como actualización del pedido para catch_up()
+    Pedido.objects.filter(id=item.pedido_id).update(fecha_actualizacion=timezone.now())
+
+
+def on_item_deleted(item):
+    original = getattr(item, '_rollup_original', None)
+    pedido_id, producto_id, cantidad = (
+        original if original and None not in original else (item.pedido_id, item.producto_id, item.cantidad)
+    )
+    pedidos = {
+        pk: (fecha, estado)
+        for pk, fecha, estado in Pedido.objects.filter(id=pedido_id).values_list('id', 'fecha_creacion', 'estado')
+    }
+    if not pedidos:
+        return
+    precios = dict(Producto.objects.filter(codigo=producto_id).values_list('codigo', 'precio'))
+    apply_rollup_changes(lineas=[_linea(pedido_id, producto_id, cantidad, -1, pedidos, precios)])
+
+
+# ============================================================================
+# RECÁLCULO
+# ============================================================================
+
+def _rango_del_dia(fecha):
+    """Inicio y fin (exclusivo) de un día local, como fechas con zona horaria."""
+    inicio = timezone.make_aware(datetime.combine(fecha, time.min))
+    return inicio, timezone.make_aware(datetime.combine(fecha + timedelta(days=1), time.min))
+
+
+def _filtro_dias(fechas, campo='fecha_creacion'):
+    """Q con un rango por día, para usar el índice de fecha_creacion."""
+    filtro = Q(pk__in=[])
+    for fecha in fechas:
+        inicio, fin = _rango_del_dia(fecha)
+        filtro |= Q(**{f'{campo}__gte': inicio, f'{campo}__lt': fin})
+    return filtro
+
+
+def recompute_days(fechas):
+    """
+    Recalcula los rollups de los días indicados desde los pedidos e ítems.
+    Retorna el número de filas escritas.
+    """
+    fechas = sorted(set(fechas))
+    if not fechas:
+        return 0
+
+    with transaction.atomic():
+        # Bloquea las filas existentes para serializar con los signals
+        list(VentaDiariaProducto.objects.select_for_update().filter(fecha__in=fechas).values_list('id', flat=True))
+        list(PedidoDiarioEstado.objects.select_for_update().filter(fecha__in=fechas).values_list('id', flat=True))
+
+        pedidos = {
+            (fila['fecha'], fila['estado']): PedidoDiarioEstado(
+                fecha=fila['fecha'], estado=fila['estado'], pedidos=fila['pedidos'],
+            )
+            for fila in (
+                Pedido.objects.filter(_filtro_dias(fechas))
+                .annotate(fecha=TruncDate('fecha_creacion'))
+                .values('fecha', 'estado')
+                .annotate(pedidos=Count('id'))
+                .order_by()
+            )
+        }
+        ventas = []
+        for fila in (
+            Item.objects.filter(_filtro_dias(fechas, 'pedido__fecha_creacion'))
+            .annotate(fecha=TruncDate('pedido__fecha_creacion'))
+            .values('fecha', 'producto_id', 'pedido__estado')
+            .annotate(unidades=Sum('cantidad'), ingresos=Sum(F('cantidad') * F('producto__precio')), lineas=Count('id'))
+            .order_by()
+        ):
+            ventas.append(VentaDiariaProducto(
+                fecha=fila['fecha'], producto_id=fila['producto_id'], estado=fila['pedido__estado'],
+                unidades=fila['unidades'], ingresos=fila['ingresos'], lineas=fila['lineas'],
+            ))
+            por_estado = pedidos.setdefault(
+                (fila['fecha'], fila['pedido__estado']),
+                PedidoDiarioEstado(fecha=fila['fecha'], estado=fila['pedido__estado']),
+            )
+            por_estado.unidades += fila['unidades']
+            por_estado.ingresos += fila['ingresos']
+
+        VentaDiariaProducto.objects.filter(fecha__in=fechas).delete()
+        PedidoDiarioEstado.objects.filter(fecha__in=fechas).delete()
+        VentaDiariaProducto.objects.bulk_create(ventas)
+        PedidoDiarioEstado.objects.bulk_create(pedidos.values())
+        return len(ventas) + len(pedidos)
+
+
+def backfill(desde=None, hasta=None, dias_por_lote=DIAS_POR_LOTE, progress=None):
+    """
+    Recalcula todos los días entre `desde` y `hasta` (por defecto, del primer
+    al último pedido), `dias_por_lote` días por transacción. `progress`
+    recibe (último día recalculado, filas escritas) después de cada lote.
+    Retorna el número de días recalculados.
+    """
+    if desde is None or hasta is None:
+        rango = Pedido.objects.aggregate(primero=Min('fecha_creacion'), ultimo=Max('fecha_creacion'))
+        if rango['primero'] is None:
+            return 0
+        desde = desde or dia(rango['primero'])
+        hasta = hasta or dia(rango['ultimo'])
+
+    dias = 0
+    fecha = desde
+    while fecha <= hasta:
+        lote = [fecha + timedelta(days=i) for i in range(dias_por_lote) if fecha + timedelta(days=i) <= hasta]
+        filas = recompute_days(lote)
+        dias += len(lote)
+        fecha = lote[-1] + timedelta(days=1)
+        if progress:
+            progress(lote[-1], filas)
+    return dias
+
+
+def catch_up():
+    """
+    Recalcula los días de los pedidos con fecha_actualizacion posterior a la
+    marca de agua (menos SOLAPE) y la avanza. Sin marca de agua hace un
+    backfill completo. Las escrituras que no actualizan fecha_actualizacion
+    no se detectan: ver el docstring del módulo.
+    Retorna {'dias': días recalculados, 'watermark': nueva marca}.
+    """
+    nueva_marca = timezone.now()
+    marca = RollupWatermark.objects.filter(nombre=WATERMARK).values_list('valor', flat=True).first()
+
+    if marca is None:
+        dias = backfill()
+    else:
+        fechas = {
+            dia(fecha)
+            for fecha in Pedido.objects.filter(fecha_actualizacion__gt=marca - SOLAPE)
+            .values_list('fecha_creacion', flat=True).iterator()
+        }
+        recompute_days(fechas)
+        dias = len(fechas)
+
+    RollupWatermark.objects.update_or_create(nombre=WATERMARK, defaults={'valor': nueva_marca})
+    return {'dias': dias, 'watermark': nueva_marca}
+
+
+# ============================================================================
+# REPORTES
+# ============================================================================
+
+def sales_report(desde, hasta, por='dia', producto=None, estado=None):
+    """
+    Totales entre `desde` y `hasta` (días, inclusive) leídos de los rollups.
+
+    por: 'dia', 'producto' o 'estado'. Con `producto` se limita a ese
+    producto y se usa VentaDiariaProducto; sin él, los totales por día o
+    estado salen de PedidoDiarioEstado e incluyen el número de pedidos.
+    """
+    if por not in AGRUPACIONES:
+        raise ValueError(f"Agrupación desconocida: {por}")
+
+    if producto or por == 'producto':
+        queryset = VentaDiariaProducto.objects.filter(fecha__gte=desde, fecha__lte=hasta)
+        if producto:
+            queryset = queryset.filter(producto_id=producto)
+        campos = {'unidades': Sum('unidades'), 'ingresos': Sum('ingresos'), 'lineas': Sum('lineas')}
+    else:
+        queryset = PedidoDiarioEstado.objects.filter(fecha__gte=desde, fecha__lte=hasta)
+        campos = {'pedidos': Sum('pedidos'), 'unidades': Sum('unidades'), 'ingresos': Sum('ingresos')}
+    if estado:
+        queryset = queryset.filter(estado=estado)
+
+    grupo = {'dia': 'fecha', 'producto': 'producto_id', 'estado': 'estado'}[por]
+    filas = queryset.values(grupo).annotate(**campos).order_by(grupo)
+    return [
+        {por: fila[grupo], **{campo: fila[campo] or 0 for campo in campos}}
+        for fila in filas
+    ]
@@ -0,0 +1,143 @@
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from manejador_inventario.models import Bodega, Estanteria, Producto, Ubicacion
+from manejador_pedidos.logic.reserva_logic import ReservaOcupada, StockInsuficiente, reservar_pedido
+from manejador_pedidos.logic.rollup_logic import dia, recompute_days
+from manejador_pedidos.models import Item, Pedido
+
+BODEGA = 'BNCH0'
+PREFIJO = 'BENCH-'
+
+
+class Command(BaseCommand):
+    help = 'Mide cuántos pedidos por segundo reserva el motor de reservas según el número de workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', default='1,2,4,8', help='Números de workers a probar, separados por coma')
+        parser.add_argument('--pedidos', type=int, default=200, help='Pedidos a reservar por worker')
+        parser.add_argument('--productos', type=int, default=20, help='Productos distintos (menos productos = más contención)')
+        parser.add_argument('--ubicaciones', type=int, default=10, help='Ubicaciones por producto')
+        parser.add_argument('--items', type=int, default=3, help='Ítems por pedido')
+
+    def handle(self, *args, **options):
+        try:
+            workers = [int(n) for n in options['workers'].split(',')]
+        except ValueError:
+            raise CommandError('--workers debe ser una lista de enteros, por ejemplo 1,2,4,8')
+
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING(
+                f'⚠️  {connection.vendor} no soporta SKIP LOCKED: los resultados no son representativos'
+            ))
+        if Bodega.objects.filter(codigo=BODEGA).exists():
+            raise CommandError(f'La bodega {BODEGA} ya existe; elimínela antes de correr el benchmark')
+
+        productos = self._crear_inventario(options['productos'], options['ubicaciones'])
+        pedidos_creados = []
+        try:
+            self.stdout.write(
+                f'{"workers":>8} {"pedidos/s":>10} {"reservas/s":>11} '
+                f'{"sin stock":>10} {"ocupadas":>9} {"errores":>8}'
+            )
+            for n in workers:
+                pedidos = self._crear_pedidos(n * options['pedidos'], productos, options['items'])
+                pedidos_creados.extend(pedidos)
+                resultado = self._medir(n, pedidos)
+                self.stdout.write(
+                    f'{n:>8} {resultado["pedidos_s"]:>10.1f} {resultado["reservas_s"]:>11.1f} '
+                    f'{resultado["sin_stock"]:>10} {resultado["ocupadas"]:>9} {resultado["errores"]:>8}'
+                )
+        finally:
+            self._limpiar(pedidos_creados, productos)
+
+    def _crear_inventario(self, num_productos, ubicaciones_por_producto):
+        """Crea el inventario de prueba con bulk_create, sin pasar por el outbox."""
+        bodega = Bodega.objects.create(codigo=BODEGA, ciudad='Benchmark', direccion='Benchmark')
+        estanteria = Estanteria.objects.create(bodega=bodega, zona='Z', codigo=1, niveles=ubicaciones_por_producto)
+        productos = Producto.objects.bulk_create([
+            Producto(codigo=f'{PREFIJO}{i}', nombre=f'Benchmark {i}', descripcion='Benchmark', precio=1)
+            for i in range(num_productos)
+        ])
+        Ubicacion.objects.bulk_create([
+            Ubicacion(
+                estanteria=estanteria, producto=producto, nivel=nivel, codigo=i,
+                capacidad=1_000_000, stock=1_000_000,
+            )
+            for i, producto in enumerate(productos)
+            for nivel in range(ubicaciones_por_producto)
+        ])
+        return productos
+
+    def _crear_pedidos(self, cantidad, productos, items_por_pedido):
+        pedidos = Pedido.objects.bulk_create([Pedido() for _ in range(cantidad)])
+        Item.objects.bulk_create([
+            Item(pedido=pedido, producto=producto, cantidad=random.randint(1, 5))
+            for pedido in pedidos
+            for producto in random.sample(productos, min(items_por_pedido, len(productos)))
+        ])
+        return pedidos
+
+    def _medir(self, num_workers, pedidos):
+        contadores = {'pedidos': 0, 'reservas': 0, 'sin_stock': 0, 'ocupadas': 0, 'errores': 0}
+        lock = threading.Lock()
+
+        def worker(lote):
+            locales = {'pedidos': 0, 'reservas': 0, 'sin_stock': 0, 'ocupadas': 0, 'errores': 0}
+            try:
+                for pedido in lote:
+                    try:
+                        locales['reservas'] += len(reservar_pedido(pedido.id))
+                        locales['pedidos'] += 1
+                    except StockInsuficiente:
+                        locales['sin_stock'] += 1
+                    except ReservaOcupada:
+                        locales['ocupadas'] += 1
+                    except Exception:
+                        locales['errores'] += 1
+            finally:
+                connection.close()
+                with lock:
+                    for key, valor in locales.items():
+                        contadores[key] += valor
+
+        lotes = [pedidos[i::num_workers] for i in range(num_workers)]
+        hilos = [threading.Thread(target=worker, args=(lote,)) for lote in lotes]
+        inicio = time.monotonic()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.monotonic() - inicio
+
+        return {
+            'pedidos_s': contadores['pedidos'] / duracion,
+            'reservas_s': contadores['reservas'] / duracion,
+            'sin_stock': contadores['sin_stock'],
+            'ocupadas': contadores['ocupadas'],
+            'errores': contadores['errores'],
+        }
+
+    def _limpiar(self, pedidos, productos):
+        """
+        Elimina los datos de prueba y las entradas de outbox que generan los
+        signals al borrarlos, y recalcula los rollups de los días afectados.
+        """
+        from provesi.models import SyncOutbox
+
+        pedido_ids = [pedido.id for pedido in pedidos]
+        codigos = [producto.codigo for producto in productos]
+        with transaction.atomic():
+            Pedido.objects.filter(id__in=pedido_ids).delete()
+            Bodega.objects.filter(codigo=BODEGA).delete()
+            Producto.objects.filter(codigo__in=codigos).delete()
+            SyncOutbox.objects.filter(entidad='pedido', clave__in=[str(i) for i in pedido_ids]).delete()
+            SyncOutbox.objects.filter(entidad='producto', clave__in=codigos).delete()
+            SyncOutbox.objects.filter(entidad='bodega', clave=BODEGA).delete()
+            # Los pedidos se crearon con bulk_create, sin pasar por los rollups
+            recompute_days({dia(pedido.fecha_creacion) for pedido in pedidos})
+        self.stdout.write(self.style.SUCCESS('✅ Datos del benchmark eliminados'))
@@ -0,0 +1,51 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from manejador_pedidos.logic.picking_logic import (
+    MAX_LINEAS_POR_OLA, MAX_PEDIDOS_POR_OLA, MAX_PEDIDOS_PLAN, pending_pedido_ids, plan_waves,
+)
+
+
+class Command(BaseCommand):
+    help = 'Agrupa pedidos en olas de picking y muestra el recorrido de cada ola'
+
+    def add_arguments(self, parser):
+        parser.add_argument('pedidos', nargs='*', type=int, help='Ids de los pedidos (por defecto, los pendientes)')
+        parser.add_argument('--estado', default='pendiente', help='Estado de los pedidos a planificar si no se indican ids')
+        parser.add_argument('--limite', type=int, default=MAX_PEDIDOS_PLAN, help='Máximo de pedidos a planificar')
+        parser.add_argument('--max-pedidos', type=int, default=MAX_PEDIDOS_POR_OLA, help='Pedidos por ola')
+        parser.add_argument('--max-lineas', type=int, default=MAX_LINEAS_POR_OLA, help='Líneas por ola')
+        parser.add_argument('--json', action='store_true', help='Imprimir el plan completo en JSON')
+
+    def handle(self, *args, **options):
+        pedido_ids = options['pedidos'] or pending_pedido_ids(options['estado'], options['limite'])
+        if not pedido_ids:
+            self.stdout.write(self.style.WARNING('⚠️  No hay pedidos para planificar'))
+            return
+
+        inicio = time.monotonic()
+        olas = plan_waves(pedido_ids, max_pedidos=options['max_pedidos'], max_lineas=options['max_lineas'])
+        duracion = time.monotonic() - inicio
+
+        if options['json']:
+            self.stdout.write(json.dumps(olas, indent=2))
+            return
+
+        for ola in olas:
+            self.stdout.write(
+                f"🌊 Ola {ola['numero']} - bodega {ola['bodega']}: {len(ola['pedidos'])} pedidos, "
+                f"{ola['lineas']} líneas, {len(ola['paradas'])} paradas, distancia {ola['distancia']}"
+            )
+            for orden, parada in enumerate(ola['paradas'], start=1):
+                pedidos = ', '.join(str(detalle['pedido_id']) for detalle in parada['detalle'])
+                self.stdout.write(
+                    f"   {orden:>4}. {parada['zona']}{parada['estanteria']}-{parada['nivel']}-{parada['posicion']} "
+                    f"{parada['producto']} x{parada['cantidad']} (pedidos {pedidos})"
+                )
+
+        lineas = sum(ola['lineas'] for ola in olas)
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {len(olas)} olas, {lineas} líneas planificadas en {duracion * 1000:.0f} ms'
+        ))
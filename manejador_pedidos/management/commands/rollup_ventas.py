@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from manejador_pedidos.logic.rollup_logic import DIAS_POR_LOTE, backfill, catch_up
+
+
+class Command(BaseCommand):
+    help = (
+        'Actualiza los rollups de ventas desde la marca de agua o los recalcula por rango de días. '
+        'La marca de agua solo ve pedidos con fecha_actualizacion nueva: después de update() masivos, '
+        'bulk_create de ítems o cambios de precio use --backfill con el rango afectado'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true', help='Recalcular un rango de días completo')
+        parser.add_argument('--desde', help='Primer día del backfill (AAAA-MM-DD; por defecto, el del primer pedido)')
+        parser.add_argument('--hasta', help='Último día del backfill (AAAA-MM-DD; por defecto, el del último pedido)')
+        parser.add_argument('--dias-por-lote', type=int, default=DIAS_POR_LOTE, help='Días por transacción')
+
+    def _fecha(self, valor, nombre):
+        if valor is None:
+            return None
+        try:
+            fecha = parse_date(valor)
+        except ValueError:
+            fecha = None
+        if fecha is None:
+            raise CommandError(f'--{nombre} debe tener el formato AAAA-MM-DD')
+        return fecha
+
+    def handle(self, *args, **options):
+        if not options['backfill']:
+            resultado = catch_up()
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {resultado['dias']} días recalculados; marca de agua en {resultado['watermark'].isoformat()}"
+            ))
+            return
+
+        def progress(fecha, filas):
+            self.stdout.write(f'   … hasta {fecha.isoformat()}: {filas} filas')
+
+        dias = backfill(
+            desde=self._fecha(options['desde'], 'desde'),
+            hasta=self._fecha(options['hasta'], 'hasta'),
+            dias_por_lote=options['dias_por_lote'],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(f'✅ {dias} días recalculados'))
@@ -1,5 +1,5 @@
 from django.db import models
-from manejador_inventario.models import Producto
+from manejador_inventario.models import Producto, Ubicacion
 
 class Pedido(models.Model):
     """
@@ -46,10 +46,30 @@ class Pedido(models.Model):
         help_text="Fecha y hora de la última actualización del pedido."
     )
 
+    class Meta:
+        indexes = [
+            # Listado paginado por cursor, con y sin filtros
+            models.Index(fields=['-fecha_creacion', '-id'], name='pedido_fecha_id_idx'),
+            models.Index(fields=['estado', '-fecha_creacion', '-id'], name='pedido_estado_fecha_idx'),
+            models.Index(fields=['metodo_pago', '-fecha_creacion', '-id'], name='pedido_pago_fecha_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Guarda el estado y la fecha leídos de la base de datos, para mover los
+        totales de los rollups si el pedido cambia de estado.
+        """
+        instance = super().from_db(db, field_names, values)
+        cargados = dict(zip(field_names, values))
+        instance._rollup_original = (cargados.get('fecha_creacion'), cargados.get('estado'))
+        return instance
+
     def __str__(self):
         return f"Pedido {self.id} - {self.estado}"
     
     def toJson(self):
+        """Un pedido; para querysets usar provesi.serializers.PEDIDO."""
         return {
             'id': self.id,
             'estado': self.estado,
@@ -82,51 +102,287 @@ class Item(models.Model):
         help_text="Cantidad del producto en el ítem."
     )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Guarda el pedido, producto y cantidad leídos, para calcular los deltas de los rollups."""
+        instance = super().from_db(db, field_names, values)
+        cargados = dict(zip(field_names, values))
+        instance._rollup_original = (cargados.get('pedido_id'), cargados.get('producto_id'), cargados.get('cantidad'))
+        return instance
+
     def __str__(self):
         return f"Item {self.id} - {self.producto} (x{self.cantidad})"
     
     def toJson(self):
+        """Un ítem; para querysets usar provesi.serializers.ITEM."""
         return {
             'id': self.id,
-            'pedido_id': self.pedido.id,
-            'producto': self.producto,
+            'pedido_id': self.pedido_id,
+            'producto': self.producto_id,
             'cantidad': self.cantidad,
         }
 
+def proteger_reservas_activas(collector, field, sub_objs, using):
+    """
+    on_delete de Reserva.ubicacion: una ubicación con reservas activas no se
+    puede borrar (su stock está comprometido con un pedido). Las reservas ya
+    confirmadas o liberadas son historial y se borran en cascada.
+    """
+    activas = sub_objs.filter(estado='activa')
+    if activas:
+        raise models.ProtectedError(
+            f"No se puede borrar {field.remote_field.model.__name__}: tiene reservas activas "
+            f"a través de '{sub_objs.model.__name__}.{field.name}'",
+            activas,
+        )
+    models.CASCADE(collector, field, sub_objs, using)
+
+
+class Reserva(models.Model):
+    """
+    Modelo que representa stock de una ubicación apartado para un ítem de pedido.
+
+    Mientras está activa, su cantidad cuenta en Ubicacion.reservado. Al
+    confirmarse se descuenta del stock; al liberarse vuelve a estar disponible.
+    """
+
+    ESTADOS = [
+        ('activa', 'Activa'),
+        ('confirmada', 'Confirmada'),
+        ('liberada', 'Liberada'),
+    ]
+
+    item = models.ForeignKey(
+        Item,
+        related_name='reservas',
+        on_delete=models.CASCADE,
+        help_text="Ítem del pedido para el que se aparta el stock."
+    )
+
+    ubicacion = models.ForeignKey(
+        Ubicacion,
+        related_name='reservas',
+        on_delete=proteger_reservas_activas,
+        help_text="Ubicación de donde se toma el stock."
+    )
+
+    cantidad = models.PositiveIntegerField(
+        help_text="Cantidad apartada en la ubicación."
+    )
+
+    estado = models.CharField(
+        max_length=20,
+        choices=ESTADOS,
+        default='activa',
+        help_text="Estado actual de la reserva."
+    )
+
+    fecha_creacion = models.DateTimeField(
+        auto_now_add=True,
+        help_text="Fecha y hora en que se creó la reserva."
+    )
+
+    fecha_actualizacion = models.DateTimeField(
+        auto_now=True,
+        help_text="Fecha y hora del último cambio de estado."
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['item', 'estado'], name='reserva_item_estado_idx'),
+        ]
+
+    def __str__(self):
+        return f"Reserva {self.id} - Item {self.item_id} ({self.cantidad} en ubicación {self.ubicacion_id})"
+
+
+# ============================================
+# ROLLUPS DE VENTAS
+# ============================================
+
+class VentaDiariaProducto(models.Model):
+    """
+    Unidades e ingresos vendidos por día de creación del pedido, producto y
+    estado del pedido. Se mantiene desde los signals de Pedido e Item.
+    """
+    fecha = models.DateField(
+        help_text="Día de creación de los pedidos (zona horaria local)."
+    )
+
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='ventas_diarias',
+        help_text="Producto vendido."
+    )
+
+    estado = models.CharField(
+        max_length=20,
+        choices=Pedido.ESTADOS,
+        help_text="Estado de los pedidos."
+    )
+
+    unidades = models.IntegerField(
+        default=0,
+        help_text="Unidades del producto en los ítems."
+    )
+
+    ingresos = models.BigIntegerField(
+        default=0,
+        help_text="Unidades por precio del producto (COP)."
+    )
+
+    lineas = models.IntegerField(
+        default=0,
+        help_text="Número de ítems."
+    )
+
+    class Meta:
+        unique_together = ('fecha', 'producto', 'estado')
+        indexes = [
+            models.Index(fields=['producto', 'fecha'], name='venta_producto_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"Ventas de {self.producto_id} el {self.fecha} ({self.estado}): {self.unidades}"
+
+
+class PedidoDiarioEstado(models.Model):
+    """
+    Pedidos, unidades e ingresos por día de creación y estado del pedido.
+    """
+    fecha = models.DateField(
+        help_text="Día de creación de los pedidos (zona horaria local)."
+    )
+
+    estado = models.CharField(
+        max_length=20,
+        choices=Pedido.ESTADOS,
+        help_text="Estado de los pedidos."
+    )
+
+    pedidos = models.IntegerField(
+        default=0,
+        help_text="Número de pedidos."
+    )
+
+    unidades = models.IntegerField(
+        default=0,
+        help_text="Unidades en los ítems de los pedidos."
+    )
+
+    ingresos = models.BigIntegerField(
+        default=0,
+        help_text="Unidades por precio del producto (COP)."
+    )
+
+    class Meta:
+        unique_together = ('fecha', 'estado')
+
+    def __str__(self):
+        return f"Pedidos del {self.fecha} ({self.estado}): {self.pedidos}"
+
+
+class RollupWatermark(models.Model):
+    """
+    Marca de agua de un trabajo de rollups: los pedidos actualizados después
+    de `valor` aún no se han recalculado.
+    """
+    nombre = models.CharField(
+        max_length=50,
+        primary_key=True,
+        help_text="Nombre del trabajo."
+    )
+
+    valor = models.DateTimeField(
+        help_text="Fecha de actualización hasta la que ya se recalculó."
+    )
+
+    fecha_actualizacion = models.DateTimeField(
+        auto_now=True,
+        help_text="Última ejecución del trabajo."
+    )
+
+    def __str__(self):
+        return f"{self.nombre}: {self.valor}"
+
 
 # ============================================
 # SIGNALS PARA SINCRONIZACIÓN AUTOMÁTICA
 # ============================================
 
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 
 @receiver(post_save, sender=Pedido)
 def pedido_saved(sender, instance, created, **kwargs):
-    """Sincronizar pedido a MongoDB cuando se crea o actualiza"""
-    from provesi.mongodb_sync import sync_pedido_to_mongo
-    sync_pedido_to_mongo(instance)
+    """Marcar el pedido para sincronizar cuando se crea o actualiza"""
+    from provesi.unit_of_work import mark_dirty
+    mark_dirty('pedido', instance.id)
 
 
 @receiver(post_delete, sender=Pedido)
 def pedido_deleted(sender, instance, **kwargs):
-    """Eliminar pedido de MongoDB cuando se elimina"""
-    from provesi.mongodb_sync import delete_pedido_from_mongo
-    delete_pedido_from_mongo(instance.id)
+    """Marcar la eliminación del pedido para sincronizar"""
+    from provesi.unit_of_work import mark_dirty
+    mark_dirty('pedido', instance.id, 'delete')
 
 
 @receiver(post_save, sender=Item)
 def item_saved(sender, instance, created, **kwargs):
     """Cuando se guarda un item, re-sincronizar el pedido completo"""
-    from provesi.mongodb_sync import sync_pedido_to_mongo
-    sync_pedido_to_mongo(instance.pedido)
+    from provesi.unit_of_work import mark_dirty
+    mark_dirty('pedido', instance.pedido_id)
 
 
 @receiver(post_delete, sender=Item)
 def item_deleted(sender, instance, **kwargs):
-    """Cuando se elimina un item, re-sincronizar el pedido completo"""
-    from provesi.mongodb_sync import sync_pedido_to_mongo
-    try:
-        sync_pedido_to_mongo(instance.pedido)
-    except:
-        pass  # El pedido ya no existe
\ No newline at end of file
+    """
+    Cuando se elimina un item, re-sincronizar el pedido completo.
+    Si el pedido también se eliminó, el drenador lo borra de MongoDB.
+    """
+    from provesi.unit_of_work import mark_dirty
+    mark_dirty('pedido', instance.pedido_id)
+
+
+@receiver(pre_delete, sender=Item)
+def item_reservas_liberadas(sender, instance, **kwargs):
+    """
+    Libera las reservas activas del ítem antes de que se borren en cascada,
+    para no dejar stock reservado en las ubicaciones. Cubre también el
+    borrado de un pedido completo.
+    """
+    from .logic.reserva_logic import liberar_reservas_item
+    liberar_reservas_item(instance.id)
+
+
+# ============================================
+# SIGNALS DE LOS ROLLUPS DE VENTAS
+# ============================================
+
+@receiver(post_save, sender=Pedido)
+def pedido_rollup_saved(sender, instance, created, **kwargs):
+    """Cuenta el pedido nuevo o mueve sus totales si cambió de estado."""
+    from .logic.rollup_logic import on_pedido_saved
+    on_pedido_saved(instance, created)
+
+
+@receiver(post_delete, sender=Pedido)
+def pedido_rollup_deleted(sender, instance, **kwargs):
+    """Descuenta el pedido; sus ítems ya se descontaron al borrarse en cascada."""
+    from .logic.rollup_logic import on_pedido_deleted
+    on_pedido_deleted(instance)
+
+
+@receiver(post_save, sender=Item)
+def item_rollup_saved(sender, instance, created, **kwargs):
+    """Aplica a los rollups la diferencia entre el ítem leído y el guardado."""
+    from .logic.rollup_logic import on_item_saved
+    on_item_saved(instance, created)
+
+
+@receiver(post_delete, sender=Item)
+def item_rollup_deleted(sender, instance, **kwargs):
+    """Descuenta el ítem de los rollups."""
+    from .logic.rollup_logic import on_item_deleted
+    on_item_deleted(instance)
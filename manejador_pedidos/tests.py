@@ -1,3 +1,431 @@
-from django.test import TestCase
+import threading
+import unittest
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.db import OperationalError, connection
+from django.db.models import ProtectedError
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from manejador_inventario.models import Bodega, Estanteria, Producto, Ubicacion
+from provesi.document_builders import build_pedido_documents
+from provesi.models import SyncOutbox
+from .logic.pedido_logic import decode_cursor, encode_cursor, get_pedidos_page, get_pedidos_page_mongo
+from .logic.picking_logic import optimize_route, plan_waves
+from .logic import reserva_logic
+from .logic.reserva_logic import (
+    ReservaOcupada,
+    StockInsuficiente,
+    confirmar_reservas,
+    liberar_reservas,
+    reservar_pedido,
+)
+from .logic.rollup_logic import backfill, catch_up, dia, recompute_days, sales_report
+from .models import Pedido, Item, PedidoDiarioEstado, Reserva, VentaDiariaProducto
+
+
+class PedidoDocumentBuilderTests(TestCase):
+    """Los documentos de pedidos se construyen con un número fijo de consultas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.productos = [
+            Producto.objects.create(codigo=f'P{i}', nombre=f'Producto {i}', descripcion='Desc', precio=100 * (i + 1))
+            for i in range(5)
+        ]
+        cls.pedidos = []
+        for _ in range(3):
+            pedido = Pedido.objects.create()
+            for producto in cls.productos:
+                Item.objects.create(pedido=pedido, producto=producto, cantidad=2)
+            cls.pedidos.append(pedido)
+
+    def test_documento_de_pedido(self):
+        pedido = self.pedidos[0]
+        documento = build_pedido_documents([pedido.id])[pedido.id]
+
+        self.assertEqual(documento['postgres_id'], pedido.id)
+        self.assertEqual(documento['num_items'], 5)
+        self.assertEqual(documento['total'], sum(2 * p.precio for p in self.productos))
+        self.assertEqual(documento['items'][0]['producto_codigo'], 'P0')
+
+    def test_consultas_constantes_para_un_pedido(self):
+        with self.assertNumQueries(2):
+            build_pedido_documents([self.pedidos[0].id])
+
+    def test_consultas_constantes_para_varios_pedidos(self):
+        with self.assertNumQueries(2):
+            documentos = build_pedido_documents([pedido.id for pedido in self.pedidos])
+        self.assertEqual(len(documentos), 3)
+
+
+def error_de_bloqueo(pgcode):
+    """OperationalError como el que Django levanta a partir del error de psycopg2."""
+    causa = Exception(pgcode)
+    causa.pgcode = pgcode
+    error = OperationalError(pgcode)
+    error.__cause__ = causa
+    return error
+
+
+class CursorPaginationTests(TestCase):
+    """El listado pagina por (fecha_creacion, id) sin saltar ni repetir pedidos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        base = timezone.now().replace(microsecond=0)
+        cls.pedidos = [Pedido.objects.create() for _ in range(5)]
+        # Tres pedidos con la misma fecha: el id desempata
+        fechas = (base, base, base, base - timedelta(hours=1), base + timedelta(hours=1))
+        for pedido, fecha in zip(cls.pedidos, fechas):
+            Pedido.objects.filter(id=pedido.id).update(fecha_creacion=fecha)
+
+    def test_cursor_ida_y_vuelta(self):
+        fecha = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(fecha, 42)), (fecha, 42))
+        for invalido in (None, '', 'no-es-base64!', encode_cursor(fecha, 1)[:-4] + 'AAAA'):
+            self.assertIsNone(decode_cursor(invalido))
+
+    def test_paginas_recorren_todo_en_orden(self):
+        esperados = list(Pedido.objects.order_by('-fecha_creacion', '-id').values_list('id', flat=True))
+        vistos, cursor, paginas = [], None, 0
+        while True:
+            pagina = get_pedidos_page(cursor=cursor, limite=2)
+            vistos.extend(fila['id'] for fila in pagina['pedidos'])
+            paginas += 1
+            cursor = pagina['siguiente']
+            if cursor is None:
+                break
+
+        self.assertEqual(vistos, esperados)
+        self.assertEqual(paginas, 3)
+        self.assertIsNone(get_pedidos_page(limite=5)['siguiente'])
+
+    def test_mongo_usa_el_mismo_cursor(self):
+        pedido = Pedido.objects.get(id=self.pedidos[0].id)
+        cursor = encode_cursor(pedido.fecha_creacion, pedido.id)
+        db = mock.MagicMock()
+
+        get_pedidos_page_mongo(db, cursor=cursor, estado='pendiente', limite=2)
+
+        filtro, proyeccion = db.pedidos.find.call_args.args
+        fecha = pedido.fecha_creacion.isoformat()
+        self.assertEqual(filtro['estado'], 'pendiente')
+        self.assertEqual(filtro['$or'], [
+            {'fecha_creacion': {'$lt': fecha}},
+            {'fecha_creacion': fecha, 'postgres_id': {'$lt': pedido.id}},
+        ])
+        self.assertNotIn('items', proyeccion)
+        db.pedidos.find.return_value.sort.return_value.limit.assert_called_with(3)
+
+
+class ReservaTests(TestCase):
+    """Las reservas reparten cada ítem entre las ubicaciones de su producto."""
+
+    @classmethod
+    def setUpTestData(cls):
+        bodega = Bodega.objects.create(codigo='BAR01', ciudad='Barranquilla', direccion='Calle 72')
+        estanteria = Estanteria.objects.create(bodega=bodega, zona='A', codigo=1, niveles=1)
+        cls.producto = Producto.objects.create(codigo='R1', nombre='Reservable', descripcion='Desc', precio=10)
+        cls.ubicaciones = [
+            Ubicacion.objects.create(
+                estanteria=estanteria, producto=cls.producto, nivel=0, codigo=i, capacidad=20, stock=stock,
+            )
+            for i, stock in enumerate((4, 10))
+        ]
+
+    def setUp(self):
+        self.pedido = Pedido.objects.create()
+        Item.objects.create(pedido=self.pedido, producto=self.producto, cantidad=12)
+
+    def estado(self):
+        return list(Ubicacion.objects.order_by('id').values_list('stock', 'reservado'))
+
+    def test_reserva_repartida_por_ubicaciones(self):
+        reservas = reservar_pedido(self.pedido.id)
+
+        self.assertEqual(sorted(r.cantidad for r in reservas), [2, 10])
+        self.assertEqual(self.estado(), [(4, 2), (10, 10)])
+        # Reservar de nuevo no duplica
+        self.assertEqual(reservar_pedido(self.pedido.id), [])
+
+    def test_sin_stock_suficiente_no_reserva_nada(self):
+        otro = Pedido.objects.create()
+        Item.objects.create(pedido=otro, producto=self.producto, cantidad=3)
+        reservar_pedido(self.pedido.id)
+
+        with self.assertRaises(StockInsuficiente) as contexto:
+            reservar_pedido(otro.id)
+
+        self.assertEqual(contexto.exception.faltante, 1)
+        self.assertFalse(Reserva.objects.filter(item__pedido=otro).exists())
+        self.assertEqual(len(reservar_pedido(otro.id, parcial=True)), 1)
+
+    def test_liberar_devuelve_el_disponible(self):
+        reservar_pedido(self.pedido.id)
+        liberadas = liberar_reservas(self.pedido.id)
+
+        self.assertEqual(len(liberadas), 2)
+        self.assertEqual(self.estado(), [(4, 0), (10, 0)])
+        self.assertEqual(set(Reserva.objects.values_list('estado', flat=True)), {'liberada'})
+
+    def test_borrar_pedido_o_item_libera_lo_reservado(self):
+        otro = Pedido.objects.create()
+        item = Item.objects.create(pedido=otro, producto=self.producto, cantidad=1)
+        reservar_pedido(self.pedido.id)
+        reservar_pedido(otro.id)
+        self.assertEqual(self.estado(), [(4, 3), (10, 10)])
+
+        item.delete()
+        self.assertEqual(self.estado(), [(4, 2), (10, 10)])
+
+        self.pedido.delete()
+        self.assertEqual(self.estado(), [(4, 0), (10, 0)])
+        self.assertFalse(Reserva.objects.exists())
+
+    def test_solo_las_reservas_activas_impiden_borrar_la_ubicacion(self):
+        reservar_pedido(self.pedido.id)
+        with self.assertRaises(ProtectedError):
+            self.ubicaciones[0].delete()
+
+        liberar_reservas(self.pedido.id)
+        self.ubicaciones[0].delete()
+
+        self.assertEqual(list(Reserva.objects.values_list('ubicacion_id', flat=True)), [self.ubicaciones[1].id])
+
+    def test_confirmar_descuenta_el_stock_y_sincroniza(self):
+        reservar_pedido(self.pedido.id)
+        SyncOutbox.objects.all().delete()
+        confirmar_reservas(self.pedido.id)
+
+        self.assertEqual(self.estado(), [(2, 0), (0, 0)])
+        self.assertEqual(
+            sorted(SyncOutbox.objects.values_list('entidad', flat=True)),
+            ['producto', 'ubicacion', 'ubicacion'],
+        )
+
+    def test_reintenta_si_las_ubicaciones_estan_bloqueadas(self):
+        bloqueo = error_de_bloqueo('55P03')
+        asignar = reserva_logic._asignar
+        intentos = []
+
+        def asignar_con_bloqueo(item, cantidad):
+            intentos.append(item.id)
+            if len(intentos) == 1:
+                raise bloqueo
+            return asignar(item, cantidad)
+
+        with mock.patch.object(reserva_logic, 'ESPERA_BASE_BLOQUEO', 0), \
+                mock.patch.object(reserva_logic, '_asignar', side_effect=asignar_con_bloqueo):
+            reservas = reservar_pedido(self.pedido.id)
+
+        self.assertEqual(len(intentos), 2)
+        self.assertEqual(sorted(r.cantidad for r in reservas), [2, 10])
+        self.assertEqual(self.estado(), [(4, 2), (10, 10)])
+
+    def test_ocupada_tras_agotar_los_reintentos(self):
+        deadlock = error_de_bloqueo('40P01')
+        with mock.patch.object(reserva_logic, 'ESPERA_BASE_BLOQUEO', 0), \
+                mock.patch.object(reserva_logic, '_asignar', side_effect=deadlock) as asignar:
+            with self.assertRaises(ReservaOcupada):
+                reservar_pedido(self.pedido.id)
+
+        self.assertEqual(asignar.call_count, reserva_logic.REINTENTOS_POR_BLOQUEO)
+        self.assertFalse(Reserva.objects.exists())
+        self.assertEqual(self.estado(), [(4, 0), (10, 0)])
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Los bloqueos de filas requieren PostgreSQL')
+class ReservaConcurrenteTests(TransactionTestCase):
+    """Reservas concurrentes sobre las mismas ubicaciones no se bloquean mutuamente."""
+
+    HILOS = 8
+    PEDIDOS_POR_HILO = 5
+
+    def setUp(self):
+        bodega = Bodega.objects.create(codigo='CON01', ciudad='Bogotá', direccion='Calle 80')
+        estanteria = Estanteria.objects.create(bodega=bodega, zona='A', codigo=1, niveles=4)
+        self.productos = [
+            Producto.objects.create(codigo=f'CON{i}', nombre=f'Concurrente {i}', descripcion='Desc', precio=1)
+            for i in range(2)
+        ]
+        for producto in self.productos:
+            for nivel in range(4):
+                Ubicacion.objects.create(
+                    estanteria=estanteria, producto=producto, nivel=nivel, codigo=producto.id,
+                    capacidad=100, stock=100,
+                )
+        self.pedidos = []
+        for _ in range(self.HILOS * self.PEDIDOS_POR_HILO):
+            pedido = Pedido.objects.create()
+            for producto in self.productos:
+                # La demanda supera el stock: los ítems terminan repartidos y compitiendo
+                Item.objects.create(pedido=pedido, producto=producto, cantidad=15)
+            self.pedidos.append(pedido)
+
+    def test_sin_deadlocks_ni_sobreventa(self):
+        errores = []
+
+        def reservar(lote):
+            try:
+                for pedido in lote:
+                    try:
+                        reservar_pedido(pedido.id, parcial=True)
+                    except ReservaOcupada:
+                        pass
+                    except Exception as e:
+                        errores.append(e)
+            finally:
+                connection.close()
+
+        hilos = [
+            threading.Thread(target=reservar, args=(self.pedidos[i::self.HILOS],))
+            for i in range(self.HILOS)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        for ubicacion in Ubicacion.objects.all():
+            reservado = sum(
+                Reserva.objects.filter(ubicacion=ubicacion, estado='activa').values_list('cantidad', flat=True)
+            )
+            self.assertEqual(ubicacion.reservado, reservado)
+            self.assertLessEqual(ubicacion.reservado, ubicacion.stock)
+
+
+class PickingTests(TestCase):
+    """Las olas agrupan pedidos por bodega y recorren los pasillos en serpentina."""
+
+    @classmethod
+    def setUpTestData(cls):
+        bodega = Bodega.objects.create(codigo='PIC01', ciudad='Pereira', direccion='Calle 1')
+        cls.productos = {}
+        for zona in 'AB':
+            for codigo in (1, 2):
+                estanteria = Estanteria.objects.create(bodega=bodega, zona=zona, codigo=codigo, niveles=1)
+                producto = Producto.objects.create(
+                    codigo=f'{zona}{codigo}', nombre=f'Producto {zona}{codigo}', descripcion='Desc', precio=1,
+                )
+                Ubicacion.objects.create(
+                    estanteria=estanteria, producto=producto, nivel=0, codigo=0, capacidad=50, stock=50,
+                )
+                cls.productos[f'{zona}{codigo}'] = producto
+
+    def crear_pedido(self, *productos):
+        pedido = Pedido.objects.create()
+        for codigo in productos:
+            Item.objects.create(pedido=pedido, producto=self.productos[codigo], cantidad=1)
+        return pedido
+
+    def test_recorrido_en_serpentina(self):
+        paradas = [
+            {'zona': zona, 'estanteria': estanteria, 'posicion': 0, 'nivel': 0}
+            for zona, estanteria in (('B', 1), ('A', 2), ('B', 2), ('A', 1))
+        ]
+        ordenadas, distancia = optimize_route(paradas)
+
+        self.assertEqual([(p['zona'], p['estanteria']) for p in ordenadas], [('A', 1), ('A', 2), ('B', 2), ('B', 1)])
+        self.assertGreater(distancia, 0)
+
+    def test_olas_agrupan_pedidos_y_paradas(self):
+        primero = self.crear_pedido('B2', 'A1')
+        segundo = self.crear_pedido('A1')
+        tercero = self.crear_pedido('B1')
+        reservar_pedido(segundo.id)
+
+        with self.assertNumQueries(3):
+            olas = plan_waves([primero.id, segundo.id, tercero.id], max_pedidos=2)
+
+        self.assertEqual([sorted(ola['pedidos']) for ola in olas], [sorted([primero.id, segundo.id]), [tercero.id]])
+        paradas = olas[0]['paradas']
+        self.assertEqual([p['producto'] for p in paradas], ['A1', 'B2'])
+        self.assertEqual(paradas[0]['cantidad'], 2)
+        self.assertEqual(
+            sorted(d['reservada'] for d in paradas[0]['detalle']), [False, True],
+        )
+
+
+class RollupTests(TestCase):
+    """Los rollups de ventas se mantienen con cada cambio y coinciden con un recálculo."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.productos = [
+            Producto.objects.create(codigo=f'R{i}', nombre=f'Rollup {i}', descripcion='Desc', precio=100 * (i + 1))
+            for i in range(2)
+        ]
+
+    def totales(self):
+        return (
+            sorted(VentaDiariaProducto.objects.exclude(lineas=0).values_list(
+                'fecha', 'producto_id', 'estado', 'unidades', 'ingresos', 'lineas')),
+            sorted(PedidoDiarioEstado.objects.exclude(pedidos=0).values_list(
+                'fecha', 'estado', 'pedidos', 'unidades', 'ingresos')),
+        )
+
+    def assertCoincideConRecalculo(self):
+        incremental = self.totales()
+        recompute_days([dia(pedido.fecha_creacion) for pedido in Pedido.objects.all()])
+        self.assertEqual(incremental, self.totales())
+
+    def test_cambios_de_items_y_estado(self):
+        pedido = Pedido.objects.create()
+        item = Item.objects.create(pedido=pedido, producto=self.productos[0], cantidad=2)
+        Item.objects.create(pedido=pedido, producto=self.productos[1], cantidad=1)
+        self.assertCoincideConRecalculo()
+
+        item = Item.objects.get(id=item.id)
+        item.cantidad = 5
+        item.save()
+        pedido = Pedido.objects.get(id=pedido.id)
+        pedido.estado = 'enviado'
+        pedido.save()
+        self.assertCoincideConRecalculo()
+
+        hoy = dia(pedido.fecha_creacion)
+        self.assertEqual(
+            sales_report(hoy, hoy, por='estado'),
+            [{'estado': 'enviado', 'pedidos': 1, 'unidades': 6, 'ingresos': 700}],
+        )
+
+        Item.objects.get(id=item.id).delete()
+        self.assertCoincideConRecalculo()
+        Pedido.objects.get(id=pedido.id).delete()
+        self.assertEqual(self.totales(), ([], []))
+
+    def pedido_antiguo(self, dias=10):
+        """Pedido creado y actualizado por última vez hace `dias` días, fuera del SOLAPE."""
+        pedido = Pedido.objects.create()
+        hace = timezone.now() - timedelta(days=dias)
+        Pedido.objects.filter(id=pedido.id).update(fecha_creacion=hace, fecha_actualizacion=hace)
+        return Pedido.objects.get(id=pedido.id)
+
+    def test_catch_up_recalcula_pedidos_con_fecha_actualizacion_nueva(self):
+        pedido = self.pedido_antiguo()
+        catch_up()
+        Item.objects.bulk_create([Item(pedido=pedido, producto=self.productos[1], cantidad=3)])
+        Pedido.objects.filter(id=pedido.id).update(fecha_actualizacion=timezone.now())
+
+        resultado = catch_up()
+        self.assertEqual(resultado['dias'], 1)
+        fecha = dia(pedido.fecha_creacion)
+        self.assertEqual(
+            sales_report(fecha, fecha, por='producto'),
+            [{'producto': 'R1', 'unidades': 3, 'ingresos': 600, 'lineas': 1}],
+        )
+
+    def test_update_sin_fecha_actualizacion_requiere_backfill(self):
+        pedido = self.pedido_antiguo()
+        catch_up()
+        Pedido.objects.filter(id=pedido.id).update(estado='enviado')
+        fecha = dia(pedido.fecha_creacion)
+
+        self.assertEqual(catch_up()['dias'], 0)
+        self.assertEqual([fila['estado'] for fila in sales_report(fecha, fecha, por='estado')], ['pendiente'])
+
+        backfill(desde=fecha, hasta=fecha)
+        self.assertEqual([fila['estado'] for fila in sales_report(fecha, fecha, por='estado')], ['enviado'])
@@ -5,6 +5,15 @@ urlpatterns = [
     # Ruta para listar todos los pedidos
     path("pedidos/", views.pedidos_list, name="pedidosList"),
 
+    # Ruta para planificar las olas de picking (API JSON)
+    path("pedidos/picking/", views.picking_plan, name="pickingPlan"),
+
+    # Ruta para el reporte de ventas desde los rollups diarios (API JSON)
+    path("pedidos/reportes/ventas/", views.ventas_report, name="ventasReport"),
+
+    # Ruta para exportar los pedidos con sus ítems (NDJSON o CSV)
+    path("pedidos/export/", views.pedidos_export, name="pedidosExport"),
+
     # Ruta para ver los detalles de un pedido específico
     path("pedidos/<int:pedido_id>/", views.pedido_detail, name="pedidoDetail"),
 
@@ -13,4 +22,7 @@ urlpatterns = [
 
     # Ruta para agregar un ítem a un pedido específico
     path("pedidos/<int:pedido_id>/addItem/", views.item_create, name="addItem"),
+
+    # Ruta para reservar, liberar o confirmar el stock de un pedido (API JSON)
+    path("pedidos/<int:pedido_id>/reservas/<str:accion>/", views.pedido_reservas, name="pedidoReservas"),
 ]
\ No newline at end of file
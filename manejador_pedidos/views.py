@@ -4,14 +4,31 @@ Maneja pedidos e ítems de pedido.
 """
 from django.shortcuts import render
 from django.contrib import messages
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect, JsonResponse
 from django.urls import reverse
+from urllib.parse import urlencode
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
 
 from provesi.decorators import admin_required
+from provesi.exports import export_response
+from provesi.serializers import json_response
 from .forms import PedidoForm, ItemForm
-from .logic.pedido_logic import get_pedidos, get_pedido_by_id, create_pedido
+from .logic.pedido_logic import (
+    get_pedido_by_id, create_pedido,
+    get_pedidos_page, get_pedidos_page_mongo, clean_filters, PAGE_SIZE, MAX_PAGE_SIZE,
+)
+from .models import Pedido
 from .logic.item_logic import create_item
+from .logic.picking_logic import MAX_LINEAS_POR_OLA, MAX_PEDIDOS_POR_OLA, pending_pedido_ids, plan_waves
+from .logic.reserva_logic import (
+    ReservaOcupada,
+    StockInsuficiente,
+    confirmar_reservas,
+    liberar_reservas,
+    reservar_pedido,
+)
+from .logic.rollup_logic import AGRUPACIONES, sales_report
 
 
 # ============================================================================
@@ -30,21 +47,43 @@ class JSONEncoder(json.JSONEncoder):
 
 @login_required
 def pedidos_list(request):
-    """Lista todos los pedidos desde MongoDB"""
+    """
+    Lista los pedidos desde MongoDB, paginados por cursor y con filtros
+    opcionales por estado y método de pago. Usa PostgreSQL como respaldo.
+    """
+    filtros = clean_filters(request.GET.get('estado'), request.GET.get('metodo_pago'))
+    cursor = request.GET.get('cursor')
+    try:
+        limite = min(max(int(request.GET.get('limite', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        limite = PAGE_SIZE
+
+    pagina = None
     try:
         from provesi.mongodb_sync import get_mongo_db
         db = get_mongo_db()
-        if db:
-            pedidos = list(db.pedidos.find().sort('fecha_creacion', -1))
-        else:
-            # Fallback a PostgreSQL
-            pedidos = [p.toJson() for p in get_pedidos()]
+        if db is not None:
+            pagina = get_pedidos_page_mongo(db, cursor, limite=limite, **filtros)
     except Exception as e:
         print(f"Error leyendo pedidos de MongoDB: {e}")
-        pedidos = [p.toJson() for p in get_pedidos()]
-    
+
+    if pagina is None:
+        # Fallback a PostgreSQL
+        pagina = get_pedidos_page(cursor, limite=limite, **filtros)
+
+    siguiente_url = None
+    if pagina['siguiente']:
+        params = {key: valor for key, valor in filtros.items() if valor}
+        params.update(cursor=pagina['siguiente'], limite=limite)
+        siguiente_url = f"?{urlencode(params)}"
+
     context = {
-        'pedidos_list': pedidos
+        'pedidos_list': pagina['pedidos'],
+        'siguiente_url': siguiente_url,
+        'es_primera_pagina': not cursor,
+        'filtros': filtros,
+        'estados': Pedido.ESTADOS,
+        'metodos_pago': Pedido.METODOS_PAGO,
     }
     return render(request, 'pedidos_list.html', context)
 
@@ -85,11 +124,6 @@ def pedido_create(request):
         form = PedidoForm(request.POST)
         if form.is_valid():
             pedido = create_pedido(form)
-            
-            # SINCRONIZAR A MONGODB
-            from provesi.mongodb_sync import sync_pedido_to_mongo
-            sync_pedido_to_mongo(pedido)
-            
             messages.success(request, f"Pedido {pedido.id} creado exitosamente.")
             return HttpResponseRedirect(reverse('pedidosList'))
     else:
@@ -113,11 +147,6 @@ def item_create(request, pedido_id):
         form = ItemForm(request.POST)
         if form.is_valid():
             item = create_item(form, pedido)
-            
-            # SINCRONIZAR PEDIDO A MONGODB
-            from provesi.mongodb_sync import sync_pedido_to_mongo
-            sync_pedido_to_mongo(pedido)
-            
             messages.success(request, f"Ítem {item.producto} agregado exitosamente.")
             return HttpResponseRedirect(reverse('pedidoDetail', args=[pedido.id]))
     else:
@@ -130,4 +159,121 @@ def item_create(request, pedido_id):
         'accion': 'Guardar Item',
         'cancel_url': reverse('pedidoDetail', args=[pedido.id])
     }
-    return render(request, 'create_form.html', context)
\ No newline at end of file
+    return render(request, 'create_form.html', context)
+
+
+# ============================================================================
+# API DE RESERVAS DE STOCK (Requiere rol de administrador)
+# ============================================================================
+
+@admin_required
+@require_POST
+def pedido_reservas(request, pedido_id, accion):
+    """
+    Reserva, libera o confirma el stock de un pedido.
+
+    accion: 'reservar' (con ?parcial=1 reserva lo disponible), 'liberar' o 'confirmar'.
+    """
+    if accion not in ('reservar', 'liberar', 'confirmar'):
+        raise Http404(f"Acción desconocida: {accion}")
+
+    pedido = get_pedido_by_id(pedido_id)
+    try:
+        if accion == 'reservar':
+            reservas = reservar_pedido(pedido.id, parcial=request.GET.get('parcial') == '1')
+        elif accion == 'liberar':
+            reservas = liberar_reservas(pedido.id)
+        else:
+            reservas = confirmar_reservas(pedido.id)
+    except StockInsuficiente as e:
+        return JsonResponse({'error': str(e), 'item': e.item.id, 'faltante': e.faltante}, status=409)
+    except ReservaOcupada as e:
+        return JsonResponse({'error': str(e)}, status=409)
+
+    return JsonResponse({
+        'pedido': pedido.id,
+        'accion': accion,
+        'reservas': [
+            {'item': r.item_id, 'ubicacion': r.ubicacion_id, 'cantidad': r.cantidad, 'estado': r.estado}
+            for r in reservas
+        ],
+    })
+
+
+# ============================================================================
+# PLAN DE PICKING (Solo requiere login)
+# ============================================================================
+
+@login_required
+def picking_plan(request):
+    """
+    Agrupa pedidos en olas de picking y ordena el recorrido de cada ola.
+
+    Parámetros GET:
+    - pedidos: ids separados por coma (por defecto, los pedidos pendientes más antiguos)
+    - max_pedidos, max_lineas: tamaño máximo de cada ola
+    """
+    try:
+        pedido_ids = [int(i) for i in request.GET.get('pedidos', '').split(',') if i.strip()]
+        max_pedidos = int(request.GET.get('max_pedidos', MAX_PEDIDOS_POR_OLA))
+        max_lineas = int(request.GET.get('max_lineas', MAX_LINEAS_POR_OLA))
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros inválidos'}, status=400)
+    if max_pedidos < 1 or max_lineas < 1:
+        return JsonResponse({'error': 'Parámetros inválidos'}, status=400)
+
+    if not pedido_ids:
+        pedido_ids = pending_pedido_ids()
+    olas = plan_waves(pedido_ids, max_pedidos=max_pedidos, max_lineas=max_lineas)
+    return json_response({'olas': olas})
+
+
+# ============================================================================
+# REPORTES (Solo requiere login)
+# ============================================================================
+
+@login_required
+def ventas_report(request):
+    """
+    Reporte de ventas leído de los rollups diarios.
+
+    Parámetros GET:
+    - desde, hasta: días (AAAA-MM-DD), inclusive; por defecto los últimos 30 días
+    - por: 'dia', 'producto' o 'estado' (default: dia)
+    - producto, estado: filtros opcionales
+    """
+    from datetime import timedelta
+
+    from django.utils import timezone
+    from django.utils.dateparse import parse_date
+
+    hoy = timezone.localdate()
+    try:
+        desde = parse_date(request.GET['desde']) if request.GET.get('desde') else hoy - timedelta(days=29)
+        hasta = parse_date(request.GET['hasta']) if request.GET.get('hasta') else hoy
+    except ValueError:
+        desde = hasta = None
+    por = request.GET.get('por', 'dia')
+    estado = request.GET.get('estado') or None
+    if desde is None or hasta is None or desde > hasta or por not in AGRUPACIONES:
+        return JsonResponse({'error': 'Parámetros inválidos'}, status=400)
+    if estado and estado not in {valor for valor, _ in Pedido.ESTADOS}:
+        return JsonResponse({'error': 'Parámetros inválidos'}, status=400)
+
+    filas = sales_report(desde, hasta, por=por, producto=request.GET.get('producto') or None, estado=estado)
+    return json_response({'desde': desde, 'hasta': hasta, 'por': por, 'filas': filas})
+
+
+# ============================================================================
+# EXPORTACIÓN (Requiere rol de administrador)
+# ============================================================================
+
+@admin_required
+def pedidos_export(request):
+    """
+    Exporta los pedidos con sus ítems en streaming.
+
+    Parámetros GET: formato (ndjson o csv), gzip=1, despues y hasta (rango de
+    ids, para retomar una exportación) y chunk (filas por bloque).
+    """
+    return export_response(request, 'pedidos')
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+class ProvesiConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'provesi'
+
+    def ready(self):
+        from .change_feed import install_triggers_after_migrate
+        post_migrate.connect(install_triggers_after_migrate, sender=self)
@@ -2,11 +2,267 @@
 Auth0 Backend y utilidades de autenticación.
 Maneja la integración con Auth0 y extracción de roles de usuario.
 """
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
 import requests
 import jwt
+from requests.adapters import HTTPAdapter
 from social_core.backends.oauth import BaseOAuth2
 from django.conf import settings
 
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+def get_auth_cache_config():
+    """Configuración de la caché de claims y del pool HTTP con valores por defecto."""
+    config = {
+        'claims_maxsize': 4096,
+        'claims_ttl': 300,
+        'pool_maxsize': 10,
+        'timeout': 5,
+    }
+    config.update(getattr(settings, 'AUTH0_CACHE', {}))
+    return config
+
+
+_claims_cache = None
+_http = {'session': None, 'pid': None}
+_http_lock = threading.Lock()
+
+
+def get_claims_cache():
+    """Caché del proceso con los claims decodificados, por hash del token."""
+    global _claims_cache
+    if _claims_cache is None:
+        config = get_auth_cache_config()
+        _claims_cache = LRUCache(maxsize=config['claims_maxsize'], ttl=config['claims_ttl'])
+    return _claims_cache
+
+
+def get_http_session():
+    """
+    Sesión HTTP keep-alive compartida por el proceso para llamar a Auth0.
+    Se recrea después de un fork, igual que el cliente de MongoDB.
+    """
+    pid = os.getpid()
+    if _http['session'] is not None and _http['pid'] == pid:
+        return _http['session']
+    with _http_lock:
+        if _http['session'] is None or _http['pid'] != pid:
+            config = get_auth_cache_config()
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config['pool_maxsize'])
+            session.mount('https://', adapter)
+            _http['session'] = session
+            _http['pid'] = pid
+    return _http['session']
+
+
+def token_key(token):
+    """Clave de caché de un token: su hash, para no guardar el token en claro."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _claims_ttl(claims):
+    """TTL de una entrada: el configurado, sin superar la expiración del token."""
+    ttl = get_auth_cache_config()['claims_ttl']
+    exp = claims.get('exp') if isinstance(claims, dict) else None
+    if exp:
+        ttl = min(ttl, max(0, exp - time.time()))
+    return ttl
+
+
+def get_cached_claims(token, loader):
+    """
+    Retorna los claims de un token desde la caché del proceso; si no
+    están, los obtiene con `loader()` y los guarda.
+    """
+    cache = get_claims_cache()
+    key = token_key(token)
+    claims = cache.get(key)
+    if claims is None:
+        claims = loader()
+        cache.set(key, claims, ttl=_claims_ttl(claims))
+    return claims
+
+
+def fetch_userinfo(domain, access_token):
+    """Consulta /userinfo de Auth0 usando la sesión HTTP compartida."""
+    resp = get_http_session().get(
+        f"https://{domain}/userinfo",
+        headers={'authorization': f'Bearer {access_token}'},
+        timeout=get_auth_cache_config()['timeout'],
+    )
+    resp.raise_for_status()
+    return resp.json()
+
+
+def get_jwks_config():
+    """Configuración del verificador de tokens con valores por defecto."""
+    domain = settings.SOCIAL_AUTH_AUTH0_DOMAIN.replace('https://', '').replace('http://', '')
+    config = {
+        'url': f"https://{domain}/.well-known/jwks.json",
+        'issuer': f"https://{domain}/",
+        'audience': getattr(settings, 'SOCIAL_AUTH_AUTH0_KEY', None),
+        'algorithms': ['RS256'],
+        'cache_path': None,
+        'ttl': 6 * 3600,
+        'min_refresh_interval': 300,
+        'leeway': 60,
+    }
+    config.update(getattr(settings, 'AUTH0_JWKS', {}))
+    return config
+
+
+class JWKSKeySet:
+    """
+    Claves públicas de Auth0 (JWKS) guardadas en memoria y en disco.
+
+    El documento se vuelve a descargar cuando supera `ttl`, o antes si un
+    token trae un `kid` desconocido (rotación de claves), pero nunca más de
+    una vez cada `min_refresh_interval` segundos. Si la descarga falla se
+    siguen usando las claves conocidas.
+    """
+
+    def __init__(self, url, cache_path=None, ttl=6 * 3600, min_refresh_interval=300, fetch=None):
+        self.url = url
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self._fetch = fetch or self._fetch_remote
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._descargado_en = 0.0
+        self._intentado_en = 0.0
+        self._load_from_disk()
+
+    def _fetch_remote(self):
+        resp = get_http_session().get(self.url, timeout=get_auth_cache_config()['timeout'])
+        resp.raise_for_status()
+        return resp.json()
+
+    def _set_keys(self, documento, descargado_en):
+        keys = {}
+        for jwk in documento.get('keys', []):
+            if jwk.get('use', 'sig') != 'sig' or 'kid' not in jwk:
+                continue
+            try:
+                keys[jwk['kid']] = jwt.PyJWK(jwk)
+            except jwt.PyJWKError as e:
+                logger.warning(f"⚠️ Clave JWKS {jwk.get('kid')} ignorada: {e}")
+        self._keys = keys
+        self._descargado_en = descargado_en
+
+    def _load_from_disk(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path) as f:
+                guardado = json.load(f)
+            self._set_keys(guardado['jwks'], guardado['descargado_en'])
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"⚠️ No se pudo leer el JWKS en disco: {e}")
+
+    def _save_to_disk(self, documento):
+        if not self.cache_path:
+            return
+        temporal = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(temporal, 'w') as f:
+                json.dump({'descargado_en': self._descargado_en, 'jwks': documento}, f)
+            os.replace(temporal, self.cache_path)
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo guardar el JWKS en disco: {e}")
+
+    def refresh(self, forzar=False):
+        """Descarga el JWKS si corresponde. Retorna True si se actualizó."""
+        with self._lock:
+            ahora = time.time()
+            if not forzar and ahora - self._intentado_en < self.min_refresh_interval:
+                return False
+            self._intentado_en = ahora
+            try:
+                documento = self._fetch()
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo descargar el JWKS, se usan las claves conocidas: {e}")
+                return False
+            self._set_keys(documento, ahora)
+            self._save_to_disk(documento)
+            return True
+
+    def get_key(self, kid):
+        """Clave pública para el `kid` dado, refrescando el JWKS si es necesario."""
+        if time.time() - self._descargado_en > self.ttl or kid not in self._keys:
+            self.refresh()
+        key = self._keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f"Clave de firma desconocida: {kid}")
+        return key
+
+
+class TokenVerifier:
+    """
+    Verifica localmente la firma y los claims estándar de los tokens de Auth0.
+    Los claims verificados se guardan en la caché de claims del proceso.
+    """
+
+    def __init__(self, keyset, issuer, audience, algorithms=('RS256',), leeway=60):
+        self.keyset = keyset
+        self.issuer = issuer
+        self.audience = audience
+        self.algorithms = list(algorithms)
+        self.leeway = leeway
+
+    def _verify(self, token):
+        kid = jwt.get_unverified_header(token).get('kid')
+        key = self.keyset.get_key(kid)
+        return jwt.decode(
+            token,
+            key.key,
+            algorithms=self.algorithms,
+            audience=self.audience,
+            issuer=self.issuer,
+            leeway=self.leeway,
+        )
+
+    def verify(self, token):
+        """
+        Retorna los claims del token si es válido.
+        Lanza jwt.InvalidTokenError si no lo es; los tokens inválidos no se cachean.
+        """
+        return get_cached_claims(token, lambda: self._verify(token))
+
+
+_verifier = None
+
+
+def get_token_verifier():
+    """Verificador compartido por el proceso, creado con settings.AUTH0_JWKS."""
+    global _verifier
+    if _verifier is None:
+        config = get_jwks_config()
+        keyset = JWKSKeySet(
+            config['url'],
+            cache_path=config['cache_path'],
+            ttl=config['ttl'],
+            min_refresh_interval=config['min_refresh_interval'],
+        )
+        _verifier = TokenVerifier(
+            keyset,
+            issuer=config['issuer'],
+            audience=config['audience'],
+            algorithms=config['algorithms'],
+            leeway=config['leeway'],
+        )
+    return _verifier
+
 
 class Auth0(BaseOAuth2):
     """Backend de autenticación OAuth2 para Auth0"""
@@ -32,10 +288,7 @@ class Auth0(BaseOAuth2):
 
     def get_user_details(self, response):
         """Obtiene detalles del usuario desde Auth0"""
-        url = f"https://{self.setting('DOMAIN')}/userinfo"
-        headers = {'authorization': f"Bearer {response['access_token']}"}
-        resp = requests.get(url, headers=headers)
-        userinfo = resp.json()
+        userinfo = fetch_userinfo(self.setting('DOMAIN'), response['access_token'])
         return {
             'username': userinfo.get('nickname', ''),
             'first_name': userinfo.get('name', ''),
@@ -44,18 +297,33 @@ class Auth0(BaseOAuth2):
         }
 
 
+_SIN_RESOLVER = object()
+
+
 def get_user_role(request):
     """
     Obtiene el rol del usuario autenticado desde Auth0.
     
     Busca el rol en:
-    1. Cache de sesión (para evitar llamadas repetidas)
-    2. Claims del id_token (método preferido)
-    3. Endpoint /userinfo (fallback)
+    1. El propio request (ya resuelto en esta petición)
+    2. Cache de sesión (para evitar llamadas repetidas)
+    3. Claims del id_token, con la firma verificada localmente (método preferido)
+    4. Endpoint /userinfo (fallback)
+    
+    Los claims del id_token y las respuestas de /userinfo se guardan en una
+    caché del proceso por hash del token.
     
     Returns:
         str: Rol del usuario o None si no está autenticado/no tiene rol
     """
+    role = getattr(request, '_auth0_role', _SIN_RESOLVER)
+    if role is _SIN_RESOLVER:
+        role = _resolve_user_role(request)
+        request._auth0_role = role
+    return role
+
+
+def _resolve_user_role(request):
     if not request.user.is_authenticated:
         return None
     
@@ -84,11 +352,13 @@ def get_user_role(request):
         id_token = auth0user.extra_data.get('id_token')
         if id_token:
             try:
-                claims = jwt.decode(id_token, options={"verify_signature": False})
+                claims = get_token_verifier().verify(id_token)
                 for key in possible_keys:
                     if key in claims and claims[key]:
                         role = claims[key]
                         break
+            except jwt.InvalidTokenError as e:
+                logger.warning(f"⚠️ id_token rechazado: {e}")
             except Exception:
                 pass
         
@@ -97,10 +367,9 @@ def get_user_role(request):
             access_token = auth0user.extra_data.get('access_token')
             if access_token:
                 try:
-                    url = f"https://{domain}/userinfo"
-                    headers = {'authorization': f'Bearer {access_token}'}
-                    resp = requests.get(url, headers=headers, timeout=5)
-                    userinfo = resp.json()
+                    userinfo = get_cached_claims(
+                        access_token, lambda: fetch_userinfo(domain, access_token)
+                    )
                     
                     for key in possible_keys:
                         if key in userinfo and userinfo[key]:
@@ -0,0 +1,137 @@
+"""
+Sincronización masiva PostgreSQL → MongoDB.
+
+Recorre las claves de cada tabla con cursores del lado del servidor,
+construye los documentos por bloques (con build_*_documents, en un número
+fijo de consultas por bloque) y los escribe con bulk_write no ordenado.
+"""
+import logging
+import time
+
+from django.db import connections
+from pymongo import UpdateOne
+
+from .document_builders import load_documents
+from .mongodb_sync import get_mongo_db
+
+logger = logging.getLogger(__name__)
+
+ENTIDADES = ('pedido', 'producto', 'bodega')
+
+# Entidades con una fecha de modificación propia, sincronizables con `since`.
+# Producto y Bodega no la tienen: la fecha de sus ubicaciones no refleja los
+# cambios de sus propios campos ni incluye productos sin ubicaciones.
+ENTIDADES_INCREMENTALES = ('pedido',)
+
+COLECCIONES = {
+    'pedido': 'pedidos',
+    'producto': 'productos',
+    'bodega': 'bodegas',
+}
+
+
+def get_queryset(entidad, since=None):
+    """
+    Claves ordenadas de una entidad.
+
+    Con `since` solo se incluyen los pedidos con fecha_actualizacion desde esa
+    fecha (solo upserts: los eliminados no aparecen). Para las demás
+    entidades `since` lanza ValueError (ver ENTIDADES_INCREMENTALES).
+    """
+    from manejador_inventario.models import Bodega, Producto
+    from manejador_pedidos.models import Pedido
+
+    if since and entidad in ENTIDADES and entidad not in ENTIDADES_INCREMENTALES:
+        raise ValueError(f"{entidad} no admite sincronización incremental (since)")
+
+    if entidad == 'pedido':
+        queryset = Pedido.objects.order_by('id')
+        if since:
+            queryset = queryset.filter(fecha_actualizacion__gte=since)
+        return queryset.values_list('id', flat=True)
+
+    if entidad == 'producto':
+        return Producto.objects.order_by('codigo').values_list('codigo', flat=True)
+
+    if entidad == 'bodega':
+        return Bodega.objects.order_by('codigo').values_list('codigo', flat=True)
+
+    raise ValueError(f"Entidad desconocida: {entidad}")
+
+
+def _operaciones(entidad, claves):
+    """UpdateOne de upsert para los documentos de un bloque de claves."""
+    campo = 'postgres_id' if entidad == 'pedido' else 'codigo'
+    return [
+        UpdateOne({campo: documento[campo]}, {'$set': documento}, upsert=True)
+        for documento in load_documents(entidad, claves).values()
+    ]
+
+
+def sync_entidad_bulk(entidad, since=None, chunk_size=1000, progress=None):
+    """
+    Sincroniza todas las filas de una entidad en bloques de `chunk_size`.
+
+    `progress` es un callable opcional que recibe (entidad, filas, segundos)
+    después de cada bloque escrito.
+    Retorna un diccionario con filas sincronizadas, segundos y filas por segundo.
+    """
+    db = get_mongo_db()
+    if db is None:
+        raise RuntimeError("MongoDB no disponible")
+
+    coleccion = db[COLECCIONES[entidad]]
+    inicio = time.monotonic()
+    filas = 0
+    bloque = []
+
+    def escribir():
+        nonlocal filas
+        operaciones = _operaciones(entidad, bloque)
+        if operaciones:
+            coleccion.bulk_write(operaciones, ordered=False)
+        filas += len(operaciones)
+        bloque.clear()
+        if progress:
+            progress(entidad, filas, time.monotonic() - inicio)
+
+    for clave in get_queryset(entidad, since).iterator(chunk_size=chunk_size):
+        bloque.append(clave)
+        if len(bloque) >= chunk_size:
+            escribir()
+    if bloque:
+        escribir()
+
+    segundos = time.monotonic() - inicio
+    return {
+        'entidad': entidad,
+        'filas': filas,
+        'segundos': segundos,
+        'filas_por_segundo': filas / segundos if segundos else 0.0,
+    }
+
+
+def _log_progress(entidad, filas, segundos):
+    logger.info(f"{entidad}: {filas} filas ({filas / segundos if segundos else 0:.0f} filas/s)")
+
+
+def _sync_en_proceso(entidad, since, chunk_size):
+    """Punto de entrada de cada proceso hijo."""
+    # Las conexiones heredadas del padre no se pueden reutilizar tras el fork
+    for conn in connections.all():
+        conn.close()
+    return sync_entidad_bulk(entidad, since, chunk_size, progress=_log_progress)
+
+
+def sync_all_parallel(entidades, since=None, chunk_size=1000, processes=None):
+    """
+    Sincroniza varias entidades en paralelo, una por proceso.
+    Retorna la lista de resultados en el orden recibido.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Cerrar conexiones antes del fork para que los hijos abran las suyas
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=processes or len(entidades)) as executor:
+        futuros = [executor.submit(_sync_en_proceso, entidad, since, chunk_size) for entidad in entidades]
+        return [futuro.result() for futuro in futuros]
@@ -0,0 +1,151 @@
+"""
+Cachés en memoria de proceso.
+
+LRUCache es una caché LRU con expiración (TTL) y contadores, segura entre
+hilos. ReadThroughCache la usa como primer nivel y, opcionalmente, un
+backend de caché de Django como segundo nivel compartido entre procesos.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Caché LRU con TTL por entrada.
+
+    Cuando se supera `maxsize` se descarta la entrada usada hace más tiempo.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(key, _MISSING)
+            if entrada is _MISSING:
+                self.misses += 1
+                return default
+            expira, valor = entrada
+            if expira <= ahora:
+                del self._datos[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._datos.move_to_end(key)
+            self.hits += 1
+            return valor
+
+    def set(self, key, valor, ttl=None):
+        expira = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._datos[key] = (expira, valor)
+            self._datos.move_to_end(key)
+            while len(self._datos) > self.maxsize:
+                self._datos.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._datos.pop(key, None)
+
+    def delete_where(self, predicado):
+        """Elimina las entradas cuya clave cumple el predicado."""
+        with self._lock:
+            for key in [key for key in self._datos if predicado(key)]:
+                del self._datos[key]
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
+
+    def stats(self):
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                'entradas': len(self._datos),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / consultas if consultas else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class ReadThroughCache:
+    """
+    Caché de lectura en dos niveles.
+
+    get_or_load() busca primero en la LRU del proceso, luego en la caché de
+    Django (si `shared_alias` está definido) y finalmente llama al loader.
+    Los valores se devuelven como copia superficial para que quien los use
+    no modifique la instancia compartida.
+    """
+
+    def __init__(self, nombre, maxsize=1024, ttl=300, shared_alias=None):
+        self.nombre = nombre
+        self.local = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.shared_alias = shared_alias
+        self.shared_hits = 0
+        self.loads = 0
+
+    def _shared(self):
+        if not self.shared_alias:
+            return None
+        from django.core.cache import caches
+        return caches[self.shared_alias]
+
+    def _shared_key(self, key):
+        if isinstance(key, tuple):
+            key = ':'.join(str(parte) for parte in key)
+        return f"provesi:{self.nombre}:{key}"
+
+    def get_or_load(self, key, loader):
+        import copy
+
+        valor = self.local.get(key, _MISSING)
+        if valor is not _MISSING:
+            return copy.copy(valor)
+
+        shared = self._shared()
+        if shared is not None:
+            valor = shared.get(self._shared_key(key), _MISSING)
+            if valor is not _MISSING:
+                self.shared_hits += 1
+                self.local.set(key, valor)
+                return copy.copy(valor)
+
+        valor = loader()
+        self.loads += 1
+        self.local.set(key, valor)
+        if shared is not None:
+            shared.set(self._shared_key(key), valor, self.ttl)
+        return copy.copy(valor)
+
+    def invalidate(self, key):
+        self.local.delete(key)
+        shared = self._shared()
+        if shared is not None:
+            shared.delete(self._shared_key(key))
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self):
+        resumen = self.local.stats()
+        resumen.update(shared_hits=self.shared_hits, loads=self.loads)
+        return resumen
@@ -0,0 +1,325 @@
+"""
+Captura de cambios con LISTEN/NOTIFY de PostgreSQL.
+
+Los signals de Django no ven QuerySet.update(), bulk_create, SQL directo ni
+los cambios hechos por otros servicios. Como alternativa opcional, unos
+triggers en las tablas de inventario y pedidos publican con pg_notify un
+aviso compacto por fila modificada:
+
+    {"t": "<tabla>", "op": "I|U|D", "n": {...}, "o": {...}}
+
+donde "n" y "o" traen solo las columnas clave de la fila nueva y la
+anterior. Los UPDATE solo avisan si cambió alguna de las columnas que
+llegan a los documentos de MongoDB: cambiar solo ubicacion.reservado o
+pedido.fecha_actualizacion (que se toca con cada cambio de ítems) no
+genera avisos. El comando listen_changes consume los avisos por lotes, los
+traduce a entradas del outbox (dentro de un sync_scope, una por entidad) e
+invalida la caché de la jerarquía.
+
+Los avisos se entregan al confirmar la transacción y se pierden si no hay
+nadie escuchando: el outbox y verify_mongo_sync siguen siendo la garantía
+de consistencia. Los cambios hechos por la aplicación llegan por los dos
+caminos; el outbox los colapsa y las escrituras sin cambios se omiten.
+"""
+import json
+import logging
+import re
+import select
+import time
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+FUNCION = 'provesi_notify_cambio'
+
+# Tabla -> (entidad, columnas incluidas en el aviso, columnas cuyos UPDATE avisan)
+TABLAS = {
+    'manejador_inventario_bodega': ('bodega', ('codigo',), ('codigo', 'ciudad', 'direccion')),
+    'manejador_inventario_estanteria': (
+        'estanteria', ('id', 'bodega_id', 'zona', 'codigo'), ('bodega_id', 'zona', 'codigo', 'niveles'),
+    ),
+    'manejador_inventario_producto': ('producto', ('codigo',), ('codigo', 'nombre', 'descripcion', 'precio')),
+    'manejador_inventario_ubicacion': (
+        'ubicacion',
+        ('id', 'estanteria_id', 'producto_id'),
+        ('stock', 'capacidad', 'nivel', 'codigo', 'estanteria_id', 'producto_id'),
+    ),
+    'manejador_pedidos_pedido': ('pedido', ('id',), ('estado', 'metodo_pago', 'fecha_creacion')),
+    'manejador_pedidos_item': ('item', ('pedido_id',), ('pedido_id', 'producto_id', 'cantidad')),
+}
+
+# Columna clave de las entidades con documento propio
+COLUMNA_CLAVE = {
+    'bodega': 'codigo',
+    'producto': 'codigo',
+    'pedido': 'id',
+}
+
+FUNCION_SQL = """
+CREATE OR REPLACE FUNCTION {funcion}() RETURNS trigger AS $$
+DECLARE
+    nuevo jsonb := '{{}}';
+    viejo jsonb := '{{}}';
+    columna text;
+BEGIN
+    FOREACH columna IN ARRAY TG_ARGV LOOP
+        IF TG_OP <> 'DELETE' THEN
+            nuevo := nuevo || jsonb_build_object(columna, to_jsonb(NEW) -> columna);
+        END IF;
+        IF TG_OP <> 'INSERT' THEN
+            viejo := viejo || jsonb_build_object(columna, to_jsonb(OLD) -> columna);
+        END IF;
+    END LOOP;
+    PERFORM pg_notify(
+        '{canal}',
+        jsonb_build_object('t', TG_TABLE_NAME, 'op', left(TG_OP, 1), 'n', nuevo, 'o', viejo)::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def get_change_feed_config():
+    """Configuración de la captura de cambios con valores por defecto."""
+    config = {
+        'triggers': False,
+        'channel': 'provesi_cambios',
+        'batch_size': 500,
+        'batch_window': 0.5,
+    }
+    config.update(getattr(settings, 'CHANGE_FEED', {}))
+    if not re.fullmatch(r'[a-z_][a-z0-9_]*', config['channel']):
+        raise ValueError(f"Canal inválido: {config['channel']}")
+    return config
+
+
+def _trigger(tabla):
+    return f'{tabla}_notify_cambio'
+
+
+def _trigger_update(tabla):
+    return f'{tabla}_notify_update'
+
+
+def _condicion_update(columnas):
+    """WHEN del trigger de UPDATE: alguna de las columnas cambió de valor."""
+    viejas = ', '.join(f'OLD.{columna}' for columna in columnas)
+    nuevas = ', '.join(f'NEW.{columna}' for columna in columnas)
+    return f'(ROW({viejas}) IS DISTINCT FROM ROW({nuevas}))'
+
+
+# ============================================
+# TRIGGERS
+# ============================================
+
+def install_triggers(using='default'):
+    """
+    Crea (o reemplaza) la función y los triggers de aviso. Solo PostgreSQL.
+
+    Cada tabla tiene un trigger para INSERT y DELETE y otro para UPDATE OF
+    sus columnas relevantes, con un WHEN que descarta los UPDATE que no
+    cambian sus valores (save() reescribe todas las columnas).
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        raise RuntimeError('La captura de cambios requiere PostgreSQL')
+
+    canal = get_change_feed_config()['channel']
+    with connection.cursor() as cursor:
+        cursor.execute(FUNCION_SQL.format(funcion=FUNCION, canal=canal))
+        for tabla, (_, columnas, columnas_update) in TABLAS.items():
+            argumentos = ', '.join(f"'{columna}'" for columna in columnas)
+            cursor.execute(f'DROP TRIGGER IF EXISTS {_trigger(tabla)} ON {tabla}')
+            cursor.execute(f'DROP TRIGGER IF EXISTS {_trigger_update(tabla)} ON {tabla}')
+            cursor.execute(
+                f'CREATE TRIGGER {_trigger(tabla)} AFTER INSERT OR DELETE ON {tabla} '
+                f'FOR EACH ROW EXECUTE FUNCTION {FUNCION}({argumentos})'
+            )
+            cursor.execute(
+                f"CREATE TRIGGER {_trigger_update(tabla)} AFTER UPDATE OF {', '.join(columnas_update)} "
+                f'ON {tabla} FOR EACH ROW WHEN {_condicion_update(columnas_update)} '
+                f'EXECUTE FUNCTION {FUNCION}({argumentos})'
+            )
+
+
+def uninstall_triggers(using='default'):
+    """Elimina los triggers y la función de aviso."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for tabla in TABLAS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {_trigger(tabla)} ON {tabla}')
+            cursor.execute(f'DROP TRIGGER IF EXISTS {_trigger_update(tabla)} ON {tabla}')
+        cursor.execute(f'DROP FUNCTION IF EXISTS {FUNCION}()')
+
+
+def install_triggers_after_migrate(sender, using, **kwargs):
+    """post_migrate: instala los triggers si CHANGE_FEED['triggers'] está activo."""
+    if get_change_feed_config()['triggers'] and connections[using].vendor == 'postgresql':
+        install_triggers(using)
+
+
+# ============================================
+# TRADUCCIÓN DE AVISOS
+# ============================================
+
+def parse_notification(payload):
+    """Decodifica un aviso; retorna None si no es un aviso de cambio válido."""
+    try:
+        aviso = json.loads(payload)
+    except ValueError:
+        logger.warning(f"Aviso de cambio inválido: {payload[:200]}")
+        return None
+    if not isinstance(aviso, dict) or aviso.get('t') not in TABLAS:
+        return None
+    return aviso
+
+
+def translate(avisos):
+    """
+    Traduce avisos de cambio a marcas de sincronización e invalidaciones.
+
+    Retorna (marcas, bodegas, estanterias): marcas es una lista de
+    (entidad, clave, operacion); bodegas y estanterias son las claves de
+    caché a invalidar. Las bodegas de las ubicaciones se resuelven con una
+    sola consulta por lote y se marcan al final.
+    """
+    from manejador_inventario.models import Estanteria
+
+    marcas = []
+    bodegas = set()
+    estanterias = set()
+    estanterias_ubicaciones = set()
+
+    for aviso in avisos:
+        entidad = TABLAS[aviso['t']][0]
+        nuevo, viejo = aviso.get('n') or {}, aviso.get('o') or {}
+        filas = [fila for fila in (viejo, nuevo) if fila]
+
+        if entidad in COLUMNA_CLAVE:
+            clave = (nuevo or viejo)[COLUMNA_CLAVE[entidad]]
+            marcas.append((entidad, clave, 'delete' if aviso['op'] == 'D' else 'upsert'))
+            if entidad == 'bodega':
+                bodegas.add(clave)
+        elif entidad == 'estanteria':
+            for fila in filas:
+                marcas.append(('bodega', fila['bodega_id'], 'upsert'))
+                estanterias.add((fila['bodega_id'], fila['zona'], fila['codigo']))
+        elif entidad == 'ubicacion':
+            for fila in filas:
+                if fila.get('producto_id') is not None:
+                    marcas.append(('producto', fila['producto_id'], 'upsert'))
+                estanterias_ubicaciones.add(fila['estanteria_id'])
+        elif entidad == 'item':
+            for fila in filas:
+                marcas.append(('pedido', fila['pedido_id'], 'upsert'))
+
+    if estanterias_ubicaciones:
+        for bodega in (
+            Estanteria.objects.filter(id__in=estanterias_ubicaciones)
+            .values_list('bodega_id', flat=True).distinct()
+        ):
+            marcas.append(('bodega', bodega, 'upsert'))
+
+    return marcas, bodegas, estanterias
+
+
+def process_notifications(payloads):
+    """
+    Procesa un lote de avisos: escribe el outbox en un solo sync_scope e
+    invalida la caché de la jerarquía. Retorna el número de avisos válidos.
+
+    Antes de marcar las reconstrucciones se reconcilian los agregados de
+    stock de los productos y bodegas afectados: los documentos toman sus
+    totales de StockProducto/StockBodega, y los cambios hechos con SQL o
+    QuerySet.update no los actualizan.
+    """
+    from manejador_inventario.logic.cache_logic import invalidate_bodega, invalidate_estanteria
+    from manejador_inventario.logic.stock_logic import reconcile
+
+    from .unit_of_work import mark_dirty, sync_scope
+
+    avisos = [aviso for aviso in map(parse_notification, payloads) if aviso is not None]
+    if not avisos:
+        return 0
+
+    marcas, bodegas, estanterias = translate(avisos)
+    productos = {clave for entidad, clave, operacion in marcas if entidad == 'producto' and operacion == 'upsert'}
+    codigos_bodega = {clave for entidad, clave, operacion in marcas if entidad == 'bodega' and operacion == 'upsert'}
+    if productos or codigos_bodega:
+        reconcile(fix=True, productos=productos, bodegas=codigos_bodega)
+    with sync_scope():
+        for entidad, clave, operacion in marcas:
+            mark_dirty(entidad, clave, operacion)
+    for bodega in bodegas:
+        invalidate_bodega(bodega)
+    for estanteria in estanterias:
+        invalidate_estanteria(*estanteria)
+    return len(avisos)
+
+
+# ============================================
+# LISTENER
+# ============================================
+
+class ChangeListener:
+    """
+    Escucha el canal de avisos en una conexión propia (fuera del ORM, en
+    autocommit) y entrega los avisos por lotes: un lote se cierra al llegar
+    a `batch_size` avisos o `batch_window` segundos después del primero.
+    """
+
+    def __init__(self, using='default', batch_size=None, batch_window=None):
+        config = get_change_feed_config()
+        self.using = using
+        self.canal = config['channel']
+        self.batch_size = batch_size or config['batch_size']
+        self.batch_window = config['batch_window'] if batch_window is None else batch_window
+        self.conexion = None
+        self._pendientes = []
+
+    def connect(self):
+        wrapper = connections[self.using]
+        if wrapper.vendor != 'postgresql':
+            raise RuntimeError('La captura de cambios requiere PostgreSQL')
+        self.conexion = wrapper.get_new_connection(wrapper.get_connection_params())
+        self.conexion.autocommit = True
+        with self.conexion.cursor() as cursor:
+            cursor.execute(f'LISTEN {self.canal}')
+
+    def close(self):
+        if self.conexion is not None:
+            self.conexion.close()
+            self.conexion = None
+
+    def _recibir(self, timeout):
+        """Espera hasta `timeout` segundos y acumula los avisos recibidos."""
+        if select.select([self.conexion], [], [], max(timeout, 0))[0]:
+            self.conexion.poll()
+            while self.conexion.notifies:
+                self._pendientes.append(self.conexion.notifies.pop(0).payload)
+
+    def next_batch(self, timeout):
+        """
+        Payloads del siguiente lote. Retorna una lista vacía si en `timeout`
+        segundos no llegó ningún aviso.
+        """
+        if not self._pendientes:
+            self._recibir(timeout)
+            if not self._pendientes:
+                return []
+
+        limite = time.monotonic() + self.batch_window
+        while len(self._pendientes) < self.batch_size:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            self._recibir(restante)
+
+        lote = self._pendientes[:self.batch_size]
+        del self._pendientes[:self.batch_size]
+        return lote
@@ -0,0 +1,240 @@
+"""
+Construcción de los documentos de MongoDB a partir de PostgreSQL.
+
+Cada agregado (pedido, producto, bodega) se carga con un número fijo de
+consultas, sin importar cuántos items o ubicaciones tenga: las filas se leen
+con values_list() a través de los serializers de provesi.serializers y se
+agrupan en Python, sin instanciar modelos. Las mismas funciones sirven para
+una sincronización individual y para los trabajos masivos.
+
+Cada documento lleva en content_hash el hash de su contenido de negocio,
+que permite omitir las escrituras que no cambian nada.
+"""
+import hashlib
+from datetime import datetime
+
+from .serializers import Serializer, dumps
+
+# Campos que no forman parte del contenido de un documento
+CAMPOS_NO_CONTENIDO = frozenset(('_id', 'sync_timestamp', 'content_hash'))
+
+
+# ============================================
+# CAMPOS DE LOS DOCUMENTOS
+# ============================================
+
+PEDIDO_DOC = Serializer(
+    ('postgres_id', 'id'), 'estado', 'metodo_pago', 'fecha_creacion', 'fecha_actualizacion',
+)
+
+ITEM_DOC = Serializer(
+    'id',
+    ('producto_codigo', 'producto__codigo'),
+    ('producto_nombre', 'producto__nombre'),
+    ('producto_descripcion', 'producto__descripcion'),
+    ('producto_precio', 'producto__precio'),
+    'cantidad',
+)
+
+PRODUCTO_DOC = Serializer(('postgres_id', 'codigo'), 'codigo', 'nombre', 'descripcion', 'precio')
+
+UBICACION_EN_PRODUCTO_DOC = Serializer(
+    'id',
+    ('bodega_codigo', 'estanteria__bodega__codigo'),
+    ('bodega_ciudad', 'estanteria__bodega__ciudad'),
+    ('bodega_direccion', 'estanteria__bodega__direccion'),
+    ('estanteria_zona', 'estanteria__zona'),
+    ('estanteria_codigo', 'estanteria__codigo'),
+    'nivel', 'codigo', 'capacidad', 'stock', 'fecha_actualizacion',
+)
+
+BODEGA_DOC = Serializer(('postgres_id', 'codigo'), 'codigo', 'ciudad', 'direccion')
+
+ESTANTERIA_DOC = Serializer('zona', 'codigo', 'niveles')
+
+UBICACION_EN_BODEGA_DOC = Serializer(
+    'id', 'nivel', 'codigo', 'capacidad', 'stock', 'fecha_actualizacion',
+    ('producto', Serializer('codigo', 'nombre', 'precio')),
+)
+
+
+# ============================================
+# DOCUMENTOS
+# ============================================
+
+def content_hash(documento):
+    """
+    Hash del contenido de negocio de un documento: JSON canónico (claves
+    ordenadas) sin CAMPOS_NO_CONTENIDO. Es el mismo para el documento recién
+    construido y para el leído de MongoDB.
+    """
+    contenido = {campo: valor for campo, valor in documento.items() if campo not in CAMPOS_NO_CONTENIDO}
+    return hashlib.blake2b(dumps(contenido, sort_keys=True), digest_size=16).hexdigest()
+
+
+def _agrupar(filas, serializer, posicion=-1):
+    """Agrupa las filas por la columna extra en `posicion`, construyendo cada subdocumento."""
+    construir = serializer.build
+    grupos = {}
+    for fila in filas:
+        grupos.setdefault(fila[posicion], []).append(construir(fila))
+    return grupos
+
+
+def _iso(documento, *campos):
+    for campo in campos:
+        documento[campo] = documento[campo].isoformat()
+    return documento
+
+
+def build_ubicacion_subdocument(ubicacion):
+    """
+    Construye el subdocumento de una ubicación tal como se embebe en la bodega.
+    """
+    producto = ubicacion.producto
+    return _ubicacion_en_bodega({
+        'id': ubicacion.id,
+        'nivel': ubicacion.nivel,
+        'codigo': ubicacion.codigo,
+        'capacidad': ubicacion.capacidad,
+        'stock': ubicacion.stock,
+        'fecha_actualizacion': ubicacion.fecha_actualizacion,
+        'producto': {
+            'codigo': producto.codigo if producto else None,
+            'nombre': producto.nombre if producto else None,
+            'precio': producto.precio if producto else None,
+        },
+    })
+
+
+def _ubicacion_en_bodega(ub_data):
+    """Ajusta el subdocumento de UBICACION_EN_BODEGA_DOC: fecha en ISO y producto solo si existe."""
+    _iso(ub_data, 'fecha_actualizacion')
+    if ub_data['producto']['codigo'] is None:
+        del ub_data['producto']
+    return ub_data
+
+
+# ============================================
+# CONSTRUCCIÓN EN LOTE
+# ============================================
+
+def build_pedido_documents(ids):
+    """Documentos de varios pedidos con sus items, en 2 consultas. Retorna id -> documento."""
+    from manejador_pedidos.models import Pedido, Item
+
+    ids = [int(pk) for pk in ids]
+    items = _agrupar(
+        ITEM_DOC.rows(Item.objects.filter(pedido_id__in=ids).order_by('id'), 'pedido_id'),
+        ITEM_DOC,
+    )
+
+    documentos = {}
+    sync_timestamp = datetime.now().isoformat()
+    for fila in PEDIDO_DOC.rows(Pedido.objects.filter(id__in=ids)):
+        pedido_data = _iso(PEDIDO_DOC.build(fila), 'fecha_creacion', 'fecha_actualizacion')
+        pedido_data['items'] = items.get(pedido_data['postgres_id'], [])
+
+        total = 0
+        for item in pedido_data['items']:
+            item['subtotal'] = item['cantidad'] * item['producto_precio']
+            total += item['subtotal']
+
+        pedido_data['total'] = total
+        pedido_data['num_items'] = len(pedido_data['items'])
+        pedido_data['content_hash'] = content_hash(pedido_data)
+        pedido_data['sync_timestamp'] = sync_timestamp
+        documentos[pedido_data['postgres_id']] = pedido_data
+    return documentos
+
+
+def build_producto_documents(codigos):
+    """Documentos de varios productos con sus ubicaciones, en 2 consultas. Retorna código -> documento."""
+    from manejador_inventario.models import Producto, Ubicacion
+
+    codigos = list(codigos)
+    ubicaciones = _agrupar(
+        UBICACION_EN_PRODUCTO_DOC.rows(Ubicacion.objects.filter(producto_id__in=codigos).order_by('id'), 'producto_id'),
+        UBICACION_EN_PRODUCTO_DOC,
+    )
+
+    documentos = {}
+    sync_timestamp = datetime.now().isoformat()
+    filas = PRODUCTO_DOC.rows(Producto.objects.filter(codigo__in=codigos), 'totales__stock_total', 'totales__num_ubicaciones')
+    for fila in filas:
+        producto_data = PRODUCTO_DOC.build(fila)
+        producto_data['ubicaciones'] = ubicaciones.get(producto_data['codigo'], [])
+        for ub_data in producto_data['ubicaciones']:
+            ub_data['codigo_completo'] = (
+                f"{ub_data['estanteria_zona']}{ub_data['estanteria_codigo']}{ub_data['nivel']}{ub_data['codigo']}"
+            )
+            _iso(ub_data, 'fecha_actualizacion')
+
+        stock_total, num_ubicaciones = fila[-2], fila[-1]
+        if stock_total is not None:
+            producto_data['stock_total'] = stock_total
+            producto_data['num_ubicaciones'] = num_ubicaciones
+        else:
+            # Agregados aún no calculados: se suman las ubicaciones
+            producto_data['stock_total'] = sum(ub['stock'] for ub in producto_data['ubicaciones'])
+            producto_data['num_ubicaciones'] = len(producto_data['ubicaciones'])
+        producto_data['content_hash'] = content_hash(producto_data)
+        producto_data['sync_timestamp'] = sync_timestamp
+        documentos[producto_data['codigo']] = producto_data
+    return documentos
+
+
+def build_bodega_documents(codigos):
+    """Documentos de varias bodegas con estanterías y ubicaciones, en 3 consultas. Retorna código -> documento."""
+    from manejador_inventario.models import Bodega, Estanteria, Ubicacion
+
+    codigos = list(codigos)
+    ubicaciones = {}
+    for fila in UBICACION_EN_BODEGA_DOC.rows(
+        Ubicacion.objects.filter(estanteria__bodega_id__in=codigos).order_by('nivel', 'codigo'), 'estanteria_id',
+    ):
+        ubicaciones.setdefault(fila[-1], []).append(_ubicacion_en_bodega(UBICACION_EN_BODEGA_DOC.build(fila)))
+
+    estanterias = {}
+    for fila in ESTANTERIA_DOC.rows(
+        Estanteria.objects.filter(bodega_id__in=codigos).order_by('zona', 'codigo'), 'id', 'bodega_id',
+    ):
+        est_data = ESTANTERIA_DOC.build(fila)
+        est_data['ubicaciones'] = ubicaciones.get(fila[-2], [])
+        estanterias.setdefault(fila[-1], []).append(est_data)
+
+    documentos = {}
+    sync_timestamp = datetime.now().isoformat()
+    filas = BODEGA_DOC.rows(Bodega.objects.filter(codigo__in=codigos), 'totales__total_stock', 'totales__total_ubicaciones')
+    for fila in filas:
+        bodega_data = BODEGA_DOC.build(fila)
+        bodega_data['estanterias'] = estanterias.get(bodega_data['codigo'], [])
+
+        total_stock, total_ubicaciones = fila[-2], fila[-1]
+        if total_stock is not None:
+            bodega_data['total_ubicaciones'] = total_ubicaciones
+            bodega_data['total_stock'] = total_stock
+        else:
+            todas = [ub for est in bodega_data['estanterias'] for ub in est['ubicaciones']]
+            bodega_data['total_ubicaciones'] = len(todas)
+            bodega_data['total_stock'] = sum(ub['stock'] for ub in todas)
+        bodega_data['content_hash'] = content_hash(bodega_data)
+        bodega_data['sync_timestamp'] = sync_timestamp
+        documentos[bodega_data['codigo']] = bodega_data
+    return documentos
+
+
+def load_documents(entidad, claves):
+    """
+    Construye los documentos actuales de varias entidades a la vez.
+
+    Retorna un diccionario clave -> documento, con las claves como texto. Las
+    claves que ya no existen en PostgreSQL no aparecen en el resultado.
+    """
+    if entidad == 'pedido':
+        return {str(pk): doc for pk, doc in build_pedido_documents(claves).items()}
+    if entidad == 'producto':
+        return build_producto_documents(claves)
+    if entidad == 'bodega':
+        return build_bodega_documents(claves)
+    raise ValueError(f"Entidad desconocida: {entidad}")
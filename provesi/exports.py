@@ -0,0 +1,271 @@
+"""
+Exportación en streaming de productos, ubicaciones y pedidos.
+
+Las filas se leen con .iterator(chunk_size=...) (cursor del lado del
+servidor en PostgreSQL), se serializan con provesi.serializers y se emiten
+como NDJSON o CSV, opcionalmente comprimidas con gzip. Nada se acumula en
+memoria más allá de un bloque, sin importar cuántas filas haya.
+
+Cada exportación sigue el orden de su clave (código del producto, id de la
+ubicación o del pedido), de modo que una exportación interrumpida se
+retoma con `despues` = última clave recibida; `hasta` acota el rango.
+"""
+import csv
+import zlib
+
+from . import serializers
+
+FORMATOS = ('ndjson', 'csv')
+
+CHUNK_SIZE = 2000
+MAX_CHUNK_SIZE = 20000
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+class ExportError(ValueError):
+    """Parámetros de exportación inválidos."""
+
+
+# ============================================
+# FUENTES
+# ============================================
+
+class _Fuente:
+    """Entidad exportable: queryset ordenado por su clave y cómo convertir las filas."""
+
+    clave = 'pk'
+    clave_entera = True
+
+    def queryset(self):
+        raise NotImplementedError
+
+    def filas(self, queryset, chunk_size):
+        """Diccionarios a exportar, en orden de clave."""
+        construir = self.serializer.build
+        for fila in self.serializer.rows(queryset).iterator(chunk_size=chunk_size):
+            yield construir(fila)
+
+    def columnas(self):
+        return _columnas(self.serializer.campos)
+
+    def filas_csv(self, queryset, chunk_size):
+        for fila in self.filas(queryset, chunk_size):
+            yield _aplanar(fila)
+
+    def rango(self, despues=None, hasta=None):
+        """Queryset limitado a claves > despues y <= hasta, en orden de clave."""
+        queryset = self.queryset().order_by(self.clave)
+        if despues is not None:
+            queryset = queryset.filter(**{f'{self.clave}__gt': self.parse_clave(despues)})
+        if hasta is not None:
+            queryset = queryset.filter(**{f'{self.clave}__lte': self.parse_clave(hasta)})
+        return queryset
+
+    def parse_clave(self, valor):
+        if not self.clave_entera:
+            return str(valor)
+        try:
+            return int(valor)
+        except (TypeError, ValueError):
+            raise ExportError(f"Clave inválida: {valor!r}")
+
+
+class _Productos(_Fuente):
+    serializer = serializers.PRODUCTO
+    clave = 'codigo'
+    clave_entera = False
+
+    def queryset(self):
+        from manejador_inventario.models import Producto
+        return Producto.objects.all()
+
+
+class _Ubicaciones(_Fuente):
+    serializer = serializers.UBICACION
+    clave = 'id'
+
+    def queryset(self):
+        from manejador_inventario.models import Ubicacion
+        return Ubicacion.objects.all()
+
+
+class _Pedidos(_Fuente):
+    """
+    Pedidos con sus ítems. Se leen con un LEFT JOIN ordenado por pedido e
+    ítem y se agrupan las filas consecutivas de cada pedido, así que basta un
+    cursor. En CSV se emite una fila por ítem (y una sin ítem para los
+    pedidos vacíos).
+    """
+    serializer = serializers.PEDIDO
+    clave = 'id'
+    campos_item = ('items__id', 'items__producto_id', 'items__cantidad')
+    columnas_item = ('item.id', 'item.producto', 'item.cantidad')
+
+    def queryset(self):
+        from manejador_pedidos.models import Pedido
+        return Pedido.objects.all()
+
+    def _filas_con_item(self, queryset, chunk_size):
+        construir = self.serializer.build
+        filas = (
+            self.serializer.rows(queryset.order_by('id', 'items__id'), *self.campos_item)
+            .iterator(chunk_size=chunk_size)
+        )
+        for fila in filas:
+            item_id, producto, cantidad = fila[-3:]
+            item = None if item_id is None else {'id': item_id, 'producto': producto, 'cantidad': cantidad}
+            yield construir(fila), item
+
+    def filas(self, queryset, chunk_size):
+        actual = None
+        for pedido, item in self._filas_con_item(queryset, chunk_size):
+            if actual is None or actual['id'] != pedido['id']:
+                if actual is not None:
+                    yield actual
+                actual = dict(pedido, items=[])
+            if item is not None:
+                actual['items'].append(item)
+        if actual is not None:
+            yield actual
+
+    def columnas(self):
+        return super().columnas() + list(self.columnas_item)
+
+    def filas_csv(self, queryset, chunk_size):
+        for pedido, item in self._filas_con_item(queryset, chunk_size):
+            pedido['fecha_creacion'] = pedido['fecha_creacion'].isoformat()
+            pedido['fecha_actualizacion'] = pedido['fecha_actualizacion'].isoformat()
+            if item is not None:
+                pedido.update({f'item.{campo}': valor for campo, valor in item.items()})
+            yield pedido
+
+
+FUENTES = {
+    'productos': _Productos(),
+    'ubicaciones': _Ubicaciones(),
+    'pedidos': _Pedidos(),
+}
+
+
+def _columnas(campos, prefijo=''):
+    """Nombres de columna CSV de un serializer, con las relaciones anidadas como a.b.c."""
+    columnas = []
+    for campo in campos:
+        if isinstance(campo, str):
+            campo = (campo, campo)
+        clave, ruta = campo[0], campo[1]
+        if isinstance(ruta, serializers.Serializer):
+            columnas.extend(_columnas(ruta.campos, f'{prefijo}{clave}.'))
+        else:
+            columnas.append(prefijo + clave)
+    return columnas
+
+
+def _aplanar(fila, prefijo=''):
+    plana = {}
+    for clave, valor in fila.items():
+        if isinstance(valor, dict):
+            plana.update(_aplanar(valor, f'{prefijo}{clave}.'))
+        else:
+            plana[prefijo + clave] = valor
+    return plana
+
+
+# ============================================
+# CODIFICACIÓN
+# ============================================
+
+class _Eco:
+    """Archivo de solo escritura que devuelve lo escrito, para csv.writer."""
+
+    def write(self, valor):
+        return valor
+
+
+def _ndjson(fuente, queryset, chunk_size):
+    dumps = serializers.dumps
+    bloque = []
+    for fila in fuente.filas(queryset, chunk_size):
+        bloque.append(dumps(fila))
+        if len(bloque) >= chunk_size:
+            yield b'\n'.join(bloque) + b'\n'
+            bloque = []
+    if bloque:
+        yield b'\n'.join(bloque) + b'\n'
+
+
+def _csv(fuente, queryset, chunk_size):
+    columnas = fuente.columnas()
+    escritor = csv.DictWriter(_Eco(), fieldnames=columnas, extrasaction='ignore')
+    yield escritor.writeheader().encode()
+    bloque = []
+    for fila in fuente.filas_csv(queryset, chunk_size):
+        bloque.append(escritor.writerow(fila))
+        if len(bloque) >= chunk_size:
+            yield ''.join(bloque).encode()
+            bloque = []
+    if bloque:
+        yield ''.join(bloque).encode()
+
+
+def _gzip(partes):
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for parte in partes:
+        comprimido = compresor.compress(parte)
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
+
+
+def export_stream(entidad, formato='ndjson', gzip=False, despues=None, hasta=None, chunk_size=CHUNK_SIZE):
+    """
+    Generador de bytes con la exportación de una entidad.
+
+    entidad: 'productos', 'ubicaciones' o 'pedidos'. formato: 'ndjson' o 'csv'.
+    Lanza ExportError si algún parámetro es inválido.
+    """
+    if entidad not in FUENTES:
+        raise ExportError(f"Entidad desconocida: {entidad}")
+    if formato not in FORMATOS:
+        raise ExportError(f"Formato desconocido: {formato}")
+    if not 1 <= chunk_size <= MAX_CHUNK_SIZE:
+        raise ExportError(f"chunk_size debe estar entre 1 y {MAX_CHUNK_SIZE}")
+
+    fuente = FUENTES[entidad]
+    queryset = fuente.rango(despues, hasta)
+    partes = (_ndjson if formato == 'ndjson' else _csv)(fuente, queryset, chunk_size)
+    return _gzip(partes) if gzip else partes
+
+
+def export_response(request, entidad):
+    """
+    StreamingHttpResponse con la exportación pedida en los parámetros GET:
+    formato, gzip=1, despues, hasta y chunk.
+    """
+    from django.http import JsonResponse, StreamingHttpResponse
+
+    formato = request.GET.get('formato', 'ndjson')
+    gzip = request.GET.get('gzip') == '1'
+    try:
+        chunk_size = int(request.GET.get('chunk', CHUNK_SIZE))
+        stream = export_stream(
+            entidad, formato, gzip,
+            despues=request.GET.get('despues') or None,
+            hasta=request.GET.get('hasta') or None,
+            chunk_size=chunk_size,
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    nombre = f"{entidad}.{formato}"
+    if gzip:
+        respuesta = StreamingHttpResponse(stream, content_type='application/gzip')
+        nombre += '.gz'
+    else:
+        respuesta = StreamingHttpResponse(stream, content_type=CONTENT_TYPES[formato])
+    respuesta['Content-Disposition'] = f'attachment; filename="{nombre}"'
+    return respuesta
@@ -0,0 +1,66 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from manejador_inventario.models import Bodega, Estanteria, Producto, Ubicacion
+from manejador_pedidos.models import Item, Pedido
+from provesi import serializers
+
+CASOS = [
+    ('bodegas', Bodega, serializers.BODEGA),
+    ('estanterias', Estanteria, serializers.ESTANTERIA),
+    ('productos', Producto, serializers.PRODUCTO),
+    ('ubicaciones', Ubicacion, serializers.UBICACION),
+    ('pedidos', Pedido, serializers.PEDIDO),
+    ('items', Item, serializers.ITEM),
+]
+
+
+class Command(BaseCommand):
+    help = 'Compara toJson() por instancia contra los serializers por queryset y json contra dumps()'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limite', type=int, default=5000, help='Filas por entidad')
+        parser.add_argument('--repeticiones', type=int, default=3, help='Repeticiones; se informa la mejor')
+
+    def _medir(self, funcion, repeticiones):
+        mejor, consultas, resultado = None, 0, None
+        for _ in range(repeticiones):
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                resultado = funcion()
+                duracion = time.perf_counter() - inicio
+            if mejor is None or duracion < mejor:
+                mejor, consultas = duracion, len(capturadas)
+        return mejor, consultas, resultado
+
+    def handle(self, *args, **options):
+        limite, repeticiones = options['limite'], options['repeticiones']
+        if serializers.orjson is None:
+            self.stdout.write(self.style.WARNING('⚠️  orjson no está instalado: dumps() usa json'))
+
+        self.stdout.write(
+            f'{"entidad":<12} {"filas":>6} {"toJson ms":>10} {"consultas":>9} '
+            f'{"serializer ms":>13} {"consultas":>9} {"json ms":>8} {"dumps ms":>9}'
+        )
+        for nombre, modelo, serializer in CASOS:
+            queryset = modelo.objects.order_by('pk')[:limite]
+
+            antes, consultas_antes, datos = self._medir(
+                lambda: [instancia.toJson() for instancia in queryset.all()], repeticiones,
+            )
+            despues, consultas_despues, datos = self._medir(
+                lambda: serializer.serialize(queryset.all()), repeticiones,
+            )
+            json_ms, _, _ = self._medir(lambda: json.dumps(datos, cls=DjangoJSONEncoder), repeticiones)
+            dumps_ms, _, _ = self._medir(lambda: serializers.dumps(datos), repeticiones)
+
+            self.stdout.write(
+                f'{nombre:<12} {len(datos):>6} {antes * 1000:>10.1f} {consultas_antes:>9} '
+                f'{despues * 1000:>13.1f} {consultas_despues:>9} {json_ms * 1000:>8.1f} {dumps_ms * 1000:>9.1f}'
+            )
+        self.stdout.write(self.style.SUCCESS('✅ Benchmark terminado'))
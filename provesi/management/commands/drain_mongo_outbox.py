@@ -0,0 +1,70 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from provesi.outbox import drain_all, get_outbox_config, MongoUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Espera máxima entre reintentos tras errores consecutivos en modo --loop
+ESPERA_MAXIMA = 60.0
+
+
+class Command(BaseCommand):
+    help = 'Aplica en MongoDB los cambios pendientes del outbox de sincronización'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Entradas a procesar por lote (por defecto MONGODB_OUTBOX["batch_size"])',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Seguir drenando indefinidamente',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=None,
+            help='Segundos entre revisiones en modo --loop',
+        )
+
+    def handle(self, *args, **options):
+        config = get_outbox_config()
+        batch_size = options['batch_size'] or config['batch_size']
+        interval = options['interval'] or config['poll_interval']
+
+        espera = interval
+        while True:
+            try:
+                inicio = time.monotonic()
+                total = drain_all(batch_size)
+                if total:
+                    duracion = time.monotonic() - inicio
+                    self.stdout.write(self.style.SUCCESS(
+                        f'✅ {total} entradas aplicadas en {duracion:.2f}s'
+                    ))
+                espera = interval
+            except MongoUnavailable:
+                self.stdout.write(self.style.ERROR('❌ MongoDB no disponible'))
+                if not options['loop']:
+                    return
+            except Exception as e:
+                if not options['loop']:
+                    raise
+                # Un error inesperado (p. ej. PostgreSQL reiniciado) no debe detener el drenador
+                espera = min(espera * 2, ESPERA_MAXIMA)
+                logger.exception('Error drenando el outbox')
+                self.stderr.write(self.style.ERROR(
+                    f'❌ Error drenando el outbox ({e}); reintentando en {espera:.1f}s'
+                ))
+            finally:
+                close_old_connections()
+
+            if not options['loop']:
+                return
+            time.sleep(espera)
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from provesi.mongodb_sync import get_mongo_db
+from provesi.mongo_indexes import check_drift, ensure_indexes, explain_hot_queries
+
+
+class Command(BaseCommand):
+    help = 'Crea los índices declarados del modelo de lectura en MongoDB y reporta diferencias'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Solo reportar diferencias, sin crear índices',
+        )
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Recrear los índices cuyo spec difiere del declarado',
+        )
+        parser.add_argument(
+            '--drop-extra',
+            action='store_true',
+            help='Eliminar los índices que no están declarados',
+        )
+        parser.add_argument(
+            '--explain',
+            action='store_true',
+            help='Verificar con explain() que las consultas frecuentes usan índices',
+        )
+
+    def handle(self, *args, **options):
+        db = get_mongo_db()
+        if db is None:
+            raise CommandError('❌ No se pudo conectar a MongoDB')
+
+        if not options['check']:
+            creados = ensure_indexes(db, fix=options['fix'], drop_extra=options['drop_extra'])
+            if creados:
+                self.stdout.write(self.style.SUCCESS(f'✅ Índices creados: {", ".join(creados)}'))
+            else:
+                self.stdout.write(self.style.SUCCESS('✅ Todos los índices declarados existen'))
+
+        hay_drift = False
+        for coleccion, estado in check_drift(db).items():
+            for tipo in ('faltantes', 'distintos', 'sobrantes'):
+                if estado[tipo]:
+                    hay_drift = hay_drift or tipo != 'sobrantes'
+                    self.stdout.write(self.style.WARNING(f'⚠️  {coleccion}: {tipo}: {", ".join(estado[tipo])}'))
+
+        hay_fallos = False
+        if options['explain']:
+            self.stdout.write('🔎 Plan de las consultas frecuentes:')
+            for coleccion, filtro, esperado, usado, ok in explain_hot_queries(db):
+                linea = f'   {coleccion} {filtro}: {usado} (esperado {esperado})'
+                if ok:
+                    self.stdout.write(self.style.SUCCESS(f'✅{linea}'))
+                else:
+                    hay_fallos = True
+                    self.stdout.write(self.style.ERROR(f'❌{linea}'))
+
+        if options['check'] and (hay_drift or hay_fallos):
+            raise CommandError('Los índices de MongoDB no coinciden con los declarados')
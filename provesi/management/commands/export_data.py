@@ -0,0 +1,87 @@
+import json
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from provesi.exports import CHUNK_SIZE, FORMATOS, FUENTES, ExportError, export_stream
+
+
+class Command(BaseCommand):
+    help = 'Exporta productos, ubicaciones o pedidos en NDJSON o CSV, en streaming'
+
+    def add_arguments(self, parser):
+        parser.add_argument('entidad', choices=sorted(FUENTES), help='Entidad a exportar')
+        parser.add_argument('--formato', choices=FORMATOS, default='ndjson', help='Formato de salida (default: ndjson)')
+        parser.add_argument('--gzip', action='store_true', help='Comprimir la salida con gzip')
+        parser.add_argument('--despues', help='Exportar solo claves mayores que esta')
+        parser.add_argument('--hasta', help='Exportar solo claves hasta esta (incluida)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help=f'Filas por bloque (default: {CHUNK_SIZE})')
+        parser.add_argument('--output', '-o', help='Archivo de salida (por defecto, la salida estándar)')
+        parser.add_argument(
+            '--continuar',
+            action='store_true',
+            help='Retomar una exportación NDJSON sin comprimir en --output desde su última línea completa',
+        )
+
+    def handle(self, *args, **options):
+        entidad = options['entidad']
+        despues = options['despues']
+        modo = 'wb'
+
+        if options['continuar']:
+            if not options['output'] or options['formato'] != 'ndjson' or options['gzip']:
+                raise CommandError('--continuar requiere --output con formato ndjson sin --gzip')
+            if os.path.exists(options['output']):
+                despues = self._ultima_clave(options['output'], FUENTES[entidad].clave) or despues
+                modo = 'ab'
+            if despues is not None:
+                self.stderr.write(f'↪️  Retomando {entidad} después de {despues}')
+
+        try:
+            stream = export_stream(
+                entidad, options['formato'], options['gzip'],
+                despues=despues, hasta=options['hasta'], chunk_size=options['chunk_size'],
+            )
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        inicio = time.monotonic()
+        escritos = 0
+        salida = open(options['output'], modo) if options['output'] else sys.stdout.buffer
+        try:
+            for parte in stream:
+                salida.write(parte)
+                escritos += len(parte)
+        finally:
+            if options['output']:
+                salida.close()
+            else:
+                salida.flush()
+
+        self.stderr.write(self.style.SUCCESS(
+            f'✅ {entidad}: {escritos / 1024:.0f} KiB en {time.monotonic() - inicio:.1f}s'
+        ))
+
+    def _ultima_clave(self, path, clave):
+        """
+        Clave de la última línea completa del archivo. Descarta una línea
+        final incompleta (exportación interrumpida a mitad de escritura).
+        """
+        ultima, fin_ultima = None, 0
+        with open(path, 'rb') as archivo:
+            posicion = 0
+            for linea in archivo:
+                posicion += len(linea)
+                if linea.endswith(b'\n'):
+                    ultima, fin_ultima = linea, posicion
+        if fin_ultima != os.path.getsize(path):
+            with open(path, 'r+b') as archivo:
+                archivo.truncate(fin_ultima)
+        if ultima is None:
+            return None
+        try:
+            return json.loads(ultima)[clave]
+        except (ValueError, KeyError):
+            raise CommandError(f'La última línea de {path} no es un registro NDJSON válido')
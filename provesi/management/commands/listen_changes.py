@@ -0,0 +1,97 @@
+import signal
+import time
+
+import psycopg2
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from provesi.change_feed import (
+    ChangeListener,
+    get_change_feed_config,
+    install_triggers,
+    process_notifications,
+    uninstall_triggers,
+)
+
+# Espera máxima entre intentos de reconexión
+ESPERA_MAXIMA = 60.0
+
+
+class Command(BaseCommand):
+    help = 'Consume los avisos LISTEN/NOTIFY de los triggers y los pasa al outbox y a la caché'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--install', action='store_true', help='Instalar los triggers y salir')
+        parser.add_argument('--uninstall', action='store_true', help='Eliminar los triggers y salir')
+        parser.add_argument('--batch-size', type=int, default=None, help='Avisos por lote')
+        parser.add_argument('--batch-window', type=float, default=None, help='Segundos de espera para completar un lote')
+        parser.add_argument('--idle-timeout', type=float, default=5, help='Segundos de espera cuando no hay avisos')
+
+    def _reconectar(self, listener, espera, detenido):
+        """Reintenta conectar el listener, con espera creciente, hasta lograrlo o hasta detenerse."""
+        while not detenido:
+            time.sleep(espera)
+            try:
+                listener.connect()
+            except psycopg2.OperationalError as e:
+                listener.close()
+                espera = min(max(espera * 2, 1.0), ESPERA_MAXIMA)
+                self.stderr.write(self.style.WARNING(f'⚠️  No se pudo reconectar ({e}), reintentando en {espera:.0f}s'))
+            else:
+                self.stdout.write(self.style.SUCCESS('✅ Listener reconectado'))
+                return
+
+    def handle(self, *args, **options):
+        try:
+            if options['install']:
+                install_triggers()
+                self.stdout.write(self.style.SUCCESS('✅ Triggers de captura de cambios instalados'))
+                return
+            if options['uninstall']:
+                uninstall_triggers()
+                self.stdout.write(self.style.SUCCESS('✅ Triggers de captura de cambios eliminados'))
+                return
+
+            listener = ChangeListener(batch_size=options['batch_size'], batch_window=options['batch_window'])
+            listener.connect()
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        detenido = []
+
+        def detener(signum, frame):
+            self.stdout.write('⏹️  Deteniendo listener...')
+            detenido.append(signum)
+
+        signal.signal(signal.SIGTERM, detener)
+        signal.signal(signal.SIGINT, detener)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"🎧 Escuchando el canal {get_change_feed_config()['channel']}"
+        ))
+        total = 0
+        try:
+            while not detenido:
+                try:
+                    lote = listener.next_batch(options['idle_timeout'])
+                except psycopg2.OperationalError as e:
+                    # Los avisos emitidos mientras no se escucha se pierden
+                    self.stderr.write(self.style.WARNING(f'⚠️  Conexión de escucha perdida ({e}), reconectando...'))
+                    listener.close()
+                    self._reconectar(listener, options['idle_timeout'], detenido)
+                    continue
+                if not lote:
+                    continue
+                try:
+                    procesados = process_notifications(lote)
+                except Exception as e:
+                    # El outbox y verify_mongo_sync cubren los avisos perdidos
+                    self.stderr.write(self.style.ERROR(f'❌ Error procesando {len(lote)} avisos: {e}'))
+                    continue
+                finally:
+                    close_old_connections()
+                total += procesados
+                self.stdout.write(f'   … {procesados} avisos procesados ({total} en total)')
+        finally:
+            listener.close()
+        self.stdout.write(self.style.SUCCESS(f'✅ {total} avisos procesados'))
@@ -0,0 +1,58 @@
+import signal
+
+from django.core.management.base import BaseCommand
+from provesi.sync_worker import SyncWorker
+
+
+class Command(BaseCommand):
+    help = 'Worker dedicado que aplica el outbox en MongoDB con reintentos y cola de descartes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=None, help='Hilos de aplicación en paralelo')
+        parser.add_argument('--batch-size', type=int, default=None, help='Entradas reservadas por lote')
+        parser.add_argument('--max-intentos', type=int, default=None, help='Intentos antes de descartar una entrada')
+        parser.add_argument(
+            '--max-intentos-conexion',
+            type=int,
+            default=None,
+            help='Intentos antes de descartar una entrada cuando los fallos son de conexión con MongoDB',
+        )
+        parser.add_argument('--stats-interval', type=int, default=30, help='Segundos entre reportes de estadísticas')
+        parser.add_argument('--once', action='store_true', help='Procesar un solo lote y salir')
+
+    def handle(self, *args, **options):
+        worker = SyncWorker(
+            threads=options['threads'],
+            batch_size=options['batch_size'],
+            max_intentos=options['max_intentos'],
+            max_intentos_conexion=options['max_intentos_conexion'],
+        )
+
+        if options['once']:
+            filas = worker.run_once()
+            worker.executor.shutdown(wait=True)
+            self._print_stats(worker.report())
+            self.stdout.write(self.style.SUCCESS(f'✅ {filas} entradas procesadas'))
+            return
+
+        def detener(signum, frame):
+            self.stdout.write('⏹️  Deteniendo worker...')
+            worker.stop()
+
+        signal.signal(signal.SIGTERM, detener)
+        signal.signal(signal.SIGINT, detener)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"🚀 Worker de sincronización iniciado ({worker.config['threads']} hilos)"
+        ))
+        worker.run(stats_interval=options['stats_interval'], on_stats=self._print_stats)
+        self._print_stats(worker.report())
+
+    def _print_stats(self, resumen):
+        self.stdout.write(
+            f"📊 aplicados={resumen['aplicados']} filas={resumen['filas']} "
+            f"reintentos={resumen['reintentos']} descartados={resumen['descartados']} "
+            f"{resumen['por_segundo_ultimo_minuto']:.1f}/s "
+            f"escritos={resumen['escritos']} omitidos={resumen['omitidos']} "
+            f"pendientes={resumen['pendientes']} lag={resumen['lag_segundos']:.1f}s"
+        )
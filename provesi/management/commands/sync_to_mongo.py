@@ -1,12 +1,18 @@
-from django.core.management.base import BaseCommand
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from manejador_pedidos.models import Pedido
 from manejador_inventario.models import Producto, Bodega
 from provesi.mongodb_sync import (
     sync_pedido_to_mongo,
     sync_producto_to_mongo,
     sync_bodega_to_mongo,
+    get_write_stats,
     test_connection
 )
+from provesi.bulk_sync import ENTIDADES, ENTIDADES_INCREMENTALES, sync_entidad_bulk, sync_all_parallel
 
 class Command(BaseCommand):
     help = 'Sincroniza todos los datos existentes de PostgreSQL a MongoDB'
@@ -17,6 +23,85 @@ class Command(BaseCommand):
             action='store_true',
             help='Solo probar conexión sin sincronizar',
         )
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Modo masivo: cursores del servidor, prefetch y bulk_write por bloques',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Filas por bloque en modo masivo (default: 1000)',
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=0,
+            help='Sincronizar cada colección en un proceso aparte (modo masivo)',
+        )
+        parser.add_argument(
+            '--since',
+            type=str,
+            default=None,
+            help=(
+                'Solo pedidos modificados desde esta fecha (YYYY-MM-DD o ISO 8601), modo masivo. '
+                'No aplica a productos ni bodegas, que no tienen fecha de modificación propia, '
+                'ni propaga eliminaciones: para eso use verify_mongo_sync --repair'
+            ),
+        )
+        parser.add_argument(
+            '--only',
+            choices=ENTIDADES,
+            action='append',
+            help='Limitar a una entidad (se puede repetir)',
+        )
+
+    def _parse_since(self, value):
+        if not value:
+            return None
+        since = parse_datetime(value)
+        if since is None:
+            fecha = parse_date(value)
+            if fecha is None:
+                raise CommandError(f'Fecha inválida para --since: {value}')
+            since = datetime.combine(fecha, datetime.min.time())
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        return since
+
+    def _progress(self, entidad, filas, segundos):
+        velocidad = filas / segundos if segundos else 0
+        self.stdout.write(f'   … {entidad}: {filas} filas ({velocidad:.0f} filas/s)')
+
+    def handle_bulk(self, options):
+        since = self._parse_since(options['since'])
+        entidades = options['only'] or list(ENTIDADES_INCREMENTALES if since else ENTIDADES)
+        chunk_size = options['chunk_size']
+        if since:
+            no_incrementales = [entidad for entidad in entidades if entidad not in ENTIDADES_INCREMENTALES]
+            if no_incrementales:
+                raise CommandError(
+                    f"--since no admite {', '.join(no_incrementales)}: sincronícelos sin --since"
+                )
+
+        if since:
+            self.stdout.write(f'🕒 Sincronización incremental desde {since.isoformat()}')
+
+        if options['processes']:
+            self.stdout.write(f'⚙️  {len(entidades)} colecciones en paralelo')
+            resultados = sync_all_parallel(entidades, since, chunk_size, options['processes'])
+        else:
+            resultados = []
+            for entidad in entidades:
+                self.stdout.write(f'📦 Sincronizando {entidad}s...')
+                resultados.append(sync_entidad_bulk(entidad, since, chunk_size, progress=self._progress))
+
+        for resultado in resultados:
+            self.stdout.write(self.style.SUCCESS(
+                f"   ✅ {resultado['filas']} {resultado['entidad']}s en {resultado['segundos']:.2f}s "
+                f"({resultado['filas_por_segundo']:.0f} filas/s)"
+            ))
 
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('=' * 50))
@@ -36,6 +121,13 @@ class Command(BaseCommand):
             self.stdout.write(self.style.SUCCESS('✅ Test de conexión completado'))
             return
         
+        if options['bulk']:
+            self.handle_bulk(options)
+            self.stdout.write(self.style.SUCCESS('=' * 50))
+            self.stdout.write(self.style.SUCCESS('✅ Sincronización completada'))
+            self.stdout.write(self.style.SUCCESS('=' * 50))
+            return
+        
         # Sincronizar Pedidos
         self.stdout.write('📦 Sincronizando pedidos...')
         pedidos_ok = 0
@@ -60,6 +152,11 @@ class Command(BaseCommand):
                 bodegas_ok += 1
         self.stdout.write(self.style.SUCCESS(f'   ✅ {bodegas_ok} bodegas sincronizadas\n'))
         
+        escrituras = get_write_stats()
+        self.stdout.write(
+            f"📊 {escrituras['escritos']} documentos escritos, {escrituras['omitidos']} sin cambios omitidos\n"
+        )
+        
         # Resumen
         self.stdout.write(self.style.SUCCESS('=' * 50))
         self.stdout.write(self.style.SUCCESS('✅ Sincronización completada'))
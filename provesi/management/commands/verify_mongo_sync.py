@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from provesi.bulk_sync import ENTIDADES
+from provesi.mongodb_sync import test_connection
+from provesi.verify_sync import BUCKET_SIZE, verify_entidad
+
+TIPOS = ('faltantes', 'desactualizados', 'huerfanos')
+
+
+class Command(BaseCommand):
+    help = 'Compara PostgreSQL y MongoDB por rangos de hashes y repara solo los documentos divergentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Reescribir o eliminar los documentos divergentes')
+        parser.add_argument(
+            '--only',
+            choices=ENTIDADES,
+            action='append',
+            help='Limitar a una entidad (se puede repetir)',
+        )
+        parser.add_argument(
+            '--bucket-size',
+            type=int,
+            default=BUCKET_SIZE,
+            help=f'Claves por rango comparado (default: {BUCKET_SIZE})',
+        )
+        parser.add_argument('--max-detalle', type=int, default=10, help='Claves divergentes a mostrar por tipo')
+        parser.add_argument(
+            '--rehash',
+            action='store_true',
+            help='Hashear los documentos completos de MongoDB en lugar de usar su content_hash '
+                 '(detecta ediciones hechas por fuera de la sincronización)',
+        )
+
+    def _progress(self, entidad, rangos, documentos):
+        if rangos % 50 == 0:
+            self.stdout.write(f'   … {entidad}: {rangos} rangos, {documentos} documentos')
+
+    def handle(self, *args, **options):
+        if options['bucket_size'] < 1:
+            raise CommandError('--bucket-size debe ser mayor que 0')
+        if not test_connection():
+            raise CommandError('No se pudo conectar a MongoDB')
+
+        total = 0
+        for entidad in options['only'] or ENTIDADES:
+            self.stdout.write(f'🔍 Verificando {entidad}s...')
+            resultado = verify_entidad(
+                entidad,
+                bucket_size=options['bucket_size'],
+                repair=options['repair'],
+                progress=self._progress,
+                rehash=options['rehash'],
+            )
+            divergentes = sum(resultado[tipo] for tipo in TIPOS)
+            total += divergentes
+            resumen = (
+                f"{resultado['documentos']} documentos en {resultado['rangos']} rangos "
+                f"({resultado['segundos']:.2f}s)"
+            )
+            if not divergentes:
+                self.stdout.write(self.style.SUCCESS(f'   ✅ {resumen}: sin diferencias'))
+                continue
+
+            self.stdout.write(self.style.WARNING(
+                f"   ⚠️  {resumen}: {resultado['rangos_distintos']} rangos distintos, "
+                f"{resultado['faltantes']} faltantes, {resultado['desactualizados']} desactualizados, "
+                f"{resultado['huerfanos']} huérfanos"
+            ))
+            for tipo in TIPOS:
+                claves = resultado['detalle'][tipo][:options['max_detalle']]
+                if claves:
+                    self.stdout.write(f"      {tipo}: {', '.join(claves)}")
+            if options['repair']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"   ✅ {resultado['escritos']} reescritos, {resultado['eliminados']} eliminados"
+                ))
+
+        if total and not options['repair']:
+            raise CommandError(f'{total} documentos divergentes; ejecute con --repair para corregirlos')
@@ -0,0 +1,133 @@
+from django.db import models
+from django.utils import timezone
+
+class SyncOutbox(models.Model):
+    """
+    Modelo que representa un cambio pendiente de sincronizar hacia MongoDB.
+
+    Se escribe en la misma transacción que el cambio en PostgreSQL, de modo que
+    un rollback también descarta la sincronización. Un drenador lee las entradas
+    en orden y las aplica en lote sobre MongoDB.
+    """
+
+    ENTIDADES = [
+        ('pedido', 'Pedido'),
+        ('producto', 'Producto'),
+        ('bodega', 'Bodega'),
+        ('ubicacion', 'Ubicación'),
+    ]
+
+    OPERACIONES = [
+        ('upsert', 'Upsert'),
+        ('delete', 'Delete'),
+    ]
+
+    entidad = models.CharField(
+        max_length=20,
+        choices=ENTIDADES,
+        help_text="Tipo de entidad que cambió."
+    )
+
+    clave = models.CharField(
+        max_length=50,
+        help_text="Identificador de la entidad en PostgreSQL (id o código)."
+    )
+
+    operacion = models.CharField(
+        max_length=10,
+        choices=OPERACIONES,
+        default='upsert',
+        help_text="Operación a aplicar en MongoDB."
+    )
+
+    payload = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Datos adicionales del cambio (por ejemplo, la variación de stock de una ubicación)."
+    )
+
+    fecha_creacion = models.DateTimeField(
+        auto_now_add=True,
+        help_text="Fecha y hora en que se registró el cambio."
+    )
+
+    disponible_en = models.DateTimeField(
+        default=timezone.now,
+        help_text="Momento a partir del cual la entrada se puede procesar (reintentos y reservas del worker)."
+    )
+
+    intentos = models.PositiveIntegerField(
+        default=0,
+        help_text="Número de intentos fallidos de aplicar el cambio."
+    )
+
+    ultimo_error = models.TextField(
+        blank=True,
+        default='',
+        help_text="Mensaje del último error al aplicar el cambio."
+    )
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['entidad', 'clave']),
+            models.Index(fields=['disponible_en', 'id']),
+        ]
+
+    def __str__(self):
+        return f"Outbox {self.id} - {self.operacion} {self.entidad} {self.clave}"
+
+
+class SyncDeadLetter(models.Model):
+    """
+    Modelo que representa un cambio que no se pudo aplicar en MongoDB tras
+    agotar los reintentos.
+
+    Se conserva para inspección y se puede reencolar manualmente.
+    """
+
+    entidad = models.CharField(
+        max_length=20,
+        choices=SyncOutbox.ENTIDADES,
+        help_text="Tipo de entidad que cambió."
+    )
+
+    clave = models.CharField(
+        max_length=50,
+        help_text="Identificador de la entidad en PostgreSQL (id o código)."
+    )
+
+    operacion = models.CharField(
+        max_length=10,
+        choices=SyncOutbox.OPERACIONES,
+        help_text="Operación que se intentó aplicar."
+    )
+
+    payload = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Datos adicionales del cambio."
+    )
+
+    intentos = models.PositiveIntegerField(
+        help_text="Intentos realizados antes de descartar el cambio."
+    )
+
+    error = models.TextField(
+        help_text="Último error registrado."
+    )
+
+    fecha_creacion = models.DateTimeField(
+        help_text="Fecha y hora en que se registró el cambio original."
+    )
+
+    fecha_descarte = models.DateTimeField(
+        auto_now_add=True,
+        help_text="Fecha y hora en que el cambio pasó a la cola de descartes."
+    )
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"DeadLetter {self.id} - {self.operacion} {self.entidad} {self.clave}"
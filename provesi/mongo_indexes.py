@@ -0,0 +1,162 @@
+"""
+Índices declarados del modelo de lectura en MongoDB.
+
+INDEXES es la fuente de verdad: ensure_indexes() crea los que falten (en
+segundo plano), check_drift() compara lo declarado con lo que existe en
+el servidor y explain_hot_queries() verifica que las consultas más
+frecuentes usen un índice en lugar de recorrer la colección.
+"""
+import logging
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    'pedidos': [
+        # Upserts del sync y find_one de pedido_detail
+        {'name': 'postgres_id_unique', 'keys': [('postgres_id', ASCENDING)], 'unique': True},
+        # Listado paginado por cursor, con y sin filtros
+        {'name': 'fecha_creacion_postgres_id', 'keys': [('fecha_creacion', DESCENDING), ('postgres_id', DESCENDING)]},
+        {'name': 'estado_fecha_creacion', 'keys': [('estado', ASCENDING), ('fecha_creacion', DESCENDING), ('postgres_id', DESCENDING)]},
+        {'name': 'metodo_pago_fecha_creacion', 'keys': [('metodo_pago', ASCENDING), ('fecha_creacion', DESCENDING), ('postgres_id', DESCENDING)]},
+    ],
+    'productos': [
+        # Upserts y eliminaciones del sync
+        {'name': 'codigo_unique', 'keys': [('codigo', ASCENDING)], 'unique': True},
+    ],
+    'bodegas': [
+        # Upserts del sync y actualizaciones puntuales de ubicaciones
+        {'name': 'codigo_unique', 'keys': [('codigo', ASCENDING)], 'unique': True},
+    ],
+}
+
+# Consultas frecuentes: (colección, filtro, orden, índice esperado)
+HOT_QUERIES = [
+    ('pedidos', {'postgres_id': 1}, None, 'postgres_id_unique'),
+    ('pedidos', {}, [('fecha_creacion', DESCENDING), ('postgres_id', DESCENDING)], 'fecha_creacion_postgres_id'),
+    ('pedidos', {'estado': 'pendiente'}, [('fecha_creacion', DESCENDING), ('postgres_id', DESCENDING)], 'estado_fecha_creacion'),
+    ('pedidos', {'metodo_pago': 'efectivo'}, [('fecha_creacion', DESCENDING), ('postgres_id', DESCENDING)], 'metodo_pago_fecha_creacion'),
+    ('productos', {'codigo': ''}, None, 'codigo_unique'),
+    ('bodegas', {'codigo': ''}, None, 'codigo_unique'),
+]
+
+
+def _spec(definicion):
+    """Forma comparable de un índice: (claves, único)."""
+    return (tuple((campo, int(orden)) for campo, orden in definicion['keys']), bool(definicion.get('unique', False)))
+
+
+def _existing(coleccion):
+    """Índices existentes de una colección: nombre -> spec."""
+    existentes = {}
+    for nombre, info in coleccion.index_information().items():
+        if nombre == '_id_':
+            continue
+        existentes[nombre] = _spec({'keys': info['key'], 'unique': info.get('unique', False)})
+    return existentes
+
+
+def check_drift(db):
+    """
+    Compara los índices declarados con los existentes.
+
+    Retorna por colección un diccionario con las listas:
+    - faltantes: declarados que no existen
+    - distintos: mismo nombre pero distintas claves u opciones
+    - sobrantes: existentes que no están declarados
+    """
+    reporte = {}
+    for nombre_coleccion, declarados in INDEXES.items():
+        existentes = _existing(db[nombre_coleccion])
+        declarados_por_nombre = {definicion['name']: _spec(definicion) for definicion in declarados}
+        reporte[nombre_coleccion] = {
+            'faltantes': [n for n in declarados_por_nombre if n not in existentes],
+            'distintos': [
+                n for n, spec in declarados_por_nombre.items()
+                if n in existentes and existentes[n] != spec
+            ],
+            'sobrantes': [n for n in existentes if n not in declarados_por_nombre],
+        }
+    return reporte
+
+
+def ensure_indexes(db, fix=False, drop_extra=False):
+    """
+    Crea los índices declarados que falten. Es idempotente.
+
+    Con `fix` se eliminan y recrean los índices cuyo spec difiere del
+    declarado; con `drop_extra` se eliminan los no declarados.
+    Retorna la lista de índices creados como 'coleccion.nombre'.
+    """
+    creados = []
+    drift = check_drift(db)
+    for nombre_coleccion, declarados in INDEXES.items():
+        coleccion = db[nombre_coleccion]
+        estado = drift[nombre_coleccion]
+
+        if fix:
+            for nombre in estado['distintos']:
+                logger.warning(f"Recreando índice {nombre_coleccion}.{nombre}")
+                coleccion.drop_index(nombre)
+        if drop_extra:
+            for nombre in estado['sobrantes']:
+                logger.warning(f"Eliminando índice no declarado {nombre_coleccion}.{nombre}")
+                coleccion.drop_index(nombre)
+
+        pendientes = set(estado['faltantes'])
+        if fix:
+            pendientes.update(estado['distintos'])
+        modelos = [
+            IndexModel(
+                definicion['keys'],
+                name=definicion['name'],
+                unique=definicion.get('unique', False),
+                background=True,
+            )
+            for definicion in declarados
+            if definicion['name'] in pendientes
+        ]
+        if not modelos:
+            continue
+        try:
+            coleccion.create_indexes(modelos)
+        except OperationFailure as e:
+            logger.error(f"❌ Error creando índices en {nombre_coleccion}: {e}")
+            raise
+        creados.extend(f"{nombre_coleccion}.{modelo.document['name']}" for modelo in modelos)
+        logger.info(f"✅ Índices creados en {nombre_coleccion}: {[m.document['name'] for m in modelos]}")
+    return creados
+
+
+def _winning_stages(plan):
+    """Recorre el plan ganador y retorna sus etapas como (stage, indexName)."""
+    etapas = [(plan.get('stage'), plan.get('indexName'))]
+    for hijo in ('inputStage', 'queryPlan'):
+        if hijo in plan:
+            etapas.extend(_winning_stages(plan[hijo]))
+    for hijo in plan.get('inputStages', []):
+        etapas.extend(_winning_stages(hijo))
+    return etapas
+
+
+def explain_hot_queries(db):
+    """
+    Ejecuta explain() sobre las consultas frecuentes.
+
+    Retorna una lista de (colección, filtro, índice esperado, índice usado, ok).
+    Una consulta está bien si su plan ganador usa el índice esperado y no
+    contiene un COLLSCAN.
+    """
+    resultados = []
+    for nombre_coleccion, filtro, orden, esperado in HOT_QUERIES:
+        cursor = db[nombre_coleccion].find(filtro).limit(1)
+        if orden:
+            cursor = cursor.sort(orden)
+        plan = cursor.explain().get('queryPlanner', {}).get('winningPlan', {})
+        etapas = _winning_stages(plan)
+        usados = [indice for _, indice in etapas if indice]
+        ok = esperado in usados and not any(stage == 'COLLSCAN' for stage, _ in etapas)
+        resultados.append((nombre_coleccion, filtro, esperado, usados[0] if usados else 'COLLSCAN', ok))
+    return resultados
@@ -1,39 +1,346 @@
 """
 Utilidades para sincronización con MongoDB
 """
+import atexit
+import os
+import threading
+import time
+
 import pymongo
 from django.conf import settings
-from datetime import datetime
+from pymongo import monitoring
 import logging
 
+from .cache import LRUCache
+from .document_builders import (
+    build_bodega_documents,
+    build_pedido_documents,
+    build_producto_documents,
+)
+
 logger = logging.getLogger(__name__)
 
+# ============================================
+# CLIENTE MONGODB COMPARTIDO POR PROCESO
+# ============================================
+
+# Valores por defecto del pool; cualquiera se puede sobrescribir en settings.MONGODB_CONFIG
+POOL_DEFAULTS = {
+    'maxPoolSize': 20,
+    'minPoolSize': 0,
+    'maxIdleTimeMS': 300000,
+    'waitQueueTimeoutMS': 2000,
+    'serverSelectionTimeoutMS': 5000,
+    'connectTimeoutMS': 5000,
+    'socketTimeoutMS': 10000,
+}
+
+_client_lock = threading.Lock()
+_client = None
+_client_pid = None
+
+# Estado de disponibilidad cacheado para no hacer ping en cada llamada
+_estado = {
+    'disponible': None,
+    'verificado_en': 0.0,
+    'error': None,
+}
+
+
+def _liveness_ttl(config):
+    """Segundos durante los que se confía en el último estado conocido."""
+    return float(config.get('health_check_interval', 30))
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Cuenta las conexiones en uso de cada pool (uno por servidor) y los
+    check-outs que fallaron, para medir la saturación sin consultar a MongoDB.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.en_uso = {}
+            self.check_outs_fallidos = 0
+
+    def _sumar(self, address, valor):
+        with self._lock:
+            self.en_uso[address] = max(self.en_uso.get(address, 0) + valor, 0)
+
+    def connection_checked_out(self, event):
+        self._sumar(event.address, 1)
+
+    def connection_checked_in(self, event):
+        self._sumar(event.address, -1)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.check_outs_fallidos += 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.en_uso.pop(event.address, None)
+
+    def pool_closed(self, event):
+        self.pool_cleared(event)
+
+    def pool_created(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.en_uso), self.check_outs_fallidos
+
+
+_pool_monitor = PoolMonitor()
+
+
+def get_pool_stats():
+    """
+    Conexiones en uso del cliente del proceso y saturación del pool más
+    cargado (en uso / maxPoolSize).
+    """
+    config = settings.MONGODB_CONFIG
+    maximo = int(config.get('maxPoolSize', POOL_DEFAULTS['maxPoolSize']))
+    en_uso, fallidos = _pool_monitor.snapshot()
+    return {
+        'en_uso': sum(en_uso.values()),
+        'max_por_servidor': maximo,
+        'saturacion': max(en_uso.values(), default=0) / maximo if maximo else 0.0,
+        'check_outs_fallidos': fallidos,
+    }
+
+
+def _build_client(config):
+    """Crea un MongoClient con las opciones de pool definidas en settings."""
+    options = {key: config.get(key, default) for key, default in POOL_DEFAULTS.items()}
+    return pymongo.MongoClient(
+        host=config['host'],
+        port=config['port'],
+        username=config.get('username'),
+        password=config.get('password'),
+        authSource=config.get('authSource', 'admin'),
+        connect=False,
+        event_listeners=[_pool_monitor],
+        **options,
+    )
+
+
+def get_mongo_client():
+    """
+    Obtiene el MongoClient compartido del proceso actual.
+
+    Se crea de forma perezosa la primera vez y se reutiliza en las
+    siguientes llamadas. Si el proceso fue bifurcado (gunicorn, multiprocessing)
+    se crea un cliente nuevo, ya que los sockets del padre no se pueden compartir.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            # El cliente heredado del padre se descarta sin cerrarlo:
+            # sus sockets pertenecen al proceso padre.
+            _pool_monitor.reset()
+            _client = _build_client(settings.MONGODB_CONFIG)
+            _client_pid = pid
+            _estado.update(disponible=None, verificado_en=0.0, error=None)
+        return _client
+
+
+def _verificar_disponibilidad(client, config):
+    """
+    Hace ping a MongoDB solo si el estado cacheado expiró.
+    Retorna True si el servidor se considera disponible.
+    """
+    ahora = time.monotonic()
+    if _estado['disponible'] is not None and ahora - _estado['verificado_en'] < _liveness_ttl(config):
+        return _estado['disponible']
+
+    try:
+        client.admin.command('ping')
+        if _estado['disponible'] is not True:
+            logger.info(f"✅ Conectado a MongoDB: {config['host']}:{config['port']}")
+        _estado.update(disponible=True, verificado_en=ahora, error=None)
+    except Exception as e:
+        logger.error(f"❌ Error conectando a MongoDB: {e}")
+        _estado.update(disponible=False, verificado_en=ahora, error=str(e))
+    return _estado['disponible']
+
+
+def mark_mongo_unavailable(error=None):
+    """
+    Marca MongoDB como no disponible hasta la próxima verificación.
+    Útil cuando una operación falla por errores de red.
+    """
+    _estado.update(disponible=False, verificado_en=time.monotonic(), error=str(error) if error else None)
+
+
+def _registrar_fallo(error):
+    """Invalida el estado cacheado si el error fue de conectividad."""
+    if isinstance(error, pymongo.errors.ConnectionFailure):
+        mark_mongo_unavailable(error)
+
+
+def get_mongo_status():
+    """Retorna una copia del último estado de disponibilidad conocido."""
+    return dict(_estado)
+
+
 def get_mongo_db():
     """
-    Obtiene conexión a MongoDB.
-    Retorna None si hay error.
+    Obtiene la base de datos de MongoDB usando el cliente compartido.
+    Retorna None si MongoDB no está disponible.
     """
     config = settings.MONGODB_CONFIG
     try:
-        client = pymongo.MongoClient(
-            host=config['host'],
-            port=config['port'],
-            username=config.get('username'),
-            password=config.get('password'),
-            authSource=config.get('authSource', 'admin'),
-            serverSelectionTimeoutMS=5000,
-            connectTimeoutMS=5000,
-        )
-        # Test de conexión
-        client.server_info()
-        db = client[config['database']]
-        logger.info(f"✅ Conectado a MongoDB: {config['host']}:{config['port']}")
-        return db
+        client = get_mongo_client()
+        if not _verificar_disponibilidad(client, config):
+            return None
+        return client[config['database']]
     except Exception as e:
         logger.error(f"❌ Error conectando a MongoDB: {e}")
+        mark_mongo_unavailable(e)
         return None
 
 
+def close_mongo_client():
+    """
+    Cierra el cliente compartido del proceso actual y libera sus sockets.
+    """
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            try:
+                _client.close()
+            except Exception as e:
+                logger.warning(f"Error cerrando cliente MongoDB: {e}")
+        _client = None
+        _client_pid = None
+        _estado.update(disponible=None, verificado_en=0.0, error=None)
+
+
+atexit.register(close_mongo_client)
+
+
+# ============================================
+# ESCRITURAS REDUNDANTES
+# ============================================
+
+# Último content_hash escrito por este proceso para cada (colección, clave).
+# Si el documento reconstruido tiene el mismo hash, la escritura se omite.
+# Otro proceso puede haber escrito el documento entre tanto: el TTL acota
+# cuánto se confía en la entrada y verify_mongo_sync corrige lo que quede.
+_hashes_lock = threading.Lock()
+_hashes_escritos = None
+
+_write_stats_lock = threading.Lock()
+_write_stats = {
+    'escritos': 0,      # Documentos enviados a MongoDB
+    'omitidos': 0,      # Documentos sin cambios que no se enviaron
+}
+
+
+def _get_hashes_escritos():
+    global _hashes_escritos
+    if _hashes_escritos is None:
+        with _hashes_lock:
+            if _hashes_escritos is None:
+                config = settings.MONGODB_CONFIG
+                _hashes_escritos = LRUCache(
+                    maxsize=int(config.get('write_cache_size', 10000)),
+                    ttl=float(config.get('write_cache_ttl', 300)),
+                )
+    return _hashes_escritos
+
+
+def _contar_escrituras(**incrementos):
+    with _write_stats_lock:
+        for key, valor in incrementos.items():
+            _write_stats[key] += valor
+
+
+def filter_unchanged(coleccion, campo, documentos):
+    """
+    Descarta los documentos cuyo content_hash coincide con el último escrito
+    por este proceso. Retorna la lista de documentos que sí deben escribirse.
+    """
+    hashes = _get_hashes_escritos()
+    pendientes = [
+        documento for documento in documentos
+        if hashes.get((coleccion, str(documento[campo]))) != documento['content_hash']
+    ]
+    _contar_escrituras(omitidos=len(documentos) - len(pendientes))
+    return pendientes
+
+
+def mark_written(coleccion, campo, documentos):
+    """Registra el content_hash de documentos ya escritos en MongoDB."""
+    hashes = _get_hashes_escritos()
+    for documento in documentos:
+        hashes.set((coleccion, str(documento[campo])), documento['content_hash'])
+    _contar_escrituras(escritos=len(documentos))
+
+
+def forget_written(coleccion, claves):
+    """Olvida los hashes de documentos eliminados o modificados parcialmente."""
+    hashes = _get_hashes_escritos()
+    for clave in claves:
+        hashes.delete((coleccion, str(clave)))
+
+
+def get_write_stats():
+    """Documentos escritos y omitidos por este proceso, más el estado de la LRU."""
+    with _write_stats_lock:
+        resumen = dict(_write_stats)
+    total = resumen['escritos'] + resumen['omitidos']
+    resumen['ratio_omitidos'] = resumen['omitidos'] / total if total else 0.0
+    resumen['cache'] = _get_hashes_escritos().stats()
+    return resumen
+
+
+def reset_write_stats():
+    """Reinicia los contadores y vacía la LRU de hashes escritos."""
+    with _write_stats_lock:
+        for key in _write_stats:
+            _write_stats[key] = 0
+    _get_hashes_escritos().clear()
+
+
+def _upsert_document(db, coleccion, campo, documento):
+    """
+    Upsert de un documento completo salvo que no haya cambiado desde la
+    última escritura. Retorna True si se envió a MongoDB.
+    """
+    if not filter_unchanged(coleccion, campo, [documento]):
+        return False
+    db[coleccion].update_one({campo: documento[campo]}, {'$set': documento}, upsert=True)
+    mark_written(coleccion, campo, [documento])
+    return True
+
+
+# ============================================
+# SINCRONIZACIÓN INDIVIDUAL
+# ============================================
+
 def sync_pedido_to_mongo(pedido):
     """
     Sincroniza un pedido a MongoDB con todos sus items.
@@ -44,48 +351,21 @@ def sync_pedido_to_mongo(pedido):
             logger.warning(f"MongoDB no disponible, no se sincronizó pedido {pedido.id}")
             return False
         
-        # Construir documento
-        pedido_data = {
-            'postgres_id': pedido.id,
-            'estado': pedido.estado,
-            'metodo_pago': pedido.metodo_pago,
-            'fecha_creacion': pedido.fecha_creacion.isoformat(),
-            'fecha_actualizacion': pedido.fecha_actualizacion.isoformat(),
-            'items': []
-        }
-        
-        # Agregar items
-        total = 0
-        for item in pedido.items.all():
-            subtotal = item.cantidad * item.producto.precio
-            total += subtotal
-            
-            pedido_data['items'].append({
-                'id': item.id,
-                'producto_codigo': item.producto.codigo,
-                'producto_nombre': item.producto.nombre,
-                'producto_descripcion': item.producto.descripcion,
-                'producto_precio': item.producto.precio,
-                'cantidad': item.cantidad,
-                'subtotal': subtotal
-            })
-        
-        pedido_data['total'] = total
-        pedido_data['num_items'] = len(pedido_data['items'])
-        pedido_data['sync_timestamp'] = datetime.now().isoformat()
+        pedido_data = build_pedido_documents([pedido.id]).get(pedido.id)
+        if pedido_data is None:
+            return delete_pedido_from_mongo(pedido.id)
         
-        # Upsert en MongoDB
-        result = db.pedidos.update_one(
-            {'postgres_id': pedido.id},
-            {'$set': pedido_data},
-            upsert=True
-        )
+        # Upsert en MongoDB, salvo que el contenido no haya cambiado
+        if not _upsert_document(db, 'pedidos', 'postgres_id', pedido_data):
+            logger.debug(f"Pedido {pedido.id} sin cambios, no se reescribió")
+            return True
         
         logger.info(f"✅ Pedido {pedido.id} sincronizado a MongoDB")
         return True
         
     except Exception as e:
         logger.error(f"❌ Error sincronizando pedido {pedido.id}: {e}")
+        _registrar_fallo(e)
         return False
 
 
@@ -99,11 +379,13 @@ def delete_pedido_from_mongo(pedido_id):
             return False
         
         result = db.pedidos.delete_one({'postgres_id': pedido_id})
+        forget_written('pedidos', [pedido_id])
         logger.info(f"✅ Pedido {pedido_id} eliminado de MongoDB")
         return True
         
     except Exception as e:
         logger.error(f"❌ Error eliminando pedido {pedido_id}: {e}")
+        _registrar_fallo(e)
         return False
 
 
@@ -117,49 +399,20 @@ def sync_producto_to_mongo(producto):
             logger.warning(f"MongoDB no disponible, no se sincronizó producto {producto.codigo}")
             return False
         
-        producto_data = {
-            'postgres_id': producto.codigo,
-            'codigo': producto.codigo,
-            'nombre': producto.nombre,
-            'descripcion': producto.descripcion,
-            'precio': producto.precio,
-            'ubicaciones': []
-        }
-        
-        stock_total = 0
-        for ubicacion in producto.ubicaciones.all():
-            stock_total += ubicacion.stock
-            
-            producto_data['ubicaciones'].append({
-                'id': ubicacion.id,
-                'bodega_codigo': ubicacion.estanteria.bodega.codigo,
-                'bodega_ciudad': ubicacion.estanteria.bodega.ciudad,
-                'bodega_direccion': ubicacion.estanteria.bodega.direccion,
-                'estanteria_zona': ubicacion.estanteria.zona,
-                'estanteria_codigo': ubicacion.estanteria.codigo,
-                'nivel': ubicacion.nivel,
-                'codigo': ubicacion.codigo,
-                'codigo_completo': f"{ubicacion.estanteria.zona}{ubicacion.estanteria.codigo}{ubicacion.nivel}{ubicacion.codigo}",
-                'capacidad': ubicacion.capacidad,
-                'stock': ubicacion.stock,
-                'fecha_actualizacion': ubicacion.fecha_actualizacion.isoformat()
-            })
-        
-        producto_data['stock_total'] = stock_total
-        producto_data['num_ubicaciones'] = len(producto_data['ubicaciones'])
-        producto_data['sync_timestamp'] = datetime.now().isoformat()
+        producto_data = build_producto_documents([producto.codigo]).get(producto.codigo)
+        if producto_data is None:
+            return delete_producto_from_mongo(producto.codigo)
         
-        result = db.productos.update_one(
-            {'codigo': producto.codigo},
-            {'$set': producto_data},
-            upsert=True
-        )
+        if not _upsert_document(db, 'productos', 'codigo', producto_data):
+            logger.debug(f"Producto {producto.codigo} sin cambios, no se reescribió")
+            return True
         
         logger.info(f"✅ Producto {producto.codigo} sincronizado a MongoDB")
         return True
         
     except Exception as e:
         logger.error(f"❌ Error sincronizando producto {producto.codigo}: {e}")
+        _registrar_fallo(e)
         return False
 
 
@@ -173,11 +426,13 @@ def delete_producto_from_mongo(codigo):
             return False
         
         result = db.productos.delete_one({'codigo': codigo})
+        forget_written('productos', [codigo])
         logger.info(f"✅ Producto {codigo} eliminado de MongoDB")
         return True
         
     except Exception as e:
         logger.error(f"❌ Error eliminando producto {codigo}: {e}")
+        _registrar_fallo(e)
         return False
 
 
@@ -191,64 +446,20 @@ def sync_bodega_to_mongo(bodega):
             logger.warning(f"MongoDB no disponible, no se sincronizó bodega {bodega.codigo}")
             return False
         
-        bodega_data = {
-            'postgres_id': bodega.codigo,
-            'codigo': bodega.codigo,
-            'ciudad': bodega.ciudad,
-            'direccion': bodega.direccion,
-            'estanterias': []
-        }
-        
-        total_ubicaciones = 0
-        total_stock = 0
-        
-        for estanteria in bodega.estanterias.all():
-            est_data = {
-                'zona': estanteria.zona,
-                'codigo': estanteria.codigo,
-                'niveles': estanteria.niveles,
-                'ubicaciones': []
-            }
-            
-            for ubicacion in estanteria.ubicaciones.all():
-                total_ubicaciones += 1
-                total_stock += ubicacion.stock
-                
-                ub_data = {
-                    'id': ubicacion.id,
-                    'nivel': ubicacion.nivel,
-                    'codigo': ubicacion.codigo,
-                    'capacidad': ubicacion.capacidad,
-                    'stock': ubicacion.stock,
-                    'fecha_actualizacion': ubicacion.fecha_actualizacion.isoformat()
-                }
-                
-                if ubicacion.producto:
-                    ub_data['producto'] = {
-                        'codigo': ubicacion.producto.codigo,
-                        'nombre': ubicacion.producto.nombre,
-                        'precio': ubicacion.producto.precio
-                    }
-                
-                est_data['ubicaciones'].append(ub_data)
-            
-            bodega_data['estanterias'].append(est_data)
-        
-        bodega_data['total_ubicaciones'] = total_ubicaciones
-        bodega_data['total_stock'] = total_stock
-        bodega_data['sync_timestamp'] = datetime.now().isoformat()
+        bodega_data = build_bodega_documents([bodega.codigo]).get(bodega.codigo)
+        if bodega_data is None:
+            return False
         
-        result = db.bodegas.update_one(
-            {'codigo': bodega.codigo},
-            {'$set': bodega_data},
-            upsert=True
-        )
+        if not _upsert_document(db, 'bodegas', 'codigo', bodega_data):
+            logger.debug(f"Bodega {bodega.codigo} sin cambios, no se reescribió")
+            return True
         
         logger.info(f"✅ Bodega {bodega.codigo} sincronizada a MongoDB")
         return True
         
     except Exception as e:
         logger.error(f"❌ Error sincronizando bodega {bodega.codigo}: {e}")
+        _registrar_fallo(e)
         return False
 
 
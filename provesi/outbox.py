@@ -0,0 +1,424 @@
+"""
+Outbox transaccional para la sincronización PostgreSQL → MongoDB.
+
+Los signals registran cada cambio como una fila de SyncOutbox dentro de la
+misma transacción que el cambio. Un drenador (hilo de fondo o el comando
+drain_mongo_outbox) lee las filas en orden, colapsa las entradas repetidas
+de una misma entidad y aplica el resultado en MongoDB con bulk_write.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure
+
+logger = logging.getLogger(__name__)
+
+# Colección y campo de búsqueda en MongoDB para cada entidad con documento propio.
+# Las ubicaciones no tienen colección: se actualizan dentro del documento de su bodega.
+COLECCIONES = {
+    'pedido': ('pedidos', 'postgres_id'),
+    'producto': ('productos', 'codigo'),
+    'bodega': ('bodegas', 'codigo'),
+}
+
+
+class MongoUnavailable(Exception):
+    """MongoDB no está disponible; las entradas se reintentan más tarde."""
+
+
+def get_outbox_config():
+    """Configuración del outbox con valores por defecto."""
+    config = {
+        'batch_size': 500,
+        'background_drainer': True,
+        'poll_interval': 5.0,
+    }
+    config.update(getattr(settings, 'MONGODB_OUTBOX', {}))
+    return config
+
+
+def enqueue(entidad, clave, operacion='upsert', payload=None):
+    """
+    Registra un cambio pendiente de sincronizar.
+
+    Debe llamarse dentro de la transacción del cambio; al hacer commit se
+    despierta al drenador de fondo.
+    """
+    from .models import SyncOutbox
+
+    SyncOutbox.objects.create(entidad=entidad, clave=str(clave), operacion=operacion, payload=payload or {})
+    transaction.on_commit(notify_drainer)
+
+
+def merge_payload(entidad, anterior, nuevo):
+    """
+    Combina los payloads de dos entradas de una misma entidad.
+
+    Para las ubicaciones las variaciones de stock se suman; para el resto
+    gana el payload más reciente.
+    """
+    if entidad != 'ubicacion':
+        return dict(nuevo)
+    return {
+        'delta_stock': anterior.get('delta_stock', 0) + nuevo.get('delta_stock', 0),
+        'creada': anterior.get('creada', False) or nuevo.get('creada', False),
+    }
+
+
+def collapse(entradas):
+    """
+    Colapsa entradas repetidas de una misma entidad.
+
+    Retorna un OrderedDict (entidad, clave) -> {'operacion', 'payload'} donde
+    gana la última operación registrada, respetando el orden de la última
+    aparición.
+    """
+    cambios = OrderedDict()
+    for entrada in entradas:
+        key = (entrada.entidad, entrada.clave)
+        anterior = cambios.pop(key, None)
+        payload = entrada.payload or {}
+        if anterior is not None:
+            payload = merge_payload(entrada.entidad, anterior['payload'], payload)
+        cambios[key] = {'operacion': entrada.operacion, 'payload': payload}
+    return cambios
+
+
+def build_ubicacion_delta(ubicacion, payload, totales):
+    """
+    Construye la actualización puntual de una ubicación embebida en su bodega.
+
+    Solo se reemplaza el subdocumento de la ubicación y los totales de la
+    bodega, sin reescribir el resto. La actualización es idempotente: el
+    subdocumento y los totales (`totales` = (total_stock, total_ubicaciones),
+    tomados de StockBodega) se asignan con $set y el $push de una ubicación
+    nueva solo aplica si aún no está en el documento, de modo que reintentar
+    un lote ya aceptado por MongoDB no cuenta dos veces. El filtro exige que
+    la estantería exista en el documento, así que modified_count refleja si
+    la actualización se aplicó. El content_hash de la bodega deja de ser
+    válido y se elimina.
+    """
+    from .document_builders import build_ubicacion_subdocument
+
+    estanteria = ubicacion.estanteria
+    subdocumento = build_ubicacion_subdocument(ubicacion)
+    total_stock, total_ubicaciones = totales
+    filtro_estanteria = {'e.zona': estanteria.zona, 'e.codigo': estanteria.codigo}
+    con_estanteria = {'$elemMatch': {'zona': estanteria.zona, 'codigo': estanteria.codigo}}
+    asignar = {
+        'total_stock': total_stock,
+        'total_ubicaciones': total_ubicaciones,
+        'sync_timestamp': datetime.now().isoformat(),
+    }
+
+    if payload.get('creada'):
+        return UpdateOne(
+            {
+                'codigo': estanteria.bodega_id,
+                'estanterias': con_estanteria,
+                'estanterias.ubicaciones.id': {'$ne': ubicacion.id},
+            },
+            {
+                # Insertar en el mismo orden que build_bodega_documents para que
+                # el documento resultante conserve su content_hash
+                '$push': {
+                    'estanterias.$[e].ubicaciones': {
+                        '$each': [subdocumento],
+                        '$sort': {'nivel': 1, 'codigo': 1},
+                    },
+                },
+                '$set': asignar,
+                '$unset': {'content_hash': ''},
+            },
+            array_filters=[filtro_estanteria],
+        )
+
+    asignar['estanterias.$[e].ubicaciones.$[u]'] = subdocumento
+    return UpdateOne(
+        {'codigo': estanteria.bodega_id, 'estanterias': con_estanteria, 'estanterias.ubicaciones.id': ubicacion.id},
+        {'$set': asignar, '$unset': {'content_hash': ''}},
+        array_filters=[filtro_estanteria, {'u.id': ubicacion.id}],
+    )
+
+
+def apply_ubicacion_deltas(db, cambios, bodegas_reconstruidas):
+    """
+    Aplica los cambios de ubicaciones como actualizaciones puntuales.
+
+    Se omiten las ubicaciones cuya bodega ya se reconstruye completa en este
+    lote. Retorna (operaciones enviadas, bodegas que deben reconstruirse
+    porque su documento no coincidía con la actualización puntual o porque
+    aún no tienen totales en StockBodega).
+    """
+    from manejador_inventario.models import StockBodega, Ubicacion
+    from .mongodb_sync import forget_written
+
+    ids = [int(clave) for clave in cambios]
+    ubicaciones = [
+        ubicacion for ubicacion in (
+            Ubicacion.objects
+            .select_related('estanteria', 'producto')
+            .only(
+                'id', 'nivel', 'codigo', 'capacidad', 'stock', 'fecha_actualizacion',
+                'estanteria__bodega', 'estanteria__zona', 'estanteria__codigo',
+                'producto__codigo', 'producto__nombre', 'producto__precio',
+            )
+            .filter(id__in=ids)
+        )
+        if ubicacion.estanteria.bodega_id not in bodegas_reconstruidas
+    ]
+    totales = {
+        bodega: (total_stock, total_ubicaciones)
+        for bodega, total_stock, total_ubicaciones in StockBodega.objects.filter(
+            bodega_id__in={ubicacion.estanteria.bodega_id for ubicacion in ubicaciones},
+        ).values_list('bodega_id', 'total_stock', 'total_ubicaciones')
+    }
+
+    operaciones = []
+    bodegas = set()
+    sin_totales = set()
+    for ubicacion in ubicaciones:
+        bodega = ubicacion.estanteria.bodega_id
+        if bodega not in totales:
+            sin_totales.add(bodega)
+            continue
+        operaciones.append(build_ubicacion_delta(ubicacion, cambios[str(ubicacion.id)], totales[bodega]))
+        bodegas.add(bodega)
+
+    if not operaciones:
+        return 0, sin_totales
+
+    # El documento completo de estas bodegas ya no coincide con el último hash escrito
+    forget_written('bodegas', bodegas)
+    try:
+        resultado = db.bodegas.bulk_write(operaciones, ordered=False)
+    except BulkWriteError as e:
+        # Parte del lote pudo aplicarse: reconstruir las bodegas deja los
+        # totales correctos sin depender de qué operaciones fallaron.
+        logger.warning(f"Actualización puntual con errores, reconstruyendo bodegas afectadas: {e}")
+        return len(operaciones), bodegas | sin_totales
+
+    if resultado.modified_count < len(operaciones):
+        # Algún documento no tenía la estructura esperada (bodega o estantería
+        # aún no sincronizada, ubicación ya insertada): reconstruir esas bodegas.
+        logger.warning("Actualización puntual incompleta, reconstruyendo bodegas afectadas")
+        return len(operaciones), bodegas | sin_totales
+    return len(operaciones), sin_totales
+
+
+def _apply_documents(db, entidad, claves):
+    """
+    Upserts/eliminaciones de documentos completos de una entidad. Los
+    documentos cuyo contenido no cambió desde la última escritura de este
+    proceso no se envían.
+    """
+    from .document_builders import load_documents
+    from .mongodb_sync import filter_unchanged, forget_written, mark_written
+
+    coleccion, campo = COLECCIONES[entidad]
+    upserts = [clave for clave, operacion in claves.items() if operacion == 'upsert']
+    documentos = load_documents(entidad, upserts) if upserts else {}
+    escribir = filter_unchanged(coleccion, campo, list(documentos.values()))
+    eliminar = [
+        int(clave) if entidad == 'pedido' else clave
+        for clave, operacion in claves.items()
+        if operacion != 'upsert' or clave not in documentos
+    ]
+
+    operaciones = [UpdateOne({campo: documento[campo]}, {'$set': documento}, upsert=True) for documento in escribir]
+    operaciones.extend(DeleteOne({campo: valor}) for valor in eliminar)
+
+    if operaciones:
+        try:
+            db[coleccion].bulk_write(operaciones, ordered=False)
+        finally:
+            forget_written(coleccion, eliminar)
+        mark_written(coleccion, campo, escribir)
+    return len(operaciones)
+
+
+def apply_changes(db, cambios):
+    """
+    Aplica en MongoDB un conjunto de cambios colapsados.
+
+    Los upserts se construyen con el estado actual de PostgreSQL; si la entidad
+    ya no existe se convierten en eliminaciones. Los cambios de ubicación se
+    aplican como actualizaciones puntuales sobre el documento de su bodega.
+    Retorna el número de operaciones enviadas.
+    """
+    por_entidad = OrderedDict()
+    for (entidad, clave), cambio in cambios.items():
+        por_entidad.setdefault(entidad, OrderedDict())[clave] = cambio
+
+    total = 0
+    ubicaciones = por_entidad.pop('ubicacion', None)
+    for entidad, claves in por_entidad.items():
+        total += _apply_documents(db, entidad, {clave: cambio['operacion'] for clave, cambio in claves.items()})
+
+    # Las actualizaciones puntuales asignan valores absolutos (ver
+    # build_ubicacion_delta), así que reintentar el lote completo es seguro.
+    if ubicaciones:
+        enviadas, reconstruir = apply_ubicacion_deltas(
+            db,
+            {clave: cambio['payload'] for clave, cambio in ubicaciones.items()},
+            set(por_entidad.get('bodega', {})),
+        )
+        total += enviadas
+        if reconstruir:
+            total += _apply_documents(db, 'bodega', {bodega: 'upsert' for bodega in reconstruir})
+
+    return total
+
+
+def drain_outbox(batch_size=None):
+    """
+    Procesa un lote del outbox.
+
+    Las filas se bloquean (SKIP LOCKED) mientras se aplican, y solo se borran
+    si MongoDB aceptó el lote; ante un error de conexión la transacción se
+    revierte y las filas quedan para el siguiente intento. Cualquier otro
+    error se aísla aplicando las entradas por separado, con los mismos
+    reintentos y descarte a SyncDeadLetter que el worker (sync_worker), para
+    que una entrada defectuosa no bloquee la cola.
+    Retorna el número de filas consumidas.
+    """
+    from .models import SyncOutbox
+    from .mongodb_sync import get_mongo_db
+
+    batch_size = batch_size or get_outbox_config()['batch_size']
+    db = get_mongo_db()
+    if db is None:
+        raise MongoUnavailable("MongoDB no disponible")
+
+    with transaction.atomic():
+        entradas = list(
+            SyncOutbox.objects
+            .select_for_update(skip_locked=True)
+            .filter(disponible_en__lte=timezone.now())
+            .order_by('id')[:batch_size]
+        )
+        if not entradas:
+            return 0
+
+        try:
+            with transaction.atomic():
+                aplicados = apply_changes(db, collapse(entradas))
+                SyncOutbox.objects.filter(id__in=[entrada.id for entrada in entradas]).delete()
+        except (MongoUnavailable, ConnectionFailure):
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Outbox: lote con errores ({e}), aplicando {len(entradas)} entradas por separado")
+            _aplicar_por_separado(entradas)
+            return len(entradas)
+
+    logger.info(f"✅ Outbox: {len(entradas)} entradas aplicadas como {aplicados} operaciones")
+    return len(entradas)
+
+
+def _aplicar_por_separado(entradas):
+    from .sync_worker import SyncWorker
+
+    worker = SyncWorker(threads=1)
+    try:
+        worker.aplicar_por_separado(worker.agrupar(entradas))
+    finally:
+        worker.executor.shutdown()
+
+
+def outbox_lag():
+    """
+    Estado de la cola: entradas pendientes y antigüedad en segundos de la
+    entrada más vieja (0 si está vacía).
+    """
+    from django.db.models import Count, Min
+    from .models import SyncOutbox
+
+    resumen = SyncOutbox.objects.aggregate(pendientes=Count('id'), mas_antigua=Min('fecha_creacion'))
+    lag = 0.0
+    if resumen['mas_antigua'] is not None:
+        lag = (timezone.now() - resumen['mas_antigua']).total_seconds()
+    return {'pendientes': resumen['pendientes'], 'lag_segundos': lag}
+
+
+def drain_all(batch_size=None):
+    """Drena el outbox hasta vaciarlo. Retorna el total de filas consumidas."""
+    total = 0
+    while True:
+        consumidas = drain_outbox(batch_size)
+        if not consumidas:
+            return total
+        total += consumidas
+
+
+# ============================================
+# DRENADOR DE FONDO
+# ============================================
+
+class OutboxDrainer(threading.Thread):
+    """
+    Hilo que drena el outbox cuando se le avisa de un commit o cada
+    poll_interval segundos.
+    """
+
+    def __init__(self, poll_interval):
+        super().__init__(name='mongo-outbox-drainer', daemon=True)
+        self.poll_interval = poll_interval
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+
+    def wake(self):
+        self._despertar.set()
+
+    def stop(self):
+        self._detener.set()
+        self._despertar.set()
+
+    def run(self):
+        espera = self.poll_interval
+        while not self._detener.is_set():
+            self._despertar.wait(espera)
+            self._despertar.clear()
+            if self._detener.is_set():
+                break
+            try:
+                close_old_connections()
+                drain_all()
+                espera = self.poll_interval
+            except MongoUnavailable:
+                espera = min(espera * 2, 60)
+            except Exception as e:
+                logger.error(f"❌ Error drenando outbox: {e}")
+                espera = min(espera * 2, 60)
+            finally:
+                close_old_connections()
+
+
+_drainer_lock = threading.Lock()
+_drainer = None
+_drainer_pid = None
+
+
+def notify_drainer():
+    """
+    Despierta al drenador de fondo del proceso actual, creándolo si hace falta.
+    No hace nada si el drenador de fondo está deshabilitado.
+    """
+    global _drainer, _drainer_pid
+    config = get_outbox_config()
+    if not config['background_drainer']:
+        return
+
+    pid = os.getpid()
+    with _drainer_lock:
+        if _drainer is None or _drainer_pid != pid or not _drainer.is_alive():
+            _drainer = OutboxDrainer(config['poll_interval'])
+            _drainer_pid = pid
+            _drainer.start()
+    _drainer.wake()
@@ -0,0 +1,181 @@
+"""
+Estado de preparación (readiness) del proceso para los health checks de Kong.
+
+Un hilo de fondo (ReadinessTicker) revisa cada `interval` segundos
+PostgreSQL, MongoDB, la saturación del pool de MongoDB y el retraso del
+outbox, y guarda el resultado en memoria. La vista solo lee esa foto: no
+abre conexiones ni hace consultas, así que responde en microsegundos aunque
+Kong la consulte en cada target cada pocos segundos.
+
+El proceso se declara no listo si PostgreSQL no responde, si el pool de
+MongoDB está saturado o si la foto es demasiado vieja (el ticker se
+detuvo). MongoDB caído y el retraso del outbox se reportan; solo hacen
+fallar la verificación si así se configura en settings.READINESS, porque
+afectan a todos los targets por igual y sacarlos a todos de rotación no
+ayuda.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+def get_readiness_config():
+    """Configuración de readiness con valores por defecto."""
+    config = {
+        'interval': 5.0,
+        'stale_after': 30.0,
+        'max_pool_saturation': 0.9,
+        'require_mongo': False,
+        'max_outbox_lag': 0,
+    }
+    config.update(getattr(settings, 'READINESS', {}))
+    return config
+
+
+def _medir(sonda):
+    """Ejecuta una sonda y retorna (resultado, milisegundos, error)."""
+    inicio = time.perf_counter()
+    try:
+        resultado = sonda()
+        error = None
+    except Exception as e:
+        resultado, error = None, str(e)
+    return resultado, (time.perf_counter() - inicio) * 1000, error
+
+
+def _sonda_postgres():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+def _sonda_mongo():
+    from .mongodb_sync import get_mongo_db, get_mongo_status
+
+    # get_mongo_db() solo hace ping si el último estado conocido expiró
+    get_mongo_db()
+    return get_mongo_status()
+
+
+def probe(config=None):
+    """
+    Revisa todas las dependencias y retorna la foto del estado. Se ejecuta
+    en el hilo del ticker, que mantiene su propia conexión a PostgreSQL.
+    """
+    from .mongodb_sync import get_pool_stats
+    from .outbox import outbox_lag
+
+    config = config or get_readiness_config()
+    motivos = []
+
+    _, ms, error = _medir(_sonda_postgres)
+    postgres = {'disponible': error is None, 'ms': round(ms, 2), 'error': error}
+    if error is not None:
+        motivos.append('postgres')
+        # La conexión pudo quedar inservible: se abre otra en la próxima revisión
+        connection.close()
+
+    estado, ms, error = _medir(_sonda_mongo)
+    mongo = {
+        'disponible': bool(estado and estado['disponible']),
+        'ms': round(ms, 2),
+        'error': error or (estado or {}).get('error'),
+    }
+    if config['require_mongo'] and not mongo['disponible']:
+        motivos.append('mongo')
+
+    pool = get_pool_stats()
+    if pool['saturacion'] >= config['max_pool_saturation']:
+        motivos.append('pool')
+
+    outbox = None
+    if postgres['disponible']:
+        outbox, _, error = _medir(outbox_lag)
+    if outbox is None:
+        outbox = {'pendientes': None, 'lag_segundos': None}
+    elif config['max_outbox_lag'] and outbox['lag_segundos'] > config['max_outbox_lag']:
+        motivos.append('outbox')
+
+    return {
+        'listo': not motivos,
+        'motivos': motivos,
+        'verificado_en': time.time(),
+        'postgres': postgres,
+        'mongo': mongo,
+        'pool': pool,
+        'outbox': outbox,
+    }
+
+
+class ReadinessTicker(threading.Thread):
+    """Hilo que refresca la foto de readiness cada `interval` segundos."""
+
+    def __init__(self, interval):
+        super().__init__(name='readiness-ticker', daemon=True)
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._foto = None
+
+    def stop(self):
+        self._detener.set()
+
+    def snapshot(self):
+        with self._lock:
+            return self._foto
+
+    def run(self):
+        while not self._detener.is_set():
+            try:
+                foto = probe()
+            except Exception as e:
+                logger.error(f"❌ Error revisando readiness: {e}")
+            else:
+                with self._lock:
+                    if self._foto is not None and self._foto['listo'] != foto['listo']:
+                        logger.warning(f"⚠️ Readiness: listo={foto['listo']} motivos={foto['motivos']}")
+                    self._foto = foto
+            self._detener.wait(self.interval)
+        connection.close()
+
+
+_ticker_lock = threading.Lock()
+_ticker = None
+_ticker_pid = None
+
+
+def get_ticker():
+    """Ticker del proceso actual, creándolo si hace falta (también tras un fork)."""
+    global _ticker, _ticker_pid
+    pid = os.getpid()
+    if _ticker is not None and _ticker_pid == pid and _ticker.is_alive():
+        return _ticker
+
+    with _ticker_lock:
+        if _ticker is None or _ticker_pid != pid or not _ticker.is_alive():
+            _ticker = ReadinessTicker(get_readiness_config()['interval'])
+            _ticker.start()
+            _ticker_pid = pid
+        return _ticker
+
+
+def readiness():
+    """
+    Foto actual de readiness, marcada como no lista si todavía no hay una
+    o si es más vieja que `stale_after`.
+    """
+    config = get_readiness_config()
+    foto = get_ticker().snapshot()
+    if foto is None:
+        return {'listo': False, 'motivos': ['iniciando']}
+
+    edad = time.time() - foto['verificado_en']
+    resultado = dict(foto, edad_segundos=round(edad, 3))
+    if edad > config['stale_after']:
+        resultado.update(listo=False, motivos=foto['motivos'] + ['desactualizado'])
+    return resultado
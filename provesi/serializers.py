@@ -0,0 +1,138 @@
+"""
+Serialización de querysets completos a estructuras JSON.
+
+Cada Serializer declara sus campos como rutas de values_list(); un queryset
+se serializa en una sola consulta (las relaciones anidadas van por JOIN) y
+cada fila se convierte de tupla a diccionario con posiciones precalculadas,
+sin instanciar modelos. Los mismos serializers sirven a las APIs JSON y a
+los builders de documentos de MongoDB.
+
+dumps() codifica con orjson si está instalado y, si no, con el módulo json
+de la biblioteca estándar.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+
+class Serializer:
+    """
+    Especificación de campos de una entidad.
+
+    Cada campo es una ruta de values_list() (la clave de salida es la misma),
+    un par (clave, ruta), o (clave, Serializer[, relacion]) para anidar los
+    campos de una relación; la relación por defecto es la propia clave.
+    """
+
+    def __init__(self, *campos):
+        self.campos = campos
+        self.rutas = []
+        self._construir = self._compilar(campos, '', self.rutas)
+
+    @staticmethod
+    def _compilar(campos, prefijo, rutas):
+        partes = []
+        for campo in campos:
+            if isinstance(campo, str):
+                campo = (campo, campo)
+            clave, ruta = campo[0], campo[1]
+            if isinstance(ruta, Serializer):
+                relacion = campo[2] if len(campo) > 2 else clave
+                partes.append((clave, Serializer._compilar(ruta.campos, f'{prefijo}{relacion}__', rutas)))
+            else:
+                rutas.append(prefijo + ruta)
+                partes.append((clave, len(rutas) - 1))
+
+        claves = tuple(clave for clave, _ in partes)
+        if all(isinstance(posicion, int) for _, posicion in partes):
+            posiciones = tuple(posicion for _, posicion in partes)
+            if posiciones == tuple(range(len(posiciones))):
+                # Campos al inicio de la fila: zip se detiene en la última clave
+                return lambda fila: dict(zip(claves, fila))
+            return lambda fila: dict(zip(claves, [fila[i] for i in posiciones]))
+
+        def construir(fila):
+            return {
+                clave: fila[posicion] if isinstance(posicion, int) else posicion(fila)
+                for clave, posicion in partes
+            }
+        return construir
+
+    def rows(self, queryset, *extra):
+        """
+        Tuplas con las rutas del serializer, en una consulta. Las rutas
+        `extra` (por ejemplo, la clave para agrupar) van al final de la tupla
+        y build() las ignora.
+        """
+        return queryset.values_list(*self.rutas, *extra)
+
+    def build(self, fila):
+        """Diccionario a partir de una tupla de rows()."""
+        return self._construir(fila)
+
+    def serialize(self, queryset):
+        """Lista de diccionarios de todo el queryset, en una consulta."""
+        construir = self._construir
+        return [construir(fila) for fila in self.rows(queryset)]
+
+
+# ============================================
+# SERIALIZERS
+# ============================================
+
+BODEGA = Serializer('codigo', 'ciudad', 'direccion')
+
+ESTANTERIA = Serializer(('bodega', BODEGA), 'zona', 'codigo', 'niveles')
+
+PRODUCTO = Serializer('codigo', 'nombre', 'descripcion', 'precio')
+
+UBICACION = Serializer(
+    'id',
+    ('estanteria', ESTANTERIA),
+    ('producto', 'producto_id'),
+    'nivel', 'codigo', 'capacidad', 'stock', 'reservado',
+)
+
+PEDIDO = Serializer('id', 'estado', 'metodo_pago', 'fecha_creacion', 'fecha_actualizacion')
+
+ITEM = Serializer('id', 'pedido_id', ('producto', 'producto_id'), 'cantidad')
+
+
+# ============================================
+# CODIFICACIÓN JSON
+# ============================================
+
+def _default(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+def dumps(data, sort_keys=False):
+    """Codifica a JSON (bytes UTF-8). Con sort_keys la salida es canónica, apta para hashear."""
+    if orjson is not None:
+        opciones = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(data, default=_default, option=opciones)
+    return json.dumps(
+        data, default=_default, ensure_ascii=False, separators=(',', ':'), sort_keys=sort_keys,
+    ).encode()
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_response(data, status=200):
+    """HttpResponse JSON codificado con dumps()."""
+    return HttpResponse(dumps(data), status=status, content_type='application/json')
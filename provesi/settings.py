@@ -39,10 +39,12 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "django.contrib.humanize",
+    "django.contrib.postgres",
     "bootstrap5",
     "widget_tweaks",
     "manejador_pedidos",
     "manejador_inventario",
+    "provesi",
     "social_django",
 ]
 
@@ -54,6 +56,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "provesi.unit_of_work.SyncScopeMiddleware",
 ]
 
 ROOT_URLCONF = "provesi.urls"
@@ -156,6 +159,24 @@ SOCIAL_AUTH_AUTH0_SCOPE = [
     "email",
     "role",
 ]
+
+# Caché de claims de tokens y pool HTTP para las llamadas a Auth0
+AUTH0_CACHE = {
+    'claims_maxsize': int(os.getenv("AUTH0_CLAIMS_CACHE_MAXSIZE", "4096")),
+    'claims_ttl': int(os.getenv("AUTH0_CLAIMS_CACHE_TTL", "300")),
+    'pool_maxsize': int(os.getenv("AUTH0_HTTP_POOL_MAXSIZE", "10")),
+    'timeout': float(os.getenv("AUTH0_HTTP_TIMEOUT", "5")),
+}
+
+# Verificación local de tokens contra el JWKS de Auth0.
+# La URL, el issuer y la audiencia se derivan de SOCIAL_AUTH_AUTH0_DOMAIN y SOCIAL_AUTH_AUTH0_KEY.
+AUTH0_JWKS = {
+    'cache_path': os.getenv("AUTH0_JWKS_CACHE_PATH", os.path.join(BASE_DIR, ".jwks_cache.json")),
+    'ttl': int(os.getenv("AUTH0_JWKS_TTL", str(6 * 3600))),
+    'min_refresh_interval': int(os.getenv("AUTH0_JWKS_MIN_REFRESH_INTERVAL", "300")),
+    'leeway': int(os.getenv("AUTH0_JWKS_LEEWAY", "60")),
+}
+
 AUTHENTICATION_BACKENDS = (
     "provesi.auth0backend.Auth0",
     "django.contrib.auth.backends.ModelBackend",
@@ -175,6 +196,77 @@ MONGODB_CONFIG = {
     'username': os.getenv("MONGODB_USER", "provesi_user"),
     'password': os.getenv("MONGODB_PASSWORD", "scrumteam"),
     'authSource': os.getenv("MONGODB_AUTH_SOURCE", "provesi_mongodb"),
+    # Pool de conexiones (un cliente compartido por proceso)
+    'maxPoolSize': int(os.getenv("MONGODB_MAX_POOL_SIZE", "20")),
+    'minPoolSize': int(os.getenv("MONGODB_MIN_POOL_SIZE", "0")),
+    'maxIdleTimeMS': int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000")),
+    'waitQueueTimeoutMS': int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "2000")),
+    # Timeouts
+    'serverSelectionTimeoutMS': int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+    'connectTimeoutMS': int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000")),
+    'socketTimeoutMS': int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "10000")),
+    # Segundos que se confía en el último ping antes de volver a verificar
+    'health_check_interval': int(os.getenv("MONGODB_HEALTH_CHECK_INTERVAL", "30")),
+    # LRU de content_hash escritos, para omitir los upserts sin cambios
+    'write_cache_size': int(os.getenv("MONGODB_WRITE_CACHE_SIZE", "10000")),
+    'write_cache_ttl': int(os.getenv("MONGODB_WRITE_CACHE_TTL", "300")),
+}
+
+# Outbox de sincronización PostgreSQL → MongoDB
+MONGODB_OUTBOX = {
+    # Máximo de entradas que se leen y aplican por lote
+    'batch_size': int(os.getenv("MONGODB_OUTBOX_BATCH_SIZE", "500")),
+    # Drenar el outbox en un hilo de fondo de cada proceso web
+    'background_drainer': os.getenv("MONGODB_OUTBOX_BACKGROUND", "true").lower() == "true",
+    # Segundos entre revisiones del outbox cuando no hay avisos de commit
+    'poll_interval': float(os.getenv("MONGODB_OUTBOX_POLL_INTERVAL", "5")),
+}
+
+# Worker dedicado de sincronización (manage.py mongo_sync_worker).
+# Al usarlo, desactivar el drenador de fondo con MONGODB_OUTBOX_BACKGROUND=false.
+# max_intentos y el backoff también rigen los reintentos del drenador del outbox.
+MONGODB_SYNC_WORKER = {
+    'threads': int(os.getenv("MONGODB_SYNC_WORKER_THREADS", "4")),
+    'batch_size': int(os.getenv("MONGODB_SYNC_WORKER_BATCH_SIZE", "500")),
+    'max_intentos': int(os.getenv("MONGODB_SYNC_WORKER_MAX_INTENTOS", "8")),
+    'max_intentos_conexion': int(os.getenv("MONGODB_SYNC_WORKER_MAX_INTENTOS_CONEXION", "50")),
+    'backoff_base': float(os.getenv("MONGODB_SYNC_WORKER_BACKOFF_BASE", "1")),
+    'backoff_max': float(os.getenv("MONGODB_SYNC_WORKER_BACKOFF_MAX", "300")),
+    'lease_seconds': int(os.getenv("MONGODB_SYNC_WORKER_LEASE_SECONDS", "120")),
+    'poll_interval': float(os.getenv("MONGODB_SYNC_WORKER_POLL_INTERVAL", "1")),
+}
+
+# Readiness para los health checks de Kong (provesi.readiness, /ready/)
+READINESS = {
+    # Segundos entre revisiones del hilo de fondo
+    'interval': float(os.getenv("READINESS_INTERVAL", "5")),
+    # Una revisión más vieja que esto se considera no lista
+    'stale_after': float(os.getenv("READINESS_STALE_AFTER", "30")),
+    # Fracción de maxPoolSize de MongoDB en uso a partir de la cual no se está listo
+    'max_pool_saturation': float(os.getenv("READINESS_MAX_POOL_SATURATION", "0.9")),
+    # MongoDB caído y el retraso del outbox afectan a todos los targets:
+    # por defecto solo se reportan
+    'require_mongo': os.getenv("READINESS_REQUIRE_MONGO", "false").lower() == "true",
+    'max_outbox_lag': float(os.getenv("READINESS_MAX_OUTBOX_LAG", "0")),
+}
+
+# Captura de cambios con LISTEN/NOTIFY (provesi.change_feed, manage.py listen_changes).
+# Con 'triggers' activo, migrate instala los triggers en PostgreSQL.
+CHANGE_FEED = {
+    'triggers': os.getenv("CHANGE_FEED_TRIGGERS", "false").lower() == "true",
+    'channel': os.getenv("CHANGE_FEED_CHANNEL", "provesi_cambios"),
+    # Avisos por lote y segundos que se espera a completar un lote
+    'batch_size': int(os.getenv("CHANGE_FEED_BATCH_SIZE", "500")),
+    'batch_window': float(os.getenv("CHANGE_FEED_BATCH_WINDOW", "0.5")),
+}
+
+# Caché de bodegas y estanterías (manejador_inventario.logic.cache_logic).
+# 'shared_alias' es el alias de CACHES usado como segundo nivel compartido
+# entre procesos; vacío para usar solo la caché local de cada proceso.
+HIERARCHY_CACHE = {
+    'maxsize': int(os.getenv("HIERARCHY_CACHE_MAXSIZE", "1024")),
+    'ttl': int(os.getenv("HIERARCHY_CACHE_TTL", "300")),
+    'shared_alias': os.getenv("HIERARCHY_CACHE_SHARED_ALIAS") or None,
 }
 
 # Logging para MongoDB
@@ -198,5 +290,25 @@ LOGGING = {
             'handlers': ['console'],
             'level': 'INFO',
         },
+        'provesi.outbox': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'provesi.bulk_sync': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'provesi.sync_worker': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'provesi.change_feed': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'provesi.readiness': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
     },
 }
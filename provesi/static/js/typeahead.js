@@ -0,0 +1,42 @@
+// Sugerencias para los campos con data-typeahead-url: consulta el endpoint
+// mientras se escribe y llena el <datalist> asociado al campo.
+(function () {
+    const ESPERA_MS = 200;
+
+    function iniciar(campo) {
+        const lista = document.getElementById(campo.getAttribute('list'));
+        let temporizador = null;
+        let controlador = null;
+
+        campo.addEventListener('input', function () {
+            clearTimeout(temporizador);
+            const q = campo.value.trim();
+            if (!q) {
+                lista.replaceChildren();
+                return;
+            }
+            temporizador = setTimeout(function () {
+                if (controlador) {
+                    controlador.abort();
+                }
+                controlador = new AbortController();
+                const url = campo.dataset.typeaheadUrl + '?q=' + encodeURIComponent(q);
+                fetch(url, { signal: controlador.signal, headers: { 'Accept': 'application/json' } })
+                    .then(function (respuesta) { return respuesta.json(); })
+                    .then(function (datos) {
+                        lista.replaceChildren(...datos.resultados.map(function (producto) {
+                            const opcion = document.createElement('option');
+                            opcion.value = producto.codigo;
+                            opcion.label = producto.nombre;
+                            return opcion;
+                        }));
+                    })
+                    .catch(function () {});
+            }, ESPERA_MS);
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('input[data-typeahead-url]').forEach(iniciar);
+    });
+})();
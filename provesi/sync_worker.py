@@ -0,0 +1,352 @@
+"""
+Worker de sincronización PostgreSQL → MongoDB.
+
+Consume el outbox (la cola durable) fuera de los hilos de Django:
+reserva lotes de entradas, los aplica en paralelo con un pool de hilos
+acotado, reintenta los fallos con backoff exponencial y mueve a
+SyncDeadLetter las entradas que agotan sus intentos.
+"""
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from pymongo.errors import ConnectionFailure
+
+from .outbox import MongoUnavailable, apply_changes, merge_payload, outbox_lag
+
+logger = logging.getLogger(__name__)
+
+
+def get_worker_config():
+    """Configuración del worker con valores por defecto."""
+    config = {
+        'threads': 4,
+        'batch_size': 500,
+        'max_intentos': 8,
+        'max_intentos_conexion': 50,
+        'backoff_base': 1.0,
+        'backoff_max': 300.0,
+        'lease_seconds': 120,
+        'poll_interval': 1.0,
+    }
+    config.update(getattr(settings, 'MONGODB_SYNC_WORKER', {}))
+    return config
+
+
+def backoff(intento, base, maximo):
+    """Espera exponencial con jitter para el intento dado (1, 2, ...)."""
+    espera = min(maximo, base * (2 ** max(intento - 1, 0)))
+    return espera * random.uniform(0.5, 1.0)
+
+
+class WorkerStats:
+    """Contadores del worker, seguros entre hilos."""
+
+    VENTANA = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._recientes = deque()
+        self.inicio = time.monotonic()
+        self.aplicados = 0
+        self.filas = 0
+        self.reintentos = 0
+        self.descartados = 0
+        self.lotes = 0
+
+    def registrar(self, aplicados=0, filas=0, reintentos=0, descartados=0, lotes=0):
+        ahora = time.monotonic()
+        with self._lock:
+            self.aplicados += aplicados
+            self.filas += filas
+            self.reintentos += reintentos
+            self.descartados += descartados
+            self.lotes += lotes
+            if aplicados:
+                self._recientes.append((ahora, aplicados))
+            while self._recientes and ahora - self._recientes[0][0] > self.VENTANA:
+                self._recientes.popleft()
+
+    def snapshot(self):
+        ahora = time.monotonic()
+        with self._lock:
+            recientes = sum(n for t, n in self._recientes if ahora - t <= self.VENTANA)
+            transcurrido = ahora - self.inicio
+            return {
+                'aplicados': self.aplicados,
+                'filas': self.filas,
+                'reintentos': self.reintentos,
+                'descartados': self.descartados,
+                'lotes': self.lotes,
+                'por_segundo': self.aplicados / transcurrido if transcurrido else 0.0,
+                'por_segundo_ultimo_minuto': recientes / min(transcurrido, self.VENTANA) if transcurrido else 0.0,
+            }
+
+
+class SyncWorker:
+    """
+    Procesa el outbox en lotes.
+
+    Cada lote se reserva moviendo disponible_en hacia el futuro (lease), de
+    modo que otros consumidores no lo tomen mientras se aplica. Si el worker
+    muere, las entradas vuelven a estar disponibles al vencer la reserva.
+    """
+
+    def __init__(self, **opciones):
+        config = get_worker_config()
+        config.update({key: valor for key, valor in opciones.items() if valor is not None})
+        self.config = config
+        self.stats = WorkerStats()
+        self.executor = ThreadPoolExecutor(max_workers=config['threads'], thread_name_prefix='mongo-sync')
+        self._fallos_conexion = 0
+        self._detener = threading.Event()
+
+    # ---------- Reserva ----------
+
+    def claim(self):
+        """Reserva el siguiente lote de entradas disponibles."""
+        from .models import SyncOutbox
+
+        ahora = timezone.now()
+        with transaction.atomic():
+            filas = list(
+                SyncOutbox.objects
+                .select_for_update(skip_locked=True)
+                .filter(disponible_en__lte=ahora)
+                .order_by('id')[:self.config['batch_size']]
+            )
+            if filas:
+                SyncOutbox.objects.filter(id__in=[fila.id for fila in filas]).update(
+                    disponible_en=ahora + timedelta(seconds=self.config['lease_seconds'])
+                )
+        return filas
+
+    @staticmethod
+    def agrupar(filas):
+        """
+        Agrupa las filas por entidad como lo hace el outbox.
+        Retorna (entidad, clave) -> {'operacion', 'payload', 'filas'}.
+        """
+        trabajos = OrderedDict()
+        for fila in filas:
+            key = (fila.entidad, fila.clave)
+            anterior = trabajos.pop(key, None)
+            payload = fila.payload or {}
+            agrupadas = [fila]
+            if anterior is not None:
+                payload = merge_payload(fila.entidad, anterior['payload'], payload)
+                agrupadas = anterior['filas'] + agrupadas
+            trabajos[key] = {'operacion': fila.operacion, 'payload': payload, 'filas': agrupadas}
+        return trabajos
+
+    def particionar(self, trabajos):
+        """
+        Reparte los trabajos entre los hilos.
+
+        Bodegas y ubicaciones van juntas en una sola partición, porque las
+        actualizaciones puntuales y las reconstrucciones de una misma bodega
+        no pueden aplicarse en paralelo.
+        """
+        hilos = self.config['threads']
+        particiones = [OrderedDict() for _ in range(hilos)]
+        for key, trabajo in trabajos.items():
+            entidad, clave = key
+            if entidad in ('bodega', 'ubicacion'):
+                indice = 0
+            else:
+                indice = hash(key) % hilos
+            particiones[indice][key] = trabajo
+        return [particion for particion in particiones if particion]
+
+    # ---------- Procesamiento ----------
+
+    def _aplicar(self, trabajos):
+        from .models import SyncOutbox
+        from .mongodb_sync import get_mongo_db
+
+        db = get_mongo_db()
+        if db is None:
+            raise MongoUnavailable("MongoDB no disponible")
+        cambios = OrderedDict(
+            (key, {'operacion': t['operacion'], 'payload': t['payload']}) for key, t in trabajos.items()
+        )
+        apply_changes(db, cambios)
+        ids = [fila.id for t in trabajos.values() for fila in t['filas']]
+        SyncOutbox.objects.filter(id__in=ids).delete()
+        self._fallos_conexion = 0
+        self.stats.registrar(aplicados=len(trabajos), filas=len(ids))
+
+    def procesar_particion(self, trabajos):
+        """
+        Aplica una partición en bloque; si falla, aplica cada trabajo por
+        separado para aislar las entradas problemáticas.
+        """
+        try:
+            try:
+                self._aplicar(trabajos)
+                return
+            except Exception as e:
+                if len(trabajos) == 1 or self._es_error_de_conexion(e):
+                    self._reprogramar(trabajos, e)
+                    return
+                logger.warning(f"Lote con errores ({e}), aplicando {len(trabajos)} trabajos por separado")
+
+            self.aplicar_por_separado(trabajos)
+        finally:
+            close_old_connections()
+
+    def aplicar_por_separado(self, trabajos):
+        """
+        Aplica cada trabajo por su cuenta; los que fallan se reprograman o,
+        si agotaron sus intentos, pasan a SyncDeadLetter.
+        """
+        for key, trabajo in trabajos.items():
+            unico = OrderedDict([(key, trabajo)])
+            try:
+                with transaction.atomic():
+                    self._aplicar(unico)
+            except Exception as e:
+                self._reprogramar(unico, e)
+
+    @staticmethod
+    def _bodegas_de_ubicaciones(trabajos):
+        """Clave de ubicación -> código de su bodega, para las ubicaciones que aún existen."""
+        from manejador_inventario.models import Ubicacion
+
+        ids = [int(clave) for entidad, clave in trabajos if entidad == 'ubicacion']
+        if not ids:
+            return {}
+        return {
+            str(ubicacion_id): bodega
+            for ubicacion_id, bodega in Ubicacion.objects.filter(id__in=ids).values_list('id', 'estanteria__bodega_id')
+        }
+
+    @staticmethod
+    def _es_error_de_conexion(error):
+        return isinstance(error, (MongoUnavailable, ConnectionFailure))
+
+    def _reprogramar(self, trabajos, error):
+        """
+        Programa un nuevo intento con backoff, o descarta el trabajo si agotó
+        sus intentos. Los errores de conexión también cuentan, pero con su
+        propio límite (max_intentos_conexion, más alto) para que una caída
+        de MongoDB no mande todo el outbox a SyncDeadLetter.
+
+        Tras un error de conexión no se sabe si MongoDB alcanzó a aplicar las
+        actualizaciones puntuales de ubicaciones; en lugar de repetirlas, sus
+        entradas se convierten en la reconstrucción completa de la bodega.
+        """
+        from .models import SyncDeadLetter, SyncOutbox
+
+        ahora = timezone.now()
+        conexion = self._es_error_de_conexion(error)
+        mensaje = str(error)[:2000]
+        descartados = 0
+        bodegas = self._bodegas_de_ubicaciones(trabajos) if conexion else {}
+
+        with transaction.atomic():
+            for (entidad, clave), trabajo in trabajos.items():
+                ids = [fila.id for fila in trabajo['filas']]
+                operacion, payload = trabajo['operacion'], trabajo['payload']
+                if entidad == 'ubicacion' and conexion:
+                    if clave not in bodegas:
+                        # La ubicación ya no existe: su eliminación marcó la bodega
+                        SyncOutbox.objects.filter(id__in=ids).delete()
+                        continue
+                    entidad, clave, operacion, payload = 'bodega', bodegas[clave], 'upsert', {}
+                    SyncOutbox.objects.filter(id__in=ids).update(
+                        entidad=entidad, clave=clave, operacion=operacion, payload=payload,
+                    )
+
+                intentos = max(fila.intentos for fila in trabajo['filas']) + 1
+                limite = self.config['max_intentos_conexion' if conexion else 'max_intentos']
+
+                if intentos >= limite:
+                    SyncDeadLetter.objects.create(
+                        entidad=entidad,
+                        clave=clave,
+                        operacion=operacion,
+                        payload=payload,
+                        intentos=intentos,
+                        error=mensaje,
+                        fecha_creacion=min(fila.fecha_creacion for fila in trabajo['filas']),
+                    )
+                    SyncOutbox.objects.filter(id__in=ids).delete()
+                    descartados += 1
+                    logger.error(f"❌ {entidad} {clave} descartado tras {intentos} intentos: {mensaje}")
+                    continue
+
+                numero = self._fallos_conexion + 1 if conexion else intentos
+                espera = backoff(numero, self.config['backoff_base'], self.config['backoff_max'])
+                SyncOutbox.objects.filter(id__in=ids).update(
+                    intentos=intentos,
+                    ultimo_error=mensaje,
+                    disponible_en=ahora + timedelta(seconds=espera),
+                )
+
+        if conexion:
+            self._fallos_conexion += 1
+        self.stats.registrar(reintentos=len(trabajos) - descartados, descartados=descartados)
+
+    def run_once(self):
+        """Reserva y procesa un lote. Retorna el número de filas reservadas."""
+        filas = self.claim()
+        if not filas:
+            return 0
+
+        particiones = self.particionar(self.agrupar(filas))
+        futuros = [self.executor.submit(self.procesar_particion, particion) for particion in particiones]
+        for futuro in futuros:
+            futuro.result()
+
+        self.stats.registrar(lotes=1)
+        return len(filas)
+
+    def report(self):
+        """Estadísticas del worker más el estado de la cola y las escrituras omitidas."""
+        from .mongodb_sync import get_write_stats
+
+        resumen = self.stats.snapshot()
+        resumen.update(outbox_lag())
+        escrituras = get_write_stats()
+        resumen.update(escritos=escrituras['escritos'], omitidos=escrituras['omitidos'])
+        return resumen
+
+    def stop(self):
+        self._detener.set()
+
+    def run(self, stats_interval=30, on_stats=None):
+        """
+        Procesa el outbox hasta que se llame a stop(). Cada `stats_interval`
+        segundos entrega las estadísticas a `on_stats` (o al log).
+        """
+        ultimo_reporte = time.monotonic()
+        try:
+            while not self._detener.is_set():
+                try:
+                    procesadas = self.run_once()
+                except Exception as e:
+                    logger.error(f"❌ Error en el worker de sincronización: {e}")
+                    procesadas = 0
+                finally:
+                    close_old_connections()
+
+                if not procesadas:
+                    self._detener.wait(self.config['poll_interval'])
+
+                if time.monotonic() - ultimo_reporte >= stats_interval:
+                    ultimo_reporte = time.monotonic()
+                    resumen = self.report()
+                    if on_stats:
+                        on_stats(resumen)
+                    else:
+                        logger.info(f"Worker: {resumen}")
+        finally:
+            self.executor.shutdown(wait=True)
@@ -0,0 +1,884 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from datetime import timedelta
+from unittest import mock
+
+import jwt
+import psycopg2
+from cryptography.hazmat.primitives.asymmetric import rsa
+from pymongo.errors import ConnectionFailure
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from manejador_inventario.models import Bodega, Estanteria, Producto, StockBodega, StockProducto, Ubicacion
+from manejador_pedidos.models import Item, Pedido
+from . import auth0backend, change_feed, mongo_indexes, mongodb_sync, readiness, serializers, unit_of_work, verify_sync
+from .bulk_sync import get_queryset, sync_entidad_bulk
+from .document_builders import build_producto_documents, content_hash
+from .exports import export_stream
+from .models import SyncDeadLetter, SyncOutbox
+from .outbox import apply_ubicacion_deltas, build_ubicacion_delta, collapse, drain_outbox, merge_payload
+from .sync_worker import SyncWorker, backoff
+from .verify_sync import _hashes_mongo, _rangos, diff_hashes
+from .auth0backend import JWKSKeySet, TokenVerifier, get_claims_cache
+
+ISSUER = 'https://provesi.test/'
+AUDIENCE = 'cliente-provesi'
+
+
+def generar_clave(kid):
+    """Par de claves RSA local que hace las veces de clave de Auth0."""
+    privada = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(privada.public_key()))
+    jwk.update(kid=kid, use='sig', alg='RS256')
+    return privada, jwk
+
+
+def firmar(privada, kid, **claims):
+    contenido = {
+        'iss': ISSUER,
+        'aud': AUDIENCE,
+        'sub': 'auth0|1',
+        'iat': int(time.time()),
+        'exp': int(time.time()) + 600,
+        'role': 'admin',
+    }
+    contenido.update(claims)
+    return jwt.encode(contenido, privada, algorithm='RS256', headers={'kid': kid})
+
+
+class TokenVerifierTests(SimpleTestCase):
+    """Los tokens se verifican localmente contra un JWKS cacheado."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.privada, cls.jwk = generar_clave('k1')
+        cls.privada_nueva, cls.jwk_nueva = generar_clave('k2')
+
+    def setUp(self):
+        get_claims_cache().clear()
+        self.documentos = [{'keys': [self.jwk]}]
+        self.descargas = 0
+
+    def fetch(self):
+        self.descargas += 1
+        documento = self.documentos[0]
+        if isinstance(documento, Exception):
+            raise documento
+        return documento
+
+    def verifier(self, **opciones):
+        keyset = JWKSKeySet('https://provesi.test/jwks.json', fetch=self.fetch, min_refresh_interval=0, **opciones)
+        return TokenVerifier(keyset, issuer=ISSUER, audience=AUDIENCE)
+
+    def test_token_valido_y_resultado_cacheado(self):
+        verifier = self.verifier()
+        token = firmar(self.privada, 'k1')
+
+        self.assertEqual(verifier.verify(token)['role'], 'admin')
+        self.assertEqual(verifier.verify(token)['role'], 'admin')
+        self.assertEqual(self.descargas, 1)
+        self.assertEqual(get_claims_cache().stats()['hits'], 1)
+
+    def test_rechaza_firma_audiencia_y_expiracion(self):
+        verifier = self.verifier()
+        otra, _ = generar_clave('k1')
+
+        for token in (
+            firmar(otra, 'k1'),
+            firmar(self.privada, 'k1', aud='otro-cliente'),
+            firmar(self.privada, 'k1', exp=int(time.time()) - 3600),
+        ):
+            with self.assertRaises(jwt.InvalidTokenError):
+                verifier.verify(token)
+
+    def test_kid_desconocido_refresca_el_jwks(self):
+        verifier = self.verifier()
+        verifier.verify(firmar(self.privada, 'k1'))
+
+        self.documentos[0] = {'keys': [self.jwk, self.jwk_nueva]}
+        claims = verifier.verify(firmar(self.privada_nueva, 'k2'))
+
+        self.assertEqual(claims['sub'], 'auth0|1')
+        self.assertEqual(self.descargas, 2)
+
+    def test_refresco_limitado_por_intervalo(self):
+        keyset = JWKSKeySet('https://provesi.test/jwks.json', fetch=self.fetch, min_refresh_interval=300)
+        verifier = TokenVerifier(keyset, issuer=ISSUER, audience=AUDIENCE)
+
+        for _ in range(3):
+            with self.assertRaises(jwt.InvalidTokenError):
+                verifier.verify(firmar(self.privada_nueva, 'k2'))
+        self.assertEqual(self.descargas, 1)
+
+    def test_jwks_en_disco_sin_red(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, 'jwks.json')
+            self.verifier(cache_path=ruta).keyset.refresh(forzar=True)
+            self.assertTrue(os.path.exists(ruta))
+
+            self.documentos[0] = ConnectionError('sin red')
+            get_claims_cache().clear()
+            verifier = self.verifier(cache_path=ruta)
+
+            self.assertEqual(verifier.verify(firmar(self.privada, 'k1'))['role'], 'admin')
+
+
+class RoleResolutionTests(SimpleTestCase):
+    """El rol se resuelve una vez por petición y los claims se comparten entre peticiones."""
+
+    def setUp(self):
+        # Caché propia para no alterar los contadores de la del proceso
+        parche = mock.patch.object(auth0backend, '_claims_cache', None)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def peticion(self, access_token='token-opaco'):
+        request = RequestFactory().get('/')
+        request.session = {}
+        request.user = mock.Mock(is_authenticated=True)
+        auth0user = mock.Mock(extra_data={'access_token': access_token})
+        request.user.social_auth.filter.return_value.first.return_value = auth0user
+        return request
+
+    def test_rol_memoizado_por_peticion(self):
+        request = self.peticion()
+        with mock.patch.object(auth0backend, '_resolve_user_role', return_value=None) as resolver:
+            self.assertIsNone(auth0backend.get_user_role(request))
+            self.assertIsNone(auth0backend.get_user_role(request))
+        # También se memoiza un rol vacío
+        resolver.assert_called_once_with(request)
+
+    def test_userinfo_cacheado_entre_peticiones(self):
+        with mock.patch.object(auth0backend, 'fetch_userinfo', return_value={'role': 'admin'}) as userinfo:
+            self.assertEqual(auth0backend.get_user_role(self.peticion()), 'admin')
+            self.assertEqual(auth0backend.get_user_role(self.peticion()), 'admin')
+            self.assertEqual(auth0backend.get_user_role(self.peticion('otro-token')), 'admin')
+        self.assertEqual(userinfo.call_count, 2)
+
+    def test_ttl_de_claims_acotado_por_la_expiracion(self):
+        ttl = auth0backend.get_auth_cache_config()['claims_ttl']
+        self.assertEqual(auth0backend._claims_ttl({'role': 'admin'}), ttl)
+        self.assertLessEqual(auth0backend._claims_ttl({'exp': time.time() + 10}), 10)
+        self.assertEqual(auth0backend._claims_ttl({'exp': time.time() - 10}), 0)
+
+        cargas = []
+        with mock.patch('provesi.cache.time.monotonic', return_value=1000.0):
+            auth0backend.get_cached_claims('t', lambda: cargas.append(1) or {'exp': time.time() + 10})
+        with mock.patch('provesi.cache.time.monotonic', return_value=1005.0):
+            auth0backend.get_cached_claims('t', lambda: cargas.append(1) or {})
+        with mock.patch('provesi.cache.time.monotonic', return_value=1011.0):
+            auth0backend.get_cached_claims('t', lambda: cargas.append(1) or {})
+        self.assertEqual(len(cargas), 2)
+
+
+class SerializerTests(TestCase):
+    """Los serializers producen lo mismo que toJson() en una consulta por queryset."""
+
+    @classmethod
+    def setUpTestData(cls):
+        bodega = Bodega.objects.create(codigo='MED01', ciudad='Medellín', direccion='Calle 1')
+        estanteria = Estanteria.objects.create(bodega=bodega, zona='A', codigo=1, niveles=3)
+        producto = Producto.objects.create(codigo='S1', nombre='Serial', descripcion='Desc', precio=10)
+        for nivel in range(3):
+            Ubicacion.objects.create(
+                estanteria=estanteria, producto=producto if nivel else None,
+                nivel=nivel, codigo=0, capacidad=10, stock=nivel,
+            )
+        pedido = Pedido.objects.create()
+        Item.objects.create(pedido=pedido, producto=producto, cantidad=2)
+
+    def test_misma_forma_que_to_json(self):
+        casos = [
+            (Bodega, serializers.BODEGA),
+            (Estanteria, serializers.ESTANTERIA),
+            (Producto, serializers.PRODUCTO),
+            (Ubicacion, serializers.UBICACION),
+            (Pedido, serializers.PEDIDO),
+            (Item, serializers.ITEM),
+        ]
+        for modelo, serializer in casos:
+            with self.subTest(modelo=modelo.__name__):
+                queryset = modelo.objects.order_by('pk')
+                with self.assertNumQueries(1):
+                    filas = serializer.serialize(queryset)
+                self.assertEqual(filas, [instancia.toJson() for instancia in queryset])
+
+    def test_dumps_codifica_fechas(self):
+        filas = serializers.PEDIDO.serialize(Pedido.objects.all())
+        decodificado = serializers.loads(serializers.dumps(filas))
+        self.assertEqual(
+            decodificado[0]['fecha_creacion'][:19],
+            filas[0]['fecha_creacion'].isoformat()[:19],
+        )
+
+
+class ExportTests(TestCase):
+    """Las exportaciones en streaming respetan el formato y el rango de claves."""
+
+    @classmethod
+    def setUpTestData(cls):
+        bodega = Bodega.objects.create(codigo='PER01', ciudad='Pereira', direccion='Calle 1')
+        estanteria = Estanteria.objects.create(bodega=bodega, zona='A', codigo=1, niveles=1)
+        cls.productos = [
+            Producto.objects.create(codigo=f'E{i}', nombre=f'Export {i}', descripcion='Desc', precio=i)
+            for i in range(3)
+        ]
+        for i, producto in enumerate(cls.productos):
+            Ubicacion.objects.create(estanteria=estanteria, producto=producto, nivel=0, codigo=i, capacidad=5, stock=i)
+        cls.pedidos = [Pedido.objects.create() for _ in range(3)]
+        for producto in cls.productos[:2]:
+            Item.objects.create(pedido=cls.pedidos[0], producto=producto, cantidad=1)
+
+    def exportar(self, entidad, **kwargs):
+        return b''.join(export_stream(entidad, chunk_size=2, **kwargs))
+
+    def test_ndjson_de_pedidos_agrupa_los_items(self):
+        lineas = [json.loads(linea) for linea in self.exportar('pedidos').splitlines()]
+        self.assertEqual([pedido['id'] for pedido in lineas], [pedido.id for pedido in self.pedidos])
+        self.assertEqual([item['producto'] for item in lineas[0]['items']], ['E0', 'E1'])
+        self.assertEqual(lineas[1]['items'], [])
+
+    def test_csv_de_ubicaciones_con_jerarquia(self):
+        filas = list(csv.DictReader(io.StringIO(self.exportar('ubicaciones', formato='csv').decode())))
+        self.assertEqual(len(filas), 3)
+        self.assertEqual(filas[0]['estanteria.bodega.ciudad'], 'Pereira')
+        self.assertEqual(filas[2]['producto'], 'E2')
+
+    def test_gzip_y_rango_de_claves(self):
+        datos = gzip.decompress(self.exportar('productos', gzip=True, despues='E0', hasta='E1'))
+        self.assertEqual([json.loads(linea)['codigo'] for linea in datos.splitlines()], ['E1'])
+
+
+class VerifySyncTests(TestCase):
+    """Los hashes de contenido y los rangos que compara verify_mongo_sync."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for codigo in ('b2', 'B1', 'a3'):
+            Producto.objects.create(codigo=codigo, nombre='Hash', descripcion='Desc', precio=10)
+
+    def test_hash_ignora_id_y_sync_timestamp(self):
+        documento = build_producto_documents(['B1'])['B1']
+        leido = dict(reversed(list(documento.items())), _id='abc', sync_timestamp='2020-01-01T00:00:00')
+        self.assertEqual(content_hash(leido), content_hash(documento))
+        self.assertNotEqual(content_hash(dict(documento, precio=11)), content_hash(documento))
+
+    def test_rangos_en_orden_binario_y_abiertos_al_final(self):
+        rangos = list(_rangos('producto', 2))
+        self.assertEqual(rangos, [(None, 'a3', ['B1', 'a3']), ('a3', None, ['b2'])])
+
+    def test_diff_hashes(self):
+        self.assertEqual(
+            diff_hashes({'1': 'x', '2': 'y', '3': 'z'}, {'2': 'y', '3': 'w', '4': 'v'}),
+            (['1'], ['3'], ['4']),
+        )
+
+    def coleccion(self, documentos):
+        """Colección falsa: rangos proyectando {codigo, content_hash} y consultas por $in."""
+        coleccion = mock.MagicMock()
+
+        def find(filtro, proyeccion):
+            condicion = filtro.get('codigo', {})
+            claves = condicion.get('$in')
+            if claves is None:
+                resultado = [
+                    {campo: documento[campo] for campo in ('codigo', 'content_hash') if campo in documento}
+                    for documento in documentos
+                    if documento['codigo'] > condicion.get('$gt', '')
+                    and ('$lte' not in condicion or documento['codigo'] <= condicion['$lte'])
+                ]
+            else:
+                resultado = [documento for documento in documentos if documento['codigo'] in claves]
+            cursor = mock.MagicMock()
+            cursor.__iter__.return_value = iter(resultado)
+            cursor.batch_size.return_value = cursor
+            return cursor
+
+        coleccion.find.side_effect = find
+        return coleccion
+
+    def test_hashes_mongo_usa_el_hash_guardado(self):
+        documentos = build_producto_documents(['B1', 'a3'])
+        sin_hash = dict(documentos['a3'])
+        del sin_hash['content_hash']
+        coleccion = self.coleccion([documentos['B1'], sin_hash])
+
+        hashes = _hashes_mongo(coleccion, 'codigo', None, None, 10)
+
+        self.assertEqual(hashes, {'B1': documentos['B1']['content_hash'], 'a3': documentos['a3']['content_hash']})
+        self.assertEqual(coleccion.find.call_args_list[0].args[1], {'_id': 0, 'codigo': 1, 'content_hash': 1})
+        self.assertEqual(coleccion.find.call_args_list[1].args[0], {'codigo': {'$in': ['a3']}})
+
+    def test_rangos_iguales_no_se_comparan_documento_a_documento(self):
+        documentos = build_producto_documents(['B1', 'a3', 'b2'])
+        db = mock.MagicMock()
+        db.__getitem__.return_value = self.coleccion(list(documentos.values()))
+
+        with mock.patch.object(verify_sync, 'get_mongo_db', return_value=db), \
+                mock.patch.object(verify_sync, 'diff_hashes', wraps=diff_hashes) as comparar:
+            resultado = verify_sync.verify_entidad('producto', bucket_size=2)
+            self.assertEqual((resultado['rangos'], resultado['rangos_distintos']), (2, 0))
+            comparar.assert_not_called()
+
+            db.__getitem__.return_value = self.coleccion([documentos['B1'], dict(documentos['b2'], content_hash='x')])
+            resultado = verify_sync.verify_entidad('producto', bucket_size=2)
+        self.assertEqual((resultado['faltantes'], resultado['desactualizados']), (1, 1))
+        self.assertEqual(resultado['detalle']['desactualizados'], ['b2'])
+
+
+class MongoClientTests(SimpleTestCase):
+    """El cliente de MongoDB se comparte por proceso y se recrea tras un fork."""
+
+    def setUp(self):
+        mongodb_sync.close_mongo_client()
+        self.addCleanup(mongodb_sync.close_mongo_client)
+        parche = mock.patch.object(mongodb_sync, '_build_client', side_effect=lambda config: mock.MagicMock())
+        self.build_client = parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_reutiliza_el_cliente_y_lo_recrea_tras_un_fork(self):
+        cliente = mongodb_sync.get_mongo_client()
+        self.assertIs(mongodb_sync.get_mongo_client(), cliente)
+
+        with mock.patch.object(mongodb_sync.os, 'getpid', return_value=os.getpid() + 1):
+            hijo = mongodb_sync.get_mongo_client()
+            self.assertIsNot(hijo, cliente)
+            self.assertIs(mongodb_sync.get_mongo_client(), hijo)
+        # El cliente heredado no se cierra: sus sockets son del padre
+        cliente.close.assert_not_called()
+        self.assertEqual(self.build_client.call_count, 2)
+
+    def test_ping_solo_al_vencer_el_estado(self):
+        cliente = mongodb_sync.get_mongo_client()
+        self.assertIsNotNone(mongodb_sync.get_mongo_db())
+        self.assertIsNotNone(mongodb_sync.get_mongo_db())
+        self.assertEqual(cliente.admin.command.call_count, 1)
+
+        mongodb_sync.mark_mongo_unavailable('caído')
+        self.assertIsNone(mongodb_sync.get_mongo_db())
+        self.assertEqual(mongodb_sync.get_mongo_status()['error'], 'caído')
+
+
+class EscriturasRedundantesTests(SimpleTestCase):
+    """Los documentos sin cambios no se vuelven a escribir en MongoDB."""
+
+    def setUp(self):
+        mongodb_sync.reset_write_stats()
+
+    def test_omite_hash_ya_escrito_y_olvida_al_eliminar(self):
+        documento = {'codigo': 'P1', 'precio': 10}
+        documento['content_hash'] = content_hash(documento)
+
+        self.assertEqual(mongodb_sync.filter_unchanged('productos', 'codigo', [documento]), [documento])
+        mongodb_sync.mark_written('productos', 'codigo', [documento])
+        self.assertEqual(mongodb_sync.filter_unchanged('productos', 'codigo', [dict(documento)]), [])
+
+        cambiado = dict(documento, precio=11)
+        cambiado['content_hash'] = content_hash(cambiado)
+        self.assertEqual(mongodb_sync.filter_unchanged('productos', 'codigo', [cambiado]), [cambiado])
+
+        mongodb_sync.forget_written('productos', ['P1'])
+        self.assertEqual(mongodb_sync.filter_unchanged('productos', 'codigo', [documento]), [documento])
+
+        stats = mongodb_sync.get_write_stats()
+        self.assertEqual((stats['escritos'], stats['omitidos']), (1, 1))
+
+
+def aviso(tabla, op, nuevo=None, viejo=None):
+    return json.dumps({'t': tabla, 'op': op, 'n': nuevo or {}, 'o': viejo or {}})
+
+
+class ChangeFeedTests(TestCase):
+    """Los avisos de los triggers se traducen a entradas del outbox."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bodega = Bodega.objects.create(codigo='CF01', ciudad='Cali', direccion='Calle 2')
+        cls.estanteria = Estanteria.objects.create(bodega=cls.bodega, zona='A', codigo=1, niveles=1)
+
+    def test_avisos_a_outbox_colapsados(self):
+        procesados = change_feed.process_notifications([
+            aviso('manejador_inventario_ubicacion', 'U',
+                  {'id': 1, 'estanteria_id': self.estanteria.id, 'producto_id': 'P2'},
+                  {'id': 1, 'estanteria_id': self.estanteria.id, 'producto_id': 'P1'}),
+            aviso('manejador_pedidos_item', 'I', {'pedido_id': 7}),
+            aviso('manejador_pedidos_pedido', 'D', viejo={'id': 8}),
+            aviso('manejador_pedidos_pedido', 'U', {'id': 7}, {'id': 7}),
+            'no es json',
+            aviso('otra_tabla', 'I', {'id': 1}),
+        ])
+        self.assertEqual(procesados, 4)
+        self.assertEqual(
+            set(SyncOutbox.objects.values_list('entidad', 'clave', 'operacion')),
+            {
+                ('producto', 'P1', 'upsert'), ('producto', 'P2', 'upsert'), ('bodega', 'CF01', 'upsert'),
+                ('pedido', '7', 'upsert'), ('pedido', '8', 'delete'),
+            },
+        )
+
+    def test_reconcilia_los_agregados_antes_de_reconstruir(self):
+        producto = Producto.objects.create(codigo='CF-P', nombre='Feed', descripcion='Desc', precio=4)
+        ubicacion = Ubicacion.objects.create(
+            estanteria=self.estanteria, producto=producto, nivel=0, codigo=1, capacidad=20, stock=3,
+        )
+        # QuerySet.update no pasa por los signals que mantienen los agregados
+        Ubicacion.objects.filter(id=ubicacion.id).update(stock=9)
+
+        change_feed.process_notifications([
+            aviso('manejador_inventario_ubicacion', 'U',
+                  {'id': ubicacion.id, 'estanteria_id': self.estanteria.id, 'producto_id': 'CF-P'},
+                  {'id': ubicacion.id, 'estanteria_id': self.estanteria.id, 'producto_id': 'CF-P'}),
+        ])
+
+        self.assertEqual(StockProducto.objects.get(producto_id='CF-P').stock_total, 9)
+        self.assertEqual(StockBodega.objects.get(bodega_id='CF01').total_stock, 9)
+
+    def test_update_solo_avisa_si_cambian_las_columnas_sincronizadas(self):
+        _, _, columnas = change_feed.TABLAS['manejador_inventario_ubicacion']
+        self.assertNotIn('reservado', columnas)
+        self.assertNotIn('fecha_actualizacion', change_feed.TABLAS['manejador_pedidos_pedido'][2])
+        self.assertEqual(
+            change_feed._condicion_update(('stock', 'nivel')),
+            '(ROW(OLD.stock, OLD.nivel) IS DISTINCT FROM ROW(NEW.stock, NEW.nivel))',
+        )
+
+    def test_listener_sobrevive_a_una_reconexion_fallida(self):
+        class Detener(Exception):
+            pass
+
+        listener = mock.Mock()
+        listener.next_batch.side_effect = [psycopg2.OperationalError('caída'), Detener]
+        listener.connect.side_effect = [None, psycopg2.OperationalError('rechazada'), None]
+        modulo = 'provesi.management.commands.listen_changes'
+        with mock.patch(f'{modulo}.ChangeListener', return_value=listener), \
+                mock.patch(f'{modulo}.signal.signal'), mock.patch(f'{modulo}.time.sleep') as dormir:
+            with self.assertRaises(Detener):
+                call_command('listen_changes', idle_timeout=1, stdout=io.StringIO(), stderr=io.StringIO())
+
+        self.assertEqual(listener.connect.call_count, 3)
+        self.assertEqual([llamada.args[0] for llamada in dormir.call_args_list], [1, 2.0])
+        listener.close.assert_called()
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'LISTEN/NOTIFY requiere PostgreSQL')
+class ChangeFeedPostgresTests(TransactionTestCase):
+    """Los triggers publican un aviso al confirmar cambios hechos sin pasar por los signals."""
+
+    def setUp(self):
+        change_feed.install_triggers()
+        self.listener = change_feed.ChangeListener(batch_window=0.2)
+        self.listener.connect()
+
+    def tearDown(self):
+        self.listener.close()
+        change_feed.uninstall_triggers()
+
+    def test_update_masivo_genera_avisos(self):
+        Producto.objects.bulk_create([
+            Producto(codigo=f'N{i}', nombre='Notify', descripcion='Desc', precio=1) for i in range(3)
+        ])
+        Producto.objects.filter(codigo='N1').update(precio=2)
+
+        avisos = [json.loads(payload) for payload in self.listener.next_batch(timeout=2)]
+        self.assertEqual([(a['op'], a['n']['codigo']) for a in avisos][-1], ('U', 'N1'))
+        self.assertEqual(change_feed.process_notifications([json.dumps(a) for a in avisos]), 4)
+        self.assertTrue(SyncOutbox.objects.filter(entidad='producto', clave='N1').exists())
+
+    def test_update_de_columnas_que_no_se_sincronizan_no_avisa(self):
+        bodega = Bodega.objects.create(codigo='NT01', ciudad='Cali', direccion='Calle 5')
+        estanteria = Estanteria.objects.create(bodega=bodega, zona='A', codigo=1, niveles=1)
+        ubicacion = Ubicacion.objects.create(estanteria=estanteria, nivel=0, codigo=1, capacidad=5, stock=5)
+        self.listener.next_batch(timeout=1)
+
+        Ubicacion.objects.filter(id=ubicacion.id).update(reservado=2)
+        ubicacion.refresh_from_db()
+        ubicacion.save()
+        self.assertEqual(self.listener.next_batch(timeout=1), [])
+
+        Ubicacion.objects.filter(id=ubicacion.id).update(stock=4)
+        avisos = [json.loads(payload) for payload in self.listener.next_batch(timeout=2)]
+        self.assertEqual([(a['t'], a['op']) for a in avisos], [('manejador_inventario_ubicacion', 'U')])
+
+
+class ReadinessTests(TestCase):
+    """/ready/ responde desde la última revisión en memoria."""
+
+    def responder(self, foto):
+        ticker = mock.Mock(snapshot=mock.Mock(return_value=foto))
+        with mock.patch.object(readiness, 'get_ticker', return_value=ticker):
+            return self.client.get('/ready/')
+
+    def test_probe_sin_mongo_obligatorio_esta_listo(self):
+        foto = readiness.probe(dict(readiness.get_readiness_config(), require_mongo=False))
+        self.assertTrue(foto['postgres']['disponible'])
+        self.assertFalse(foto['mongo']['disponible'])
+        self.assertEqual((foto['listo'], foto['outbox']['pendientes']), (True, 0))
+
+        foto = readiness.probe(dict(readiness.get_readiness_config(), require_mongo=True))
+        self.assertEqual(foto['motivos'], ['mongo'])
+
+    def test_vista_usa_la_foto_y_detecta_fotos_viejas(self):
+        self.assertEqual(self.responder(None).status_code, 503)
+
+        foto = {'listo': True, 'motivos': [], 'verificado_en': time.time()}
+        respuesta = self.responder(foto)
+        self.assertEqual(respuesta.status_code, 200)
+
+        respuesta = self.responder(dict(foto, verificado_en=time.time() - 3600))
+        self.assertEqual(respuesta.status_code, 503)
+        self.assertEqual(respuesta.json()['motivos'], ['desactualizado'])
+
+
+class UbicacionDeltaTests(TestCase):
+    """Las actualizaciones puntuales de ubicaciones son idempotentes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bodega = Bodega.objects.create(codigo='DL01', ciudad='Tunja', direccion='Calle 3')
+        estanteria = Estanteria.objects.create(bodega=cls.bodega, zona='B', codigo=2, niveles=1)
+        producto = Producto.objects.create(codigo='DL-P', nombre='Delta', descripcion='Desc', precio=4)
+        cls.ubicacion = Ubicacion.objects.create(
+            estanteria=estanteria, producto=producto, nivel=0, codigo=1, capacidad=10, stock=6,
+        )
+
+    def test_creada_asigna_totales_y_no_duplica(self):
+        operacion = build_ubicacion_delta(self.ubicacion, {'delta_stock': 6, 'creada': True}, (6, 1))
+        filtro, cambios = operacion._filter, operacion._doc
+        self.assertEqual(filtro['estanterias.ubicaciones.id'], {'$ne': self.ubicacion.id})
+        self.assertEqual(filtro['estanterias'], {'$elemMatch': {'zona': 'B', 'codigo': 2}})
+        push = cambios['$push']['estanterias.$[e].ubicaciones']
+        self.assertEqual([subdocumento['stock'] for subdocumento in push['$each']], [6])
+        self.assertEqual(push['$sort'], {'nivel': 1, 'codigo': 1})
+        self.assertEqual((cambios['$set']['total_stock'], cambios['$set']['total_ubicaciones']), (6, 1))
+        self.assertNotIn('$inc', cambios)
+
+    def test_actualizada_reemplaza_subdocumento(self):
+        operacion = build_ubicacion_delta(self.ubicacion, {'delta_stock': -2}, (6, 1))
+        self.assertEqual(operacion._filter['estanterias.ubicaciones.id'], self.ubicacion.id)
+        self.assertEqual(operacion._doc['$set']['estanterias.$[e].ubicaciones.$[u]']['id'], self.ubicacion.id)
+        self.assertEqual(operacion._doc['$set']['total_stock'], 6)
+        self.assertEqual(operacion._array_filters[1], {'u.id': self.ubicacion.id})
+
+    def test_totales_de_stock_bodega_y_reconstruccion_si_no_modifica(self):
+        db = mock.MagicMock()
+        db.bodegas.bulk_write.return_value = mock.Mock(modified_count=1)
+        cambios = {str(self.ubicacion.id): {'delta_stock': 1}}
+
+        self.assertEqual(apply_ubicacion_deltas(db, cambios, set()), (1, set()))
+        operacion = db.bodegas.bulk_write.call_args[0][0][0]
+        self.assertEqual(operacion._doc['$set']['total_stock'], 6)
+
+        db.bodegas.bulk_write.return_value = mock.Mock(modified_count=0)
+        self.assertEqual(apply_ubicacion_deltas(db, cambios, set()), (1, {'DL01'}))
+        self.assertEqual(apply_ubicacion_deltas(db, cambios, {'DL01'}), (0, set()))
+
+
+class SyncWorkerTests(TestCase):
+    """Reintentos, descarte y particionado del worker de sincronización."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bodega = Bodega.objects.create(codigo='WK01', ciudad='Neiva', direccion='Calle 4')
+        estanteria = Estanteria.objects.create(bodega=cls.bodega, zona='A', codigo=1, niveles=1)
+        producto = Producto.objects.create(codigo='WK-P', nombre='Worker', descripcion='Desc', precio=3)
+        cls.ubicacion = Ubicacion.objects.create(
+            estanteria=estanteria, producto=producto, nivel=0, codigo=1, capacidad=10, stock=2,
+        )
+
+    def setUp(self):
+        SyncOutbox.objects.all().delete()
+        self.worker = SyncWorker(threads=2, max_intentos=3, max_intentos_conexion=5)
+        self.addCleanup(self.worker.executor.shutdown)
+
+    def trabajos(self, *filas):
+        return self.worker.agrupar(filas)
+
+    def test_backoff_crece_y_se_acota(self):
+        with mock.patch('provesi.sync_worker.random.uniform', return_value=1.0):
+            self.assertEqual([backoff(n, 1.0, 10.0) for n in (1, 2, 3, 4, 5)], [1.0, 2.0, 4.0, 8.0, 10.0])
+        self.assertGreaterEqual(backoff(1, 2.0, 10.0), 1.0)
+
+    def test_bodegas_y_ubicaciones_van_en_la_misma_particion(self):
+        trabajos = self.trabajos(
+            SyncOutbox(id=1, entidad='bodega', clave='WK01'),
+            SyncOutbox(id=2, entidad='ubicacion', clave='7', payload={'delta_stock': 1}),
+            SyncOutbox(id=3, entidad='ubicacion', clave='8', payload={'delta_stock': 1}),
+        )
+        particiones = self.worker.particionar(trabajos)
+        self.assertEqual(len(particiones), 1)
+        self.assertEqual(list(particiones[0]), [('bodega', 'WK01'), ('ubicacion', '7'), ('ubicacion', '8')])
+
+    def test_error_no_transitorio_consume_intentos_y_descarta(self):
+        fila = SyncOutbox.objects.create(entidad='producto', clave='WK-P', intentos=1)
+        self.worker._reprogramar(self.trabajos(fila), ValueError('documento inválido'))
+        fila.refresh_from_db()
+        self.assertEqual(fila.intentos, 2)
+        self.assertGreater(fila.disponible_en, fila.fecha_creacion)
+
+        self.worker._reprogramar(self.trabajos(fila), ValueError('documento inválido'))
+        self.assertFalse(SyncOutbox.objects.filter(id=fila.id).exists())
+        descartado = SyncDeadLetter.objects.get(entidad='producto', clave='WK-P')
+        self.assertEqual(descartado.intentos, 3)
+
+    def test_error_de_conexion_tiene_su_propio_limite(self):
+        fila = SyncOutbox.objects.create(entidad='producto', clave='WK-P', intentos=3)
+        self.worker._reprogramar(self.trabajos(fila), ConnectionFailure('caído'))
+        fila.refresh_from_db()
+        self.assertEqual(fila.intentos, 4)
+
+        self.worker._reprogramar(self.trabajos(fila), ConnectionFailure('caído'))
+        self.assertTrue(SyncDeadLetter.objects.filter(entidad='producto', clave='WK-P').exists())
+
+    def test_error_de_conexion_convierte_ubicaciones_en_bodega(self):
+        fila = SyncOutbox.objects.create(
+            entidad='ubicacion', clave=str(self.ubicacion.id), payload={'delta_stock': 2, 'creada': True},
+        )
+        huerfana = SyncOutbox.objects.create(entidad='ubicacion', clave='999999', payload={'delta_stock': 1})
+        with mock.patch.object(SyncWorker, '_aplicar', side_effect=ConnectionFailure('caído')):
+            self.worker.procesar_particion(self.trabajos(fila, huerfana))
+
+        fila.refresh_from_db()
+        self.assertEqual((fila.entidad, fila.clave, fila.operacion, fila.payload), ('bodega', 'WK01', 'upsert', {}))
+        self.assertEqual(fila.intentos, 1)
+        self.assertFalse(SyncOutbox.objects.filter(id=huerfana.id).exists())
+
+
+class OutboxTests(TestCase):
+    """El outbox colapsa las entradas y solo se vacía si MongoDB aceptó el lote."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Producto.objects.create(codigo='OB-1', nombre='Outbox', descripcion='Desc', precio=7)
+
+    def setUp(self):
+        SyncOutbox.objects.all().delete()
+        mongodb_sync.forget_written('productos', ['OB-1'])
+
+    def test_merge_payload_suma_variaciones_de_ubicaciones(self):
+        self.assertEqual(
+            merge_payload('ubicacion', {'delta_stock': 3, 'creada': True}, {'delta_stock': -1}),
+            {'delta_stock': 2, 'creada': True},
+        )
+        self.assertEqual(merge_payload('producto', {'a': 1}, {'b': 2}), {'b': 2})
+
+    def test_collapse_gana_la_ultima_operacion(self):
+        entradas = [
+            SyncOutbox(entidad='producto', clave='A', operacion='upsert'),
+            SyncOutbox(entidad='ubicacion', clave='5', payload={'delta_stock': 2}),
+            SyncOutbox(entidad='producto', clave='A', operacion='delete'),
+            SyncOutbox(entidad='ubicacion', clave='5', payload={'delta_stock': -5}),
+        ]
+        cambios = collapse(entradas)
+        self.assertEqual(list(cambios), [('producto', 'A'), ('ubicacion', '5')])
+        self.assertEqual(cambios[('producto', 'A')]['operacion'], 'delete')
+        self.assertEqual(cambios[('ubicacion', '5')]['payload'], {'delta_stock': -3, 'creada': False})
+
+    def test_drain_revierte_si_mongo_falla(self):
+        SyncOutbox.objects.create(entidad='producto', clave='OB-1')
+        db = mock.MagicMock()
+        productos = db.__getitem__.return_value
+        productos.bulk_write.side_effect = ConnectionFailure('caído')
+
+        with mock.patch('provesi.mongodb_sync.get_mongo_db', return_value=db):
+            with self.assertRaises(ConnectionFailure):
+                drain_outbox()
+            self.assertEqual(SyncOutbox.objects.count(), 1)
+
+            productos.bulk_write.side_effect = None
+            self.assertEqual(drain_outbox(), 1)
+        self.assertFalse(SyncOutbox.objects.exists())
+
+    @override_settings(MONGODB_SYNC_WORKER={'max_intentos': 2})
+    def test_drain_aisla_y_descarta_entradas_defectuosas(self):
+        SyncOutbox.objects.create(entidad='producto', clave='MALO')
+        SyncOutbox.objects.create(entidad='producto', clave='OB-1')
+
+        def aplicar(db, cambios):
+            if ('producto', 'MALO') in cambios:
+                raise ValueError('documento inválido')
+            return len(cambios)
+
+        with mock.patch('provesi.mongodb_sync.get_mongo_db', return_value=mock.MagicMock()), \
+                mock.patch('provesi.outbox.apply_changes', side_effect=aplicar), \
+                mock.patch('provesi.sync_worker.apply_changes', side_effect=aplicar), \
+                self.assertLogs('provesi.outbox', 'WARNING'):
+            self.assertEqual(drain_outbox(), 2)
+            malo = SyncOutbox.objects.get()
+            self.assertEqual((malo.clave, malo.intentos, malo.ultimo_error), ('MALO', 1, 'documento inválido'))
+            self.assertGreater(malo.disponible_en, timezone.now())
+
+            SyncOutbox.objects.update(disponible_en=timezone.now())
+            self.assertEqual(drain_outbox(), 1)
+
+        self.assertFalse(SyncOutbox.objects.exists())
+        self.assertEqual(SyncDeadLetter.objects.get(clave='MALO').intentos, 2)
+
+    def test_drain_en_loop_sobrevive_a_errores_inesperados(self):
+        class Detener(Exception):
+            pass
+
+        salida = io.StringIO()
+        with mock.patch(
+            'provesi.management.commands.drain_mongo_outbox.drain_all', side_effect=[RuntimeError('pg reiniciado'), 2],
+        ) as drain_all, mock.patch(
+            'provesi.management.commands.drain_mongo_outbox.time.sleep', side_effect=[None, Detener],
+        ) as dormir, self.assertLogs('provesi.management.commands.drain_mongo_outbox', 'ERROR'):
+            with self.assertRaises(Detener):
+                call_command('drain_mongo_outbox', loop=True, interval=1, stdout=salida, stderr=io.StringIO())
+
+        self.assertEqual(drain_all.call_count, 2)
+        self.assertEqual([llamada.args[0] for llamada in dormir.call_args_list], [2, 1])
+        self.assertIn('2 entradas aplicadas', salida.getvalue())
+
+        with mock.patch('provesi.management.commands.drain_mongo_outbox.drain_all', side_effect=RuntimeError('x')):
+            with self.assertRaises(RuntimeError):
+                call_command('drain_mongo_outbox', stdout=io.StringIO())
+
+
+class BulkSyncTests(TestCase):
+    """La sincronización masiva recorre las claves por bloques y --since solo aplica a pedidos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Producto.objects.create(codigo='BS-1', nombre='Bulk', descripcion='Desc', precio=5)
+        cls.pedidos = [Pedido.objects.create() for _ in range(3)]
+        Pedido.objects.filter(id=cls.pedidos[0].id).update(
+            fecha_actualizacion=timezone.now() - timedelta(days=30),
+        )
+
+    def test_bloques_de_claves(self):
+        db = mock.MagicMock()
+        coleccion = db.__getitem__.return_value
+        avances = []
+
+        with mock.patch('provesi.bulk_sync.get_mongo_db', return_value=db):
+            resultado = sync_entidad_bulk('pedido', chunk_size=2, progress=lambda e, f, s: avances.append(f))
+
+        self.assertEqual(resultado['filas'], 3)
+        self.assertEqual(avances, [2, 3])
+        operaciones = [llamada.args[0] for llamada in coleccion.bulk_write.call_args_list]
+        self.assertEqual(
+            [[operacion._filter['postgres_id'] for operacion in bloque] for bloque in operaciones],
+            [[self.pedidos[0].id, self.pedidos[1].id], [self.pedidos[2].id]],
+        )
+
+    def test_since_filtra_pedidos_por_fecha_actualizacion(self):
+        desde = timezone.now() - timedelta(days=1)
+        self.assertEqual(list(get_queryset('pedido', since=desde)), [p.id for p in self.pedidos[1:]])
+        with self.assertRaises(ValueError):
+            get_queryset('producto', since=desde)
+
+    def test_comando_rechaza_since_para_productos_y_bodegas(self):
+        with mock.patch('provesi.management.commands.sync_to_mongo.test_connection', return_value=True):
+            with self.assertRaisesMessage(CommandError, 'producto'):
+                call_command(
+                    'sync_to_mongo', '--bulk', '--since', '2024-01-01', '--only', 'producto', stdout=io.StringIO(),
+                )
+
+
+class UnitOfWorkTests(TestCase):
+    """Las marcas de un scope se colapsan en una entrada de outbox por entidad."""
+
+    def setUp(self):
+        SyncOutbox.objects.all().delete()
+
+    def test_scope_colapsa_marcas_repetidas(self):
+        with unit_of_work.sync_scope() as uow:
+            unit_of_work.mark_dirty('producto', 'U1')
+            unit_of_work.mark_dirty('ubicacion', 3, payload={'delta_stock': 2})
+            with unit_of_work.sync_scope() as anidado:
+                self.assertIs(anidado, uow)
+                unit_of_work.mark_dirty('ubicacion', 3, payload={'delta_stock': -5})
+                unit_of_work.mark_dirty('producto', 'U1', 'delete')
+            self.assertFalse(SyncOutbox.objects.exists())
+
+        self.assertEqual(
+            sorted(SyncOutbox.objects.values_list('entidad', 'clave', 'operacion', 'payload')),
+            [('producto', 'U1', 'delete', {}), ('ubicacion', '3', 'upsert', {'delta_stock': -3, 'creada': False})],
+        )
+
+    def test_scope_con_excepcion_no_escribe(self):
+        with self.assertRaises(RuntimeError):
+            with unit_of_work.sync_scope():
+                unit_of_work.mark_dirty('producto', 'U1')
+                raise RuntimeError('fallo')
+        self.assertFalse(SyncOutbox.objects.exists())
+        self.assertIsNone(unit_of_work.current_unit_of_work())
+
+    def test_middleware_revierte_respuestas_5xx(self):
+        def vista(status):
+            def get_response(request):
+                Producto.objects.create(codigo=f'MW{status}', nombre='MW', descripcion='Desc', precio=1)
+                unit_of_work.mark_dirty('producto', f'MW{status}')
+                return HttpResponse(status=status)
+            return get_response
+
+        for status in (200, 500):
+            unit_of_work.SyncScopeMiddleware(vista(status))(RequestFactory().post('/'))
+
+        self.assertTrue(Producto.objects.filter(codigo='MW200').exists())
+        self.assertFalse(Producto.objects.filter(codigo='MW500').exists())
+        self.assertEqual(list(SyncOutbox.objects.values_list('clave', flat=True)), ['MW200'])
+
+
+class MongoIndexTests(SimpleTestCase):
+    """Los índices declarados se comparan con index_information() del servidor."""
+
+    def base_de_datos(self):
+        informacion = {
+            'pedidos': {
+                '_id_': {'key': [('_id', 1)]},
+                'postgres_id_unique': {'key': [('postgres_id', 1.0)], 'unique': True},
+                # Mismo nombre, orden distinto
+                'fecha_creacion_postgres_id': {'key': [('fecha_creacion', 1), ('postgres_id', 1)]},
+                'viejo': {'key': [('cliente', 1)]},
+            },
+            'productos': {'codigo_unique': {'key': [('codigo', 1)], 'unique': True}},
+            # Sin unique
+            'bodegas': {'codigo_unique': {'key': [('codigo', 1)]}},
+        }
+        colecciones = {}
+        for nombre, indices in informacion.items():
+            colecciones[nombre] = mock.MagicMock()
+            colecciones[nombre].index_information.return_value = indices
+        db = mock.MagicMock()
+        db.__getitem__.side_effect = colecciones.__getitem__
+        return db, colecciones
+
+    def test_check_drift(self):
+        db, _ = self.base_de_datos()
+        reporte = mongo_indexes.check_drift(db)
+
+        self.assertEqual(reporte['pedidos'], {
+            'faltantes': ['estado_fecha_creacion', 'metodo_pago_fecha_creacion'],
+            'distintos': ['fecha_creacion_postgres_id'],
+            'sobrantes': ['viejo'],
+        })
+        self.assertEqual(reporte['productos'], {'faltantes': [], 'distintos': [], 'sobrantes': []})
+        self.assertEqual(reporte['bodegas']['distintos'], ['codigo_unique'])
+
+    def test_ensure_indexes_solo_toca_lo_pedido(self):
+        db, colecciones = self.base_de_datos()
+        creados = mongo_indexes.ensure_indexes(db)
+        self.assertEqual(creados, ['pedidos.estado_fecha_creacion', 'pedidos.metodo_pago_fecha_creacion'])
+        colecciones['pedidos'].drop_index.assert_not_called()
+
+        db, colecciones = self.base_de_datos()
+        creados = mongo_indexes.ensure_indexes(db, fix=True, drop_extra=True)
+        self.assertEqual(
+            sorted(llamada.args[0] for llamada in colecciones['pedidos'].drop_index.call_args_list),
+            ['fecha_creacion_postgres_id', 'viejo'],
+        )
+        self.assertIn('pedidos.fecha_creacion_postgres_id', creados)
+        self.assertIn('bodegas.codigo_unique', creados)
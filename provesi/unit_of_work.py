@@ -0,0 +1,156 @@
+"""
+Colector de entidades modificadas durante una petición o transacción.
+
+Dentro de un sync_scope() los signals no escriben en el outbox en cada
+guardado: solo marcan la entidad como modificada. Al cerrar el scope, antes
+del commit, se escribe una única entrada de outbox por entidad distinta.
+Fuera de un scope, mark_dirty() escribe directamente en el outbox.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from .outbox import enqueue, merge_payload, notify_drainer
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+_stats_lock = threading.Lock()
+_stats = {
+    'marcas': 0,        # Llamadas a mark_dirty
+    'escrituras': 0,    # Entradas escritas en el outbox
+    'evitadas': 0,      # Marcas absorbidas por una entrada ya pendiente
+    'scopes': 0,        # Scopes cerrados con al menos una marca
+}
+
+
+def _contar(**incrementos):
+    with _stats_lock:
+        for key, valor in incrementos.items():
+            _stats[key] += valor
+
+
+def get_stats():
+    """Retorna una copia de los contadores del proceso."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    """Reinicia los contadores del proceso."""
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0
+
+
+class UnitOfWork:
+    """
+    Registro de entidades modificadas dentro de un scope.
+
+    Cada (entidad, clave) se guarda una sola vez; las marcas repetidas
+    actualizan la operación y combinan el payload.
+    """
+
+    def __init__(self):
+        self.pendientes = OrderedDict()
+        self.marcas = 0
+
+    def mark(self, entidad, clave, operacion='upsert', payload=None):
+        key = (entidad, str(clave))
+        self.marcas += 1
+        anterior = self.pendientes.get(key)
+        payload = payload or {}
+        if anterior is not None:
+            payload = merge_payload(entidad, anterior['payload'], payload)
+        self.pendientes[key] = {'operacion': operacion, 'payload': payload}
+
+    def flush(self):
+        """Escribe una entrada de outbox por entidad pendiente."""
+        from .models import SyncOutbox
+
+        if not self.pendientes:
+            return 0
+
+        SyncOutbox.objects.bulk_create([
+            SyncOutbox(entidad=entidad, clave=clave, operacion=cambio['operacion'], payload=cambio['payload'])
+            for (entidad, clave), cambio in self.pendientes.items()
+        ])
+        transaction.on_commit(notify_drainer)
+
+        escritas = len(self.pendientes)
+        _contar(escrituras=escritas, evitadas=self.marcas - escritas, scopes=1)
+        logger.debug(f"Unit of work: {self.marcas} marcas → {escritas} entradas de outbox")
+        self.pendientes.clear()
+        self.marcas = 0
+        return escritas
+
+
+def current_unit_of_work():
+    """Unit of work activa en el hilo actual, o None."""
+    return getattr(_local, 'uow', None)
+
+
+def mark_dirty(entidad, clave, operacion='upsert', payload=None):
+    """
+    Marca una entidad como pendiente de sincronizar.
+
+    Si hay un scope activo la marca se difiere hasta el cierre del scope;
+    si no, se escribe de inmediato en el outbox.
+    """
+    _contar(marcas=1)
+    uow = current_unit_of_work()
+    if uow is None:
+        _contar(escrituras=1)
+        enqueue(entidad, clave, operacion, payload)
+        return
+    uow.mark(entidad, clave, operacion, payload)
+
+
+@contextmanager
+def sync_scope():
+    """
+    Abre una transacción que agrupa las marcas de sincronización.
+
+    Las entradas de outbox se escriben dentro de la misma transacción, justo
+    antes del commit; si el bloque lanza una excepción no se escribe nada.
+    Los scopes anidados se unen al scope exterior.
+    """
+    if current_unit_of_work() is not None:
+        yield current_unit_of_work()
+        return
+
+    uow = UnitOfWork()
+    _local.uow = uow
+    try:
+        with transaction.atomic():
+            yield uow
+            if not transaction.get_rollback():
+                uow.flush()
+    finally:
+        _local.uow = None
+
+
+class SyncScopeMiddleware:
+    """
+    Envuelve cada petición que modifica datos en un sync_scope(), de modo que
+    cada entidad se sincroniza una sola vez por petición.
+    """
+
+    METODOS_SEGUROS = {'GET', 'HEAD', 'OPTIONS', 'TRACE'}
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method in self.METODOS_SEGUROS:
+            return self.get_response(request)
+        with sync_scope():
+            response = self.get_response(request)
+            if response.status_code >= 500:
+                # La excepción ya se convirtió en respuesta: revertir igual
+                transaction.set_rollback(True)
+            return response
@@ -27,6 +27,7 @@ urlpatterns = [
 
     # Health check endpoint
     path('health/', views.health_check, name='health'),
+    path('ready/', views.readiness_check, name='ready'),
 
     # Urls for manejador_pedidos app
     path('manejador_pedidos/', include('manejador_pedidos.urls')),
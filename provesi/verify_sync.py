@@ -0,0 +1,242 @@
+"""
+Detección y reparación de diferencias entre PostgreSQL y MongoDB.
+
+Cada documento se resume con content_hash(). Las claves de una entidad se
+recorren en orden y se parten en rangos de `bucket_size` claves; de cada
+rango se calcula un digest en ambos lados (el hash de sus pares clave/hash,
+en orden de clave). Es un árbol de Merkle de dos niveles: los rangos cuyo
+digest coincide se descartan sin más y solo en los que difieren se
+comparan los documentos uno a uno para encontrar los faltantes, los
+desactualizados y los huérfanos.
+
+Del lado de MongoDB se usa el content_hash guardado en cada documento al
+escribirlo, proyectando solo la clave y el hash; únicamente los documentos
+sin hash (las actualizaciones puntuales de ubicaciones lo eliminan) se leen
+completos y se hashean. Un documento editado en MongoDB por fuera de la
+sincronización conserva su hash anterior y no se detecta: con rehash=True
+se ignoran los hashes guardados y se hashean todos los documentos. Del lado
+de PostgreSQL los documentos de cada rango se construyen con un número fijo
+de consultas y se toma su content_hash.
+
+La memoria queda acotada por un rango: de cada documento solo se conserva
+su hash.
+"""
+import hashlib
+import logging
+import time
+
+from django.db import connections
+from django.db.models.functions import Collate
+from pymongo import ReplaceOne
+
+from .bulk_sync import COLECCIONES, ENTIDADES
+from .document_builders import content_hash, load_documents
+from .mongodb_sync import get_mongo_db
+
+logger = logging.getLogger(__name__)
+
+BUCKET_SIZE = 1000
+
+# Claves divergentes que se conservan por tipo para el reporte
+MAX_DETALLE = 50
+
+# Campo con la clave de PostgreSQL en cada colección
+CAMPOS_CLAVE = {
+    'pedido': 'postgres_id',
+    'producto': 'codigo',
+    'bodega': 'codigo',
+}
+
+# Collation binaria por motor, para que el orden de las claves de texto
+# coincida con el de MongoDB
+COLLATIONS_BINARIAS = {
+    'postgresql': 'C',
+    'sqlite': 'BINARY',
+    'mysql': 'utf8mb4_bin',
+}
+
+
+def _claves(entidad):
+    """Claves de una entidad en PostgreSQL, en el mismo orden que usa MongoDB."""
+    from manejador_inventario.models import Bodega, Producto
+    from manejador_pedidos.models import Pedido
+
+    if entidad == 'pedido':
+        return Pedido.objects.order_by('id').values_list('id', flat=True)
+
+    modelo = Producto if entidad == 'producto' else Bodega
+    collation = COLLATIONS_BINARIAS.get(connections[modelo.objects.db].vendor)
+    orden = Collate('codigo', collation) if collation else 'codigo'
+    return modelo.objects.order_by(orden).values_list('codigo', flat=True)
+
+
+def _rangos(entidad, bucket_size):
+    """
+    Rangos (desde, hasta, claves) con las claves de PostgreSQL de cada uno.
+
+    Cada rango cubre las claves > desde y <= hasta; el primero no tiene
+    límite inferior y el último no tiene límite superior, para que los
+    huérfanos de MongoDB fuera de las claves de PostgreSQL también caigan en
+    algún rango.
+    """
+    desde, claves = None, []
+    for clave in _claves(entidad).iterator(chunk_size=bucket_size):
+        claves.append(clave)
+        if len(claves) >= bucket_size:
+            yield desde, clave, claves
+            desde, claves = clave, []
+    yield desde, None, claves
+
+
+def _digest(hashes):
+    """Digest de un rango a partir de {clave: hash}, en orden de clave."""
+    digest = hashlib.blake2b(digest_size=16)
+    for clave in sorted(hashes):
+        digest.update(f'{clave}:{hashes[clave]};'.encode())
+    return digest.hexdigest()
+
+
+def _hashes_postgres(entidad, claves):
+    return {
+        str(clave): documento.get('content_hash') or content_hash(documento)
+        for clave, documento in load_documents(entidad, claves).items()
+    }
+
+
+def _hashes_mongo(coleccion, campo, desde, hasta, bucket_size, rehash=False):
+    """
+    {clave: hash} de los documentos de MongoDB en el rango. Se lee solo el
+    content_hash guardado; los documentos que no lo tienen (o todos, con
+    `rehash`) se leen completos.
+    """
+    rango = {}
+    if desde is not None:
+        rango['$gt'] = desde
+    if hasta is not None:
+        rango['$lte'] = hasta
+    filtro = {campo: rango} if rango else {}
+    if rehash:
+        cursor = coleccion.find(filtro, {'_id': 0}).batch_size(bucket_size)
+        return {str(documento[campo]): content_hash(documento) for documento in cursor}
+
+    hashes, sin_hash = {}, []
+    for documento in coleccion.find(filtro, {'_id': 0, campo: 1, 'content_hash': 1}).batch_size(bucket_size):
+        if documento.get('content_hash'):
+            hashes[str(documento[campo])] = documento['content_hash']
+        else:
+            sin_hash.append(documento[campo])
+
+    for inicio in range(0, len(sin_hash), bucket_size):
+        bloque = sin_hash[inicio:inicio + bucket_size]
+        for documento in coleccion.find({campo: {'$in': bloque}}, {'_id': 0}):
+            hashes[str(documento[campo])] = content_hash(documento)
+    return hashes
+
+
+def diff_hashes(postgres, mongo):
+    """
+    Compara dos diccionarios {clave: hash}.
+    Retorna (faltantes, desactualizados, huerfanos) como listas de claves ordenadas.
+    """
+    faltantes = sorted(clave for clave in postgres if clave not in mongo)
+    desactualizados = sorted(clave for clave in postgres if clave in mongo and mongo[clave] != postgres[clave])
+    huerfanos = sorted(clave for clave in mongo if clave not in postgres)
+    return faltantes, desactualizados, huerfanos
+
+
+def _clave_postgres(entidad, clave):
+    return int(clave) if entidad == 'pedido' else clave
+
+
+def _reparar(entidad, coleccion, campo, a_sincronizar, huerfanos):
+    """
+    Reemplaza los documentos faltantes o desactualizados y elimina los
+    huérfanos. Se reemplaza el documento completo (no $set) para que
+    desaparezcan también los campos que ya no existen. Retorna (escritos, eliminados).
+    """
+    escritos = eliminados = 0
+    if a_sincronizar:
+        documentos = load_documents(entidad, [_clave_postgres(entidad, clave) for clave in a_sincronizar])
+        operaciones = [
+            ReplaceOne({campo: documento[campo]}, documento, upsert=True)
+            for documento in documentos.values()
+        ]
+        if operaciones:
+            coleccion.bulk_write(operaciones, ordered=False)
+        escritos = len(operaciones)
+
+    if huerfanos:
+        claves = [_clave_postgres(entidad, clave) for clave in huerfanos]
+        # Una fila creada durante la verificación no es huérfana: se vuelve
+        # a consultar antes de borrar
+        existentes = {str(clave) for clave in load_documents(entidad, claves)}
+        claves = [clave for clave in claves if str(clave) not in existentes]
+        if claves:
+            eliminados = coleccion.delete_many({campo: {'$in': claves}}).deleted_count
+    return escritos, eliminados
+
+
+def verify_entidad(entidad, bucket_size=BUCKET_SIZE, repair=False, progress=None, rehash=False):
+    """
+    Compara una entidad entre PostgreSQL y MongoDB y, con repair=True,
+    corrige solo los documentos que difieren. Con rehash=True no se confía
+    en el content_hash guardado en MongoDB.
+
+    `progress` es un callable opcional que recibe (entidad, rangos, documentos)
+    después de cada rango.
+    Retorna un diccionario con las estadísticas y, en 'detalle', hasta
+    MAX_DETALLE claves de cada tipo de diferencia.
+    """
+    if entidad not in ENTIDADES:
+        raise ValueError(f"Entidad desconocida: {entidad}")
+    db = get_mongo_db()
+    if db is None:
+        raise RuntimeError("MongoDB no disponible")
+
+    coleccion = db[COLECCIONES[entidad]]
+    campo = CAMPOS_CLAVE[entidad]
+    resultado = {
+        'entidad': entidad,
+        'documentos': 0,
+        'rangos': 0,
+        'rangos_distintos': 0,
+        'faltantes': 0,
+        'desactualizados': 0,
+        'huerfanos': 0,
+        'escritos': 0,
+        'eliminados': 0,
+        'detalle': {'faltantes': [], 'desactualizados': [], 'huerfanos': []},
+    }
+    inicio = time.monotonic()
+
+    for desde, hasta, claves in _rangos(entidad, bucket_size):
+        postgres = _hashes_postgres(entidad, claves)
+        mongo = _hashes_mongo(coleccion, campo, desde, hasta, bucket_size, rehash)
+        resultado['rangos'] += 1
+        resultado['documentos'] += len(postgres)
+
+        if _digest(postgres) != _digest(mongo):
+            resultado['rangos_distintos'] += 1
+            faltantes, desactualizados, huerfanos = diff_hashes(postgres, mongo)
+            for tipo, claves_tipo in (
+                ('faltantes', faltantes), ('desactualizados', desactualizados), ('huerfanos', huerfanos),
+            ):
+                resultado[tipo] += len(claves_tipo)
+                detalle = resultado['detalle'][tipo]
+                detalle.extend(claves_tipo[:MAX_DETALLE - len(detalle)])
+            if repair:
+                escritos, eliminados = _reparar(entidad, coleccion, campo, faltantes + desactualizados, huerfanos)
+                resultado['escritos'] += escritos
+                resultado['eliminados'] += eliminados
+
+        if progress:
+            progress(entidad, resultado['rangos'], resultado['documentos'])
+
+    resultado['segundos'] = time.monotonic() - inicio
+    divergentes = resultado['faltantes'] + resultado['desactualizados'] + resultado['huerfanos']
+    if divergentes:
+        logger.warning(
+            f"⚠️ {entidad}: {divergentes} documentos divergentes en "
+            f"{resultado['rangos_distintos']}/{resultado['rangos']} rangos"
+        )
+    return resultado
@@ -23,6 +23,18 @@ def health_check(request):
     """
     return JsonResponse({'message': 'OK'}, status=200)
 
+def readiness_check(request):
+    """
+    Endpoint de readiness para los health checks activos de Kong.
+
+    Responde con la última revisión de dependencias hecha en segundo plano
+    (ver provesi/readiness.py): 200 si el proceso está listo, 503 si no.
+    """
+    from .readiness import readiness
+
+    estado = readiness()
+    return JsonResponse(estado, status=200 if estado['listo'] else 503)
+
 def logout(request):
     """
     Cierra sesión local y en Auth0, redirigiendo al home.